@@ -0,0 +1,126 @@
+"""
+Allocations and time per received frame in the decode path of the stick.
+
+"before" is the decoding of v1.5.3 (one IMSTMessage with bytes slices per frame),
+"after" the IMSTFrame view on the receive buffer. Counted are the memory blocks,
+that are still allocated for every decoded frame.
+
+    python benchmarks/allocations.py
+"""
+import asyncio
+import gc
+import sys
+import time
+
+from loguru import logger
+
+from pywirelessmbus.sticks.im871a import FrameAssembler, MessageProtocol
+from pywirelessmbus.utils import IMSTMessage
+from pywirelessmbus.utils.crc import crc16
+
+FRAMES = 100_000
+
+# length byte and wireless M-Bus telegram of a Weptech Munia
+TELEGRAM = bytes.fromhex(
+    "2e44b05c74720000021b7abf0000002f2f0a6639020afb1a000502fd971d0000"
+    "2f2f2f2f2f2f2f2f2f2f2f2f2f2f2f"
+)
+
+
+def build_frame(with_crc: bool) -> bytes:
+    control_field = 0x62 | (0x80 if with_crc else 0)
+    frame = bytes([0xA5, control_field, 0x03]) + TELEGRAM
+    frame += b"\x01\x02\x03\x04\xc8"
+    if with_crc:
+        frame += crc16(frame[1:]).to_bytes(2, "little")
+    return frame
+
+
+def decode_before(data: bytes) -> IMSTMessage:
+    logger.debug("Receive new message: {}", data.hex())
+    control_field = data[1] >> 4
+    message = IMSTMessage(
+        endpoint_id=data[1] & 0xF,
+        message_id=data[2:3],
+        payload_length=int(data[3]),
+        with_timestamp_field=control_field & 0x2 > 0,
+        with_rssi_field=control_field & 0x4 > 0,
+        with_crc_field=control_field & 0x8 > 0,
+    )
+    message.payload = data[3 : 4 + int(message.payload_length)]
+
+    logger.debug("Receive raw message: {}", data.hex())
+    logger.debug("Endpoint ID: {}", message.endpoint_id)
+    logger.debug("Message ID: {}", message.message_id)
+    logger.debug("Payload Length: {}", message.payload_length)
+    logger.debug("Payload: {}", message.payload.hex())
+
+    if message.with_crc_field:
+        message.crc = data[-2:]
+        logger.debug("CRC: {}", message.crc)
+
+    if message.with_rssi_field:
+        message.rssi = data[
+            4 + message.payload_length + message.with_timestamp_field * 4
+        ]
+        logger.debug("RSSI: {}", message.rssi)
+
+    if message.with_timestamp_field:
+        message.timestamp = data[
+            4 + message.payload_length : 4 + message.payload_length + 4
+        ]
+        logger.debug("Timestamp: {}", message.timestamp)
+
+    return message
+
+
+def run_before(chunks):
+    messages = []
+    for chunk in chunks:
+        messages.append(decode_before(chunk))
+    return messages
+
+
+def run_after(chunks, verify_crc: bool):
+    messages = []
+    protocol = MessageProtocol(on_message=messages.append, verify_crc=verify_crc)
+    protocol.assembler = FrameAssembler()
+    for chunk in chunks:
+        for frame in protocol.assembler.feed(chunk):
+            protocol.decode_message(frame)
+    return messages
+
+
+def measure(name: str, run, *args):
+    gc.collect()
+    gc.disable()
+    blocks = sys.getallocatedblocks()
+    start = time.perf_counter()
+    messages = run(*args)
+    duration = time.perf_counter() - start
+    blocks = sys.getallocatedblocks() - blocks
+    gc.enable()
+
+    assert len(messages) == FRAMES
+    print(
+        f"{name:<24} {blocks / FRAMES:>6.2f} blocks/frame "
+        f"{duration / FRAMES * 1e9:>8.0f} ns/frame"
+    )
+
+
+def main():
+    logger.disable("pywirelessmbus")
+    logger.disable("__main__")
+    # pyserial hands every read over as new bytes object, in both variants
+    plain = [build_frame(False) for _ in range(FRAMES)]
+    with_crc = [build_frame(True) for _ in range(FRAMES)]
+
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    measure("before", run_before, plain)
+    measure("after", run_after, plain, False)
+    measure("before (crc field)", run_before, with_crc)
+    measure("after (crc verified)", run_after, with_crc, True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Cost of the CRC check per received frame.
+
+Compares the binascii based implementation of the package with a classic
+table driven implementation in pure python.
+
+    python benchmarks/crc.py
+"""
+from timeit import repeat
+
+from pywirelessmbus.utils.crc import check_crc16, crc16
+
+ROUNDS = 100_000
+
+TABLE = []
+for byte in range(256):
+    crc = byte
+    for _ in range(8):
+        crc = (crc >> 1) ^ 0x8408 if crc & 1 else crc >> 1
+    TABLE.append(crc)
+
+
+def crc16_table(data: bytes) -> int:
+    crc = 0xFFFF
+    for byte in data:
+        crc = (crc >> 8) ^ TABLE[(crc ^ byte) & 0xFF]
+    return crc ^ 0xFFFF
+
+
+def build_frame(payload_length: int) -> bytes:
+    frame = b"\xa5\xe2\x03" + bytes([payload_length]) + bytes(range(payload_length))
+    frame += b"\x01\x02\x03\x04\xc8"
+    return frame + crc16(frame[1:]).to_bytes(2, "little")
+
+
+def measure(statement, frame: bytes) -> float:
+    best = min(repeat(lambda: statement(frame), number=ROUNDS, repeat=5))
+    return best / ROUNDS * 1e9
+
+
+def main():
+    assert crc16_table(b"123456789") == crc16(b"123456789")
+
+    print(f"{'payload':>8} {'binascii':>12} {'table':>12}")
+    for payload_length in (16, 46, 128, 255):
+        frame = build_frame(payload_length)
+        fast = measure(lambda f: check_crc16(f[1:-2], f[-2:]), frame)
+        table = measure(
+            lambda f: crc16_table(f[1:-2]) == int.from_bytes(f[-2:], "little"), frame
+        )
+        print(f"{payload_length:>8} {fast:>9.0f} ns {table:>9.0f} ns")
+
+
+if __name__ == "__main__":
+    main()
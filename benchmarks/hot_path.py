@@ -0,0 +1,252 @@
+"""
+Benchmark suite for the receive path, from the HCI frame to the decoded values.
+
+Every benchmark runs over a corpus of telegrams of the simulated meters of the
+emulator. Reported are the time per operation and the bytes an operation
+allocates, measured with tracemalloc as the peak of the traced memory during the
+operation. The results are written as JSON, to compare versions:
+
+    python benchmarks/hot_path.py --output after.json
+    python benchmarks/hot_path.py --compare before.json
+    python benchmarks/hot_path.py --filter process_radio_message
+
+The package disables its logger, like in most applications. --log-level enables
+it with a sink, that drops the records, to measure the costs of the logging.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+from loguru import logger
+
+import pywirelessmbus
+from pywirelessmbus import WMbus
+from pywirelessmbus.devices import EnergyCam, WeptechOMSv1, WeptechOMSv2
+from pywirelessmbus.sticks import MockStick
+from pywirelessmbus.sticks.emulator import (
+    EnergyCamMeter,
+    GenericMeter,
+    SimulatedMeter,
+    WeptechMeter,
+)
+from pywirelessmbus.sticks.im871a import MessageProtocol
+from pywirelessmbus.utils import IMSTFrame, WMbusMessage
+from pywirelessmbus.utils.crc import crc16
+from pywirelessmbus.utils.data_records import decode_data_records
+
+CORPUS_SIZE = 1000
+# telegrams of one meter type come from this many different meters
+METERS = 50
+
+Benchmark = Tuple[Callable[[Any], Any], Sequence[Any]]
+
+
+def frame(telegram: bytes, with_crc: bool = True) -> bytes:
+    """
+    Radio message of the stick with timestamp, RSSI and optional CRC field.
+    """
+    control_field = 0x62 | (0x80 if with_crc else 0)
+    data = bytes([0xA5, control_field, 0x03]) + telegram + b"\x01\x02\x03\x04\xc8"
+    if with_crc:
+        data += crc16(data[1:]).to_bytes(2, "little")
+    return data
+
+
+def corpus(create_meter: Callable[[int], SimulatedMeter]) -> List[bytes]:
+    meters = [create_meter(10000000 + index) for index in range(METERS)]
+    return [meters[index % METERS].telegram() for index in range(CORPUS_SIZE)]
+
+
+def messages(telegrams: Sequence[bytes]) -> List[IMSTFrame]:
+    return [IMSTFrame(frame(telegram)) for telegram in telegrams]
+
+
+CORPORA = {
+    "weptech_v1": lambda: corpus(lambda address: WeptechMeter(address, version=1)),
+    "weptech_v2": lambda: corpus(lambda address: WeptechMeter(address, version=2)),
+    "energy_cam": lambda: corpus(lambda address: EnergyCamMeter(address)),
+    "generic": lambda: corpus(GenericMeter),
+}
+
+
+def bench_decode_message() -> Benchmark:
+    protocol = MessageProtocol()
+    frames = [memoryview(frame(telegram)) for telegram in CORPORA["weptech_v2"]()]
+    return protocol.decode_message, frames
+
+
+def bench_wmbus_message() -> Benchmark:
+    return WMbusMessage, messages(CORPORA["weptech_v2"]())
+
+
+def bench_process_radio_message(corpus_name: str) -> Callable[[], Benchmark]:
+    def setup() -> Benchmark:
+        wmbus = WMbus("IM871A_USB", stick=MockStick())
+        radio_messages = messages(CORPORA[corpus_name]())
+        # measure the steady state, with all devices registered
+        for message in radio_messages[:METERS]:
+            wmbus.process_radio_message(message)
+        return wmbus.process_radio_message, radio_messages
+
+    return setup
+
+
+def bench_decode_value_block() -> Benchmark:
+    blocks = [telegram[19:21] for telegram in CORPORA["weptech_v2"]()]
+    return WeptechOMSv1.decode_value_block, blocks
+
+
+def bench_weptech_process_new_message() -> Benchmark:
+    device = WeptechOMSv2(device_id="b05c10000000021b", index=0)
+    radio_messages = messages(CORPORA["weptech_v2"]())
+    return (
+        lambda message: device.process_new_message(WMbusMessage(message)),
+        radio_messages,
+    )
+
+
+def bench_energy_cam_process_new_message() -> Benchmark:
+    device = EnergyCam(meter_type=2, device_id="c41810000000010c", index=0)
+    radio_messages = messages(CORPORA["energy_cam"]())
+    return (
+        lambda message: device.process_new_message(WMbusMessage(message)),
+        radio_messages,
+    )
+
+
+def bench_decode_data_records() -> Benchmark:
+    return (
+        lambda telegram: decode_data_records(telegram, 0.0, 15),
+        CORPORA["generic"](),
+    )
+
+
+BENCHMARKS: Dict[str, Callable[[], Benchmark]] = {
+    "MessageProtocol.decode_message": bench_decode_message,
+    "WMbusMessage.__init__": bench_wmbus_message,
+    "WMbus.process_radio_message[weptech_v1]": bench_process_radio_message(
+        "weptech_v1"
+    ),
+    "WMbus.process_radio_message[weptech_v2]": bench_process_radio_message(
+        "weptech_v2"
+    ),
+    "WMbus.process_radio_message[energy_cam]": bench_process_radio_message(
+        "energy_cam"
+    ),
+    "WMbus.process_radio_message[generic]": bench_process_radio_message("generic"),
+    "WeptechOMS.decode_value_block": bench_decode_value_block,
+    "WeptechOMSv2.process_new_message": bench_weptech_process_new_message,
+    "EnergyCam.process_new_message": bench_energy_cam_process_new_message,
+    "decode_data_records": bench_decode_data_records,
+}
+
+
+def measure(setup: Callable[[], Benchmark], ops: int, repeat: int) -> Dict[str, Any]:
+    operation, inputs = setup()
+    rounds = max(ops // len(inputs), 1)
+    count = rounds * len(inputs)
+
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        start = time.perf_counter_ns()
+        for _ in range(rounds):
+            for data in inputs:
+                operation(data)
+        timings.append(time.perf_counter_ns() - start)
+        gc.enable()
+
+    # clear_traces() resets the peak, so every operation is measured on its own
+    allocated = 0
+    gc.collect()
+    gc.disable()
+    tracemalloc.start()
+    for data in inputs:
+        tracemalloc.clear_traces()
+        operation(data)
+        allocated += tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    gc.enable()
+
+    return {
+        "ns_per_op": min(timings) / count,
+        "ops": count,
+        "repeat": repeat,
+        "allocated_bytes_per_op": allocated / len(inputs),
+    }
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline_path: str):
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)["results"]
+
+    print(f"{'benchmark':<44} {'before':>10} {'after':>10} {'change':>8}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]["ns_per_op"]
+        after = result["ns_per_op"]
+        print(
+            f"{name:<44} {before:>8.0f}ns {after:>8.0f}ns "
+            f"{(after - before) / before * 100:>+7.1f}%"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--ops", type=int, default=50_000, help="operations per run")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per benchmark")
+    parser.add_argument("--filter", default="", help="run matching benchmarks")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results to compare with")
+    parser.add_argument("--log-level", help="enable the logger on this level")
+    arguments = parser.parse_args()
+
+    if arguments.log_level:
+        logger.remove()
+        logger.add(lambda record: None, level=arguments.log_level)
+        logger.enable("pywirelessmbus")
+
+    asyncio.set_event_loop(asyncio.new_event_loop())
+
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if arguments.filter not in name:
+            continue
+        results[name] = measure(setup, arguments.ops, arguments.repeat)
+        print(
+            f"{name:<44} {results[name]['ns_per_op']:>8.0f} ns/op "
+            f"{results[name]['allocated_bytes_per_op']:>8.0f} B/op",
+            file=sys.stderr,
+        )
+
+    report = {
+        "version": pywirelessmbus.__version__,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "log_level": arguments.log_level,
+        "created_at": time.time(),
+        "results": results,
+    }
+
+    if arguments.output:
+        with open(arguments.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if arguments.compare:
+        compare(results, arguments.compare)
+
+
+if __name__ == "__main__":
+    main()
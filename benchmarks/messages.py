@@ -0,0 +1,124 @@
+"""
+Memory and construction time of WMbusMessage and Value.
+
+"before" are the eager classes of v1.5.3 (every link layer field decoded into
+an attribute, Value as dataclass with __dict__), "after" the slotted classes
+with lazy fields. Every telegram gets one value, like from a Weptech driver,
+and all messages are kept alive.
+
+    python benchmarks/messages.py [count]
+"""
+import gc
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+
+from pywirelessmbus.utils import IMSTFrame
+from pywirelessmbus.utils.message import ValueType, WMbusMessage
+
+COUNT = 1_000_000
+
+TELEGRAM = bytes.fromhex(
+    "2e44b05c74720000021b7abf0000002f2f0a6639020afb1a000502fd971d0000"
+    "2f2f2f2f2f2f2f2f2f2f2f2f2f2f2f"
+)
+
+
+@dataclass
+class EagerValue:
+    value: float
+    unit: str
+    timestamp: float
+    type: ValueType
+
+
+class EagerWMbusMessage:
+    def __init__(self, raw_message):
+        self.raw = raw_message.payload
+        self.length = raw_message.payload[0]
+        self.command = raw_message.payload[1:2]
+        self.manufacturer_id = raw_message.payload[2:4]
+        self.serial_number = raw_message.payload[3:8]
+        self.version = raw_message.payload[8:9]
+        self.device_type = raw_message.payload[9:10]
+        self.control_field = raw_message.payload[10:11]
+        self.access_number = raw_message.payload[11]
+        self.status = raw_message.payload[12]
+        self.configuration_word = raw_message.payload[13:14]
+        self.values = []
+
+    def add_value(self, value, timestamp=None, unit="unset", value_type=None):
+        if timestamp is None:
+            timestamp = time.time()
+        self.values.append(
+            EagerValue(value=value, unit=unit, timestamp=timestamp, type=value_type)
+        )
+
+
+class BytesPayload:
+    """Radio message like the IMSTMessage of v1.5.3, with the payload as bytes."""
+
+    __slots__ = ("payload",)
+
+    def __init__(self, payload: bytes):
+        self.payload = payload
+
+
+def synthetic_telegrams(count: int):
+    # every telegram has its own serial number and access number
+    for number in range(count):
+        yield TELEGRAM[:4] + number.to_bytes(4, "little") + TELEGRAM[8:11] + bytes(
+            [number & 0xFF]
+        ) + TELEGRAM[12:]
+
+
+def build(message_class, radio_messages):
+    messages = []
+    for radio_message in radio_messages:
+        message = message_class(radio_message)
+        message.add_value(23.9, unit="°C", value_type=ValueType.TEMPERATURE)
+        messages.append(message)
+    return messages
+
+
+def measure(name: str, message_class, radio_messages):
+    count = len(radio_messages)
+
+    gc.collect()
+    start = time.perf_counter()
+    messages = build(message_class, radio_messages)
+    duration = time.perf_counter() - start
+    del messages
+
+    # second run for the memory, tracing slows down the construction
+    gc.collect()
+    tracemalloc.start()
+    messages = build(message_class, radio_messages)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del messages
+
+    print(
+        f"{name:<20} {memory / count:>7.1f} bytes/telegram "
+        f"{duration / count * 1e9:>7.0f} ns/telegram "
+        f"(total {memory / 2 ** 20:.0f} MiB)"
+    )
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else COUNT
+    telegrams = list(synthetic_telegrams(count))
+
+    # payload as bytes (v1.5.3) and as view on the frame (IMSTFrame)
+    bytes_payloads = [BytesPayload(telegram) for telegram in telegrams]
+    frames = [IMSTFrame(b"\xa5\x02\x03" + telegram) for telegram in telegrams]
+
+    print(f"{count} telegrams")
+    measure("before", EagerWMbusMessage, bytes_payloads)
+    measure("after", WMbusMessage, bytes_payloads)
+    measure("after (frame view)", WMbusMessage, frames)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+from pywirelessmbus import WMbus
+import asyncio
+import os
+from loguru import logger
+
+logger.enable("pywirelessmbus")
+
+ports = (os.getenv("SERIAL_PORTS") or "/dev/ttyUSB0,/dev/ttyUSB1").split(",")
+
+
+async def main():
+    # one device registry for all sticks, duplicates keep the best RSSI
+    wmbus = WMbus("IM871A_USB", paths=ports)
+    await wmbus.start()
+
+    for stick, link_mode in zip(wmbus.sticks, ["T1", "S1", "C1, Telegram Format A"]):
+        stick.link_mode = link_mode
+        stick.auto_rssi_attachment = True
+
+    while wmbus.running:
+        await asyncio.sleep(10)
+        logger.info("Dropped duplicates: {}", wmbus.duplicates)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
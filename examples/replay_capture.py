@@ -0,0 +1,35 @@
+from pywirelessmbus import WMbus
+import asyncio
+import sys
+import time
+from loguru import logger
+
+logger.enable("pywirelessmbus")
+
+# record a capture with IM871A_USB(..., capture=CaptureWriter("stick.cap"))
+capture_path = sys.argv[1] if len(sys.argv) > 1 else "stick.cap"
+speed = float(sys.argv[2]) if len(sys.argv) > 2 else 0
+
+
+async def main():
+    messages = 0
+
+    def count_message(device, message):
+        nonlocal messages
+        messages += 1
+
+    wmbus = WMbus("IM871A_USB", on_radio_message=count_message)
+    started_at = time.perf_counter()
+    await wmbus.replay(capture_path, speed=speed)
+
+    duration = time.perf_counter() - started_at
+    logger.info(
+        "Processed {} messages of {} devices in {:.2f} s.",
+        messages,
+        len(wmbus.devices),
+        duration,
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -12,7 +12,7 @@ async def main():
     wmbus = WMbus("IM871A_USB", path=port)
 
     await wmbus.start()
-    wmbus.stick.reset()
+    await wmbus.stick.reset()
 
     while wmbus.running:
         await asyncio.sleep(1)
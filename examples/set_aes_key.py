@@ -1,5 +1,4 @@
 from pywirelessmbus import WMbus
-from time import sleep
 import asyncio
 from pywirelessmbus.devices import Device
 import os
@@ -14,12 +13,15 @@ async def main():
     wmbus = WMbus("IM871A_USB", path=port)
     target_device = "b05c74720000021b"
 
+    async def set_key(device: Device):
+        success = await device.set_aes_key(
+            key=b"\x00\x01\x02\x03\x04\x05\x06\x07\x08\x09\x0A\x0B\x0C\x0D\x0E\x0F"
+        )
+        logger.info("Stored key for {}: {}", device.id, success)
+
     def handle_new_device(device: Device):
         if device.id == target_device:
-            sleep(1)
-            device.set_aes_key(
-                key=b"\x00\x01\x02\x03\x04\x05\x06\x07\x08\x09\x0A\x0B\x0C\x0D\x0E\x0F"
-            )
+            asyncio.ensure_future(set_key(device))
 
     wmbus.on_device_registration = handle_new_device
     await wmbus.start()
@@ -0,0 +1,29 @@
+from pywirelessmbus import WMbus
+import asyncio
+import os
+from loguru import logger
+
+logger.enable("pywirelessmbus")
+
+port = os.getenv("SERIAL_PORT") or "/dev/ttyUSB0"
+
+
+async def main():
+    wmbus = WMbus("IM871A_USB", path=port)
+    await wmbus.start()
+
+    # requests can be sent without waiting, the responses are matched in order
+    ping, infos, config = await asyncio.gather(
+        wmbus.stick.ping(),
+        wmbus.stick.get_device_infos(),
+        wmbus.stick.get_device_configuration(),
+    )
+    logger.info("Ping: {}", ping)
+    logger.info("Device infos: {}", infos)
+    logger.info("Configuration: {}", config)
+
+    wmbus.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,22 @@
+from pywirelessmbus import OverflowPolicy, WMbus
+import asyncio
+import os
+from loguru import logger
+
+logger.enable("pywirelessmbus")
+
+port = os.getenv("SERIAL_PORT") or "/dev/ttyUSB0"
+
+
+async def main():
+    wmbus = WMbus("IM871A_USB", path=port)
+    await wmbus.start()
+
+    stream = wmbus.messages(maxsize=256, policy=OverflowPolicy.LATEST_PER_DEVICE)
+    async for device, message in stream:
+        logger.info("Message from {}: {}", device.id, message.values)
+        logger.info("Stream: {}", stream.stats())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,10 +1,32 @@
 from loguru import logger
 
-from pywirelessmbus.utils.message import IMSTMessage, ValueType, WMbusMessage
+from pywirelessmbus.devices.store import DeviceStore
+from pywirelessmbus.utils.aes import KeyStore
+from pywirelessmbus.utils.dedup import DedupCache
+from pywirelessmbus.utils.dispatch import DispatchMode
+from pywirelessmbus.utils.message import (
+    IMSTFrame,
+    IMSTMessage,
+    ValueType,
+    WMbusMessage,
+)
+from pywirelessmbus.utils.stream import MessageStream, OverflowPolicy
 from pywirelessmbus.wmbus import WMbus
 
 # disable logger on default because this is a lib
 logger.disable(__name__)
 
 __version__ = "1.5.3"
-__all__ = ["WMbus", "ValueType", "WMbusMessage", "IMSTMessage"]
+__all__ = [
+    "WMbus",
+    "ValueType",
+    "WMbusMessage",
+    "IMSTMessage",
+    "IMSTFrame",
+    "MessageStream",
+    "OverflowPolicy",
+    "DedupCache",
+    "KeyStore",
+    "DeviceStore",
+    "DispatchMode",
+]
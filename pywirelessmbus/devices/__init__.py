@@ -1,6 +1,37 @@
 from pywirelessmbus.devices.device import Device
-from pywirelessmbus.devices.energy_cam import EnergyCam
-from pywirelessmbus.devices.mock_device import MockDevice
-from pywirelessmbus.devices.weptech_oms import WeptechOMSv1, WeptechOMSv2
+from pywirelessmbus.devices.registry import (
+    DriverRegistry,
+    import_driver,
+    register_driver,
+)
+from pywirelessmbus.devices.store import DeviceStore
 
-__all__ = ["Device", "WeptechOMSv1", "WeptechOMSv2", "MockDevice", "EnergyCam"]
+# the built-in drivers are imported on first use, like the drivers of the registry
+_DRIVERS = {
+    "WeptechOMSv1": "pywirelessmbus.devices.weptech_oms:WeptechOMSv1",
+    "WeptechOMSv2": "pywirelessmbus.devices.weptech_oms:WeptechOMSv2",
+    "MockDevice": "pywirelessmbus.devices.mock_device:MockDevice",
+    "EnergyCam": "pywirelessmbus.devices.energy_cam:EnergyCam",
+    "GenericOMS": "pywirelessmbus.devices.generic:GenericOMS",
+}
+
+
+def __getattr__(name: str):
+    try:
+        path = _DRIVERS[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return import_driver(path)
+
+
+__all__ = [
+    "Device",
+    "WeptechOMSv1",
+    "WeptechOMSv2",
+    "MockDevice",
+    "EnergyCam",
+    "GenericOMS",
+    "DriverRegistry",
+    "register_driver",
+    "DeviceStore",
+]
@@ -1,12 +1,13 @@
 from abc import ABC, abstractmethod
-from typing import Any, Callable, Optional
+from typing import Any, Callable, Dict, List, Optional
 
 from pywirelessmbus.utils import WMbusMessage
+from pywirelessmbus.utils.message import Value
 from pywirelessmbus.utils.utils import NOOP
 
 
 class Device(ABC):
-    on_set_aes_key: Callable[[int, str, bytes], None]
+    on_set_aes_key: Callable[[int, str, bytes], Any]
 
     def __init__(
         self,
@@ -21,10 +22,29 @@ class Device(ABC):
         self.on_set_aes_key = on_set_aes_key
         self.label = label
         self.ctx = ctx
+        self.last_values: List[Value] = []
+
+    @classmethod
+    def from_message(cls, device_id: str, message: WMbusMessage, **kwargs) -> "Device":
+        """
+        Create the device for the first message, drivers can read their
+        configuration from the message.
+        """
+        return cls(device_id=device_id, **kwargs)
+
+    def driver_arguments(self) -> Dict[str, Any]:
+        """
+        Arguments of the driver besides the common ones, to create the device again.
+        """
+        return {}
 
     @abstractmethod
     def process_new_message(self, message: WMbusMessage) -> WMbusMessage:
         pass
 
-    def set_aes_key(self, key: bytes):
-        self.on_set_aes_key(self.index, self.id, key)
+    def set_aes_key(self, key: bytes) -> Any:
+        """
+        Store the key on the stick. Returns the result of the stick, for the
+        IM871A_USB a future that resolves with the status of the operation.
+        """
+        return self.on_set_aes_key(self.index, self.id, key)
@@ -3,6 +3,7 @@ from typing import Optional, Tuple
 from loguru import logger
 
 from pywirelessmbus.devices import Device
+from pywirelessmbus.utils.log import lazy_logger
 from pywirelessmbus.utils.message import ValueType, WMbusMessage
 
 METER_TYPE = {
@@ -25,6 +26,13 @@ class EnergyCam(Device):
 
         super().__init__(*args, **kwargs)
 
+    @classmethod
+    def from_message(cls, device_id: str, message: WMbusMessage, **kwargs):
+        return cls(device_id=device_id, meter_type=message.raw[9], **kwargs)
+
+    def driver_arguments(self):
+        return {"meter_type": self.meter_type}
+
     def process_new_message(self, message: WMbusMessage) -> WMbusMessage:
         offset = 0
 
@@ -33,11 +41,11 @@ class EnergyCam(Device):
             METER_TYPE[self.meter_type],
             self.id,
         )
-        logger.debug("Raw Message: {}", message.raw.hex())
+        lazy_logger.debug("Raw Message: {}", lambda: message.raw.hex())
 
         decryption_check = message.raw[15:17]
         if decryption_check != b"\x2f\x2f":
-            logger.debug("Decrytpion check: {}", decryption_check.hex())
+            lazy_logger.debug("Decrytpion check: {}", lambda: decryption_check.hex())
             logger.error(
                 "Receive a encrypted message. You should deactivate the encryption or set the AES Key for the device."
             )
@@ -45,7 +53,7 @@ class EnergyCam(Device):
 
         # Analyse DIF
         dif = message.raw[17:18]
-        logger.debug("DIF: {}", dif.hex())
+        lazy_logger.debug("DIF: {}", lambda: dif.hex())
         extension, error_state = self.analyse_dif(dif)
 
         if error_state:
@@ -59,7 +67,7 @@ class EnergyCam(Device):
 
         # Analyse VIF
         vif = message.raw[18 + offset : 19 + offset]
-        logger.debug("VIF: {}", vif.hex())
+        lazy_logger.debug("VIF: {}", lambda: vif.hex())
         extension, unit, exponent = self.analyse_vif(vif)
 
         if extension:
@@ -0,0 +1,41 @@
+from time import time
+from typing import Optional
+
+from loguru import logger
+
+from pywirelessmbus.devices import Device
+from pywirelessmbus.utils.data_records import (
+    application_data_offset,
+    decode_data_records,
+)
+from pywirelessmbus.utils.message import WMbusMessage
+
+
+class GenericOMS(Device):
+    """
+    Device that decodes the data records of the telegram by the standard tables,
+    for meters without a specific driver.
+    """
+
+    updated_at: Optional[float]
+
+    def __init__(self, *args, **kwargs):
+        self.updated_at = None
+
+        super().__init__(*args, **kwargs)
+
+    def process_new_message(self, message: WMbusMessage) -> WMbusMessage:
+        self.updated_at = time()
+
+        try:
+            offset = application_data_offset(message.raw)
+        except (ValueError, IndexError):
+            logger.warning("Can't find the data records of the device {}.", self.id)
+            return message
+
+        message.values.extend(decode_data_records(message.raw, self.updated_at, offset))
+        logger.info(
+            "Receive {} values from OMS Device {}", len(message.values), self.id
+        )
+
+        return message
@@ -0,0 +1,220 @@
+"""
+Registry of the device drivers, keyed by manufacturer, version and device type.
+
+Drivers are stored as classes or as "module:Class" strings, that are imported on
+the first telegram of a matching device. Third party packages register drivers
+with entry points in the group "pywirelessmbus.drivers". The name of an entry
+point is the key "<manufacturer>[.<version>[.<device type>]]", e.g. "WEP.2" or
+"FFD.0x01.0x02", the value the class, e.g. "my_package.drivers:MyMeter".
+"""
+from importlib import import_module
+from typing import Callable, Dict, Optional, Set, Tuple, Type, Union
+
+from loguru import logger
+
+from pywirelessmbus.devices.device import Device
+
+try:
+    from importlib.metadata import entry_points
+except ImportError:  # Python 3.7
+    try:
+        from importlib_metadata import entry_points
+    except ImportError:
+        entry_points = None
+
+ENTRY_POINT_GROUP = "pywirelessmbus.drivers"
+
+# manufacturer as in the telegram, version and device type, None matches all
+DriverKey = Tuple[bytes, Optional[int], Optional[int]]
+Driver = Union[Type[Device], str]
+
+
+def manufacturer_id(manufacturer: Union[str, bytes]) -> bytes:
+    """
+    M-Field of the telegram for a three letter manufacturer code like "WEP".
+    """
+    if isinstance(manufacturer, bytes):
+        return manufacturer
+
+    code = manufacturer.upper()
+    if len(code) != 3 or not all("A" <= letter <= "Z" for letter in code):
+        raise ValueError(f"Invalid manufacturer code {manufacturer}.")
+
+    value = 0
+    for letter in code:
+        value = (value << 5) | (ord(letter) - 64)
+    return value.to_bytes(2, "little")
+
+
+def _parse_key(name: str) -> DriverKey:
+    parts = name.split(".")
+    if len(parts) > 3:
+        raise ValueError(f"Invalid driver key {name}.")
+
+    numbers = [int(part, 0) for part in parts[1:]] + [None, None]
+    return manufacturer_id(parts[0]), numbers[0], numbers[1]
+
+
+def import_driver(path: str) -> Type[Device]:
+    module_name, _, class_name = path.partition(":")
+    return getattr(import_module(module_name), class_name)
+
+
+class DriverRegistry:
+    """
+    Maps the link layer fields of a telegram to the driver class of the device.
+    """
+
+    def __init__(
+        self,
+        drivers: Optional[Dict[DriverKey, Driver]] = None,
+        fallback: Optional[Driver] = None,
+        entry_point_group: Optional[str] = ENTRY_POINT_GROUP,
+    ):
+        self._drivers: Dict[DriverKey, Driver] = dict(drivers or {})
+        self._fallback = fallback
+        self._entry_point_group = entry_point_group
+        self._entry_points_loaded = entry_point_group is None
+        # every key seen in a telegram, so a lookup is a single dict hit
+        self._resolved: Dict[Tuple[bytes, int, int], Optional[Type[Device]]] = {}
+        # keys, that only matched the fallback
+        self._fallback_keys: Set[Tuple[bytes, int, int]] = set()
+
+    def __len__(self) -> int:
+        return len(self._drivers)
+
+    def register(
+        self,
+        manufacturer: Union[str, bytes],
+        version: Optional[int] = None,
+        device_type: Optional[int] = None,
+        driver: Optional[Driver] = None,
+    ):
+        """
+        Register a driver, without a driver it works as a class decorator.
+        """
+        key = (manufacturer_id(manufacturer), version, device_type)
+
+        if driver is None:
+
+            def decorator(cls: Type[Device]) -> Type[Device]:
+                self._add(key, cls)
+                return cls
+
+            return decorator
+
+        self._add(key, driver)
+        return driver
+
+    def _add(self, key: DriverKey, driver: Driver):
+        self._drivers[key] = driver
+        self._clear_resolved()
+
+    def _clear_resolved(self):
+        self._resolved.clear()
+        self._fallback_keys.clear()
+
+    def lookup(
+        self, manufacturer: bytes, version: int, device_type: int
+    ) -> Optional[Type[Device]]:
+        """
+        Driver class for the telegram fields, the fallback for unknown devices.
+        """
+        key = (manufacturer, version, device_type)
+        try:
+            return self._resolved[key]
+        except KeyError:
+            pass
+
+        driver = self._resolve(key)
+        self._resolved[key] = driver
+        return driver
+
+    def is_fallback(self, manufacturer: bytes, version: int, device_type: int) -> bool:
+        """
+        True if the telegram fields have no driver of their own and get the fallback.
+        """
+        self.lookup(manufacturer, version, device_type)
+        return (manufacturer, version, device_type) in self._fallback_keys
+
+    def _resolve(self, key: Tuple[bytes, int, int]) -> Optional[Type[Device]]:
+        if not self._entry_points_loaded:
+            self.load_entry_points()
+
+        manufacturer, version, _ = key
+        driver = (
+            self._drivers.get(key)
+            or self._drivers.get((manufacturer, version, None))
+            or self._drivers.get((manufacturer, None, None))
+        )
+        if driver is None:
+            if self._fallback is None:
+                return None
+            driver = self._fallback
+            self._fallback_keys.add(key)
+
+        if isinstance(driver, str):
+            try:
+                return import_driver(driver)
+            except (ImportError, AttributeError) as error:
+                logger.error("Failed to load the driver {}: {}", driver, error)
+                return None
+
+        return driver
+
+    def load_entry_points(self):
+        """
+        Register the drivers of the entry points, without importing them.
+        """
+        self._entry_points_loaded = True
+        if entry_points is None:
+            logger.warning(
+                "Driver entry points need Python 3.8 or importlib_metadata, the "
+                "drivers of other packages are not loaded."
+            )
+            return
+
+        found = entry_points()
+        if hasattr(found, "select"):
+            group = found.select(group=self._entry_point_group)
+        else:
+            group = found.get(self._entry_point_group, [])
+
+        for entry_point in group:
+            try:
+                key = _parse_key(entry_point.name)
+            except ValueError as error:
+                logger.warning("Ignore driver entry point: {}", error)
+                continue
+            # explicitly registered drivers take precedence
+            self._drivers.setdefault(key, entry_point.value)
+
+        self._clear_resolved()
+
+
+DRIVERS = DriverRegistry(
+    drivers={
+        (manufacturer_id("WEP"), 1, None): (
+            "pywirelessmbus.devices.weptech_oms:WeptechOMSv1"
+        ),
+        (manufacturer_id("WEP"), 2, None): (
+            "pywirelessmbus.devices.weptech_oms:WeptechOMSv2"
+        ),
+        (manufacturer_id("FFD"), 1, None): (
+            "pywirelessmbus.devices.energy_cam:EnergyCam"
+        ),
+        (b"\xff\xff", None, None): "pywirelessmbus.devices.mock_device:MockDevice",
+    },
+    fallback="pywirelessmbus.devices.generic:GenericOMS",
+)
+
+
+def register_driver(
+    manufacturer: Union[str, bytes],
+    version: Optional[int] = None,
+    device_type: Optional[int] = None,
+) -> Callable[[Type[Device]], Type[Device]]:
+    """
+    Class decorator to register a driver in the default registry.
+    """
+    return DRIVERS.register(manufacturer, version, device_type)
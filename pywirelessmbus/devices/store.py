@@ -0,0 +1,157 @@
+"""
+SQLite store of the known devices, so a restarted gateway knows all of its devices
+before the first telegram.
+"""
+import json
+import sqlite3
+import time
+from typing import Callable, Dict, List, Optional, Type
+
+from loguru import logger
+
+from pywirelessmbus.devices.device import Device
+from pywirelessmbus.devices.registry import import_driver
+from pywirelessmbus.utils.message import Value, ValueType
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS devices (
+    device_id TEXT PRIMARY KEY,
+    driver TEXT NOT NULL,
+    arguments TEXT NOT NULL,
+    label TEXT NOT NULL,
+    last_values TEXT NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+UPSERT = """
+INSERT OR REPLACE INTO devices
+    (device_id, driver, arguments, label, last_values, updated_at)
+VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+
+def driver_path(device: Device) -> str:
+    cls = type(device)
+    return f"{cls.__module__}:{cls.__qualname__}"
+
+
+class DeviceStore:
+    """
+    Devices with their driver, label and last values. The key table slots belong
+    to the sticks and are kept by their snapshots.
+
+    Changes are collected in memory and written in one transaction every
+    flush_interval seconds or after flush_size changed devices, so the store
+    costs no disk write per telegram.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        flush_interval: float = 30.0,
+        flush_size: int = 500,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.clock = clock
+
+        self._connection = sqlite3.connect(path)
+        with self._connection:
+            self._connection.execute(SCHEMA)
+        self._pending: Dict[str, Device] = {}
+        self._flushed_at = clock()
+
+    def __len__(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM devices").fetchone()[0]
+
+    def load(self, **kwargs) -> List[Device]:
+        """
+        Create all stored devices, the kwargs are passed to every device. The
+        devices are numbered in the order of the store.
+        """
+        devices = []
+        drivers: Dict[str, Optional[Type[Device]]] = {}
+        rows = self._connection.execute(
+            "SELECT device_id, driver, arguments, label, last_values FROM devices"
+        )
+
+        for device_id, path, arguments, label, last_values in rows:
+            if path not in drivers:
+                try:
+                    drivers[path] = import_driver(path)
+                except (ImportError, AttributeError) as error:
+                    logger.error("Failed to load the driver {}: {}", path, error)
+                    drivers[path] = None
+
+            driver = drivers[path]
+            if driver is None:
+                continue
+
+            device = driver(
+                device_id=device_id,
+                index=len(devices),
+                label=label,
+                **json.loads(arguments),
+                **kwargs,
+            )
+            device.last_values = [
+                Value(value, unit, timestamp, ValueType(value_type))
+                for value, unit, timestamp, value_type in json.loads(last_values)
+            ]
+            devices.append(device)
+
+        logger.info("Loaded {} devices from {}", len(devices), self.path)
+        return devices
+
+    def update(self, device: Device):
+        """
+        Mark the device as changed, the store is written if a flush is due.
+        """
+        self._pending[device.id] = device
+
+        if (
+            len(self._pending) >= self.flush_size
+            or self.clock() - self._flushed_at >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self):
+        self._flushed_at = self.clock()
+        if not self._pending:
+            return
+
+        now = time.time()
+        rows = [
+            (
+                device.id,
+                driver_path(device),
+                json.dumps(device.driver_arguments()),
+                device.label,
+                json.dumps(
+                    [
+                        (value.value, value.unit, value.timestamp, value.type.value)
+                        for value in device.last_values
+                    ]
+                ),
+                now,
+            )
+            for device in self._pending.values()
+        ]
+        self._pending.clear()
+
+        with self._connection:
+            self._connection.executemany(UPSERT, rows)
+
+    def remove(self, device_id: str):
+        self._pending.pop(device_id, None)
+        with self._connection:
+            self._connection.execute(
+                "DELETE FROM devices WHERE device_id = ?", (device_id,)
+            )
+
+    def close(self):
+        self.flush()
+        self._connection.close()
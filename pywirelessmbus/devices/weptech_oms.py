@@ -6,6 +6,7 @@ from loguru import logger
 
 from pywirelessmbus.devices import Device
 from pywirelessmbus.exceptions import InvalidMessageLength
+from pywirelessmbus.utils.log import lazy_logger
 from pywirelessmbus.utils.message import ValueType, WMbusMessage
 
 
@@ -33,10 +34,12 @@ class WeptechOMS(Device):
         self.updated_at = time()
         logger.info("Receive new measurement from Weptech OMS Device {}", self.id)
         logger.debug("Counter: {}", message.access_number)
-        logger.debug("Status: {}", bin(message.status))
-        logger.info(
+        lazy_logger.debug("Status: {}", lambda: bin(message.status))
+        lazy_logger.info(
             "Timestamp: {}",
-            datetime.utcfromtimestamp(self.updated_at).strftime("%Y-%m-%d %H:%M:%s"),
+            lambda: datetime.utcfromtimestamp(self.updated_at).strftime(
+                "%Y-%m-%d %H:%M:%s"
+            ),
         )
 
         return message
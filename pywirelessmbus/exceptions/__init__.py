@@ -1,5 +1,15 @@
 from pywirelessmbus.exceptions.devices import (UnknownDeviceTypeError,
                                                UnknownDeviceVersion)
-from pywirelessmbus.exceptions.general import InvalidMessageLength
+from pywirelessmbus.exceptions.general import (
+    DecryptionError,
+    InvalidMessageLength,
+    StickNotConnectedError,
+)
 
-__all__ = ["UnknownDeviceTypeError", "InvalidMessageLength", "UnknownDeviceVersion"]
+__all__ = [
+    "UnknownDeviceTypeError",
+    "InvalidMessageLength",
+    "UnknownDeviceVersion",
+    "StickNotConnectedError",
+    "DecryptionError",
+]
@@ -1,2 +1,10 @@
 class InvalidMessageLength(Exception):
     pass
+
+
+class StickNotConnectedError(Exception):
+    pass
+
+
+class DecryptionError(Exception):
+    pass
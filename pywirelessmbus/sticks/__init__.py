@@ -1,4 +1,13 @@
+from pywirelessmbus.sticks.config import StickConfig
 from pywirelessmbus.sticks.im871a import IM871A_USB
+from pywirelessmbus.sticks.key_slots import KeySlotManager
 from pywirelessmbus.sticks.mock_stick import MockStick
+from pywirelessmbus.sticks.snapshot import StickSnapshots
 
-__all__ = ["IM871A_USB", "MockStick"]
+__all__ = [
+    "IM871A_USB",
+    "MockStick",
+    "KeySlotManager",
+    "StickConfig",
+    "StickSnapshots",
+]
@@ -0,0 +1,120 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Hashable, Optional
+
+from pywirelessmbus.utils.utils import NOOP
+
+
+class Command:
+    __slots__ = ("frame", "key", "future", "on_write")
+
+    def __init__(
+        self,
+        frame: bytes,
+        key: Optional[Hashable] = None,
+        future: Optional["asyncio.Future[Any]"] = None,
+        on_write: Callable[[], None] = NOOP,
+    ):
+        self.frame = frame
+        # commands with the same key can be merged while they wait
+        self.key = key
+        self.future = future
+        self.on_write = on_write
+
+
+class CommandQueue:
+    """
+    Outbound frames to the stick.
+
+    The queue stops while the transport pauses writing and sends at most rate
+    frames per second, so bulk operations don't overrun the HCI buffer of the
+    stick. Without rate and pause the frames are written immediately. Commands,
+    whose future is done already, e.g. expired requests, are skipped.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[bytes], None],
+        rate: Optional[float] = None,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.write = write
+        self.rate = rate
+        self.clock = clock
+        self.paused = False
+        self.written = 0
+        self.coalesced = 0
+        self.max_depth = 0
+        self._loop = loop or asyncio.get_event_loop()
+        self._commands: Deque[Command] = deque()
+        self._next_write = 0.0
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def depth(self) -> int:
+        return len(self._commands)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "written": self.written,
+            "coalesced": self.coalesced,
+        }
+
+    def put(self, command: Command):
+        self._commands.append(command)
+        self.max_depth = max(self.max_depth, len(self._commands))
+        self._drain()
+
+    def queued(self, key: Hashable) -> Optional[Command]:
+        """
+        The last waiting command with the key, to merge a new one into it.
+        """
+        for command in reversed(self._commands):
+            if command.key == key:
+                return command
+        return None
+
+    def pause(self):
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+        self._drain()
+
+    def clear(self):
+        self._commands.clear()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _drain(self):
+        if self._timer is not None:
+            return
+
+        while self._commands and not self.paused:
+            future = self._commands[0].future
+            if future is not None and future.done():
+                self._commands.popleft()
+                continue
+
+            if self.rate is not None:
+                now = self.clock()
+                if now < self._next_write:
+                    self._timer = self._loop.call_later(
+                        self._next_write - now, self._wake_up
+                    )
+                    return
+                self._next_write = now + 1 / self.rate
+
+            command = self._commands.popleft()
+            self.write(command.frame)
+            self.written += 1
+            command.on_write()
+
+    def _wake_up(self):
+        self._timer = None
+        self._drain()
@@ -0,0 +1,149 @@
+from dataclasses import asdict, dataclass, fields
+from typing import Any, Dict, List, Optional, Tuple
+
+# name, information indicator flag (first or second), bit and length of the fields
+CONFIG_FIELDS: Tuple[Tuple[str, int, int, int], ...] = (
+    ("device_mode", 0, 0x01, 1),
+    ("link_mode", 0, 0x02, 1),
+    ("c_field", 0, 0x04, 1),
+    ("manufacturer_id", 0, 0x08, 2),
+    ("device_id", 0, 0x10, 4),
+    ("version", 0, 0x20, 1),
+    ("device_type", 0, 0x40, 1),
+    ("radio_channel", 0, 0x80, 1),
+    ("radio_power_level", 1, 0x01, 1),
+    ("radio_data_rate", 1, 0x02, 1),
+    ("radio_rx_window", 1, 0x04, 1),
+    ("auto_power_saving", 1, 0x08, 1),
+    ("auto_rssi_attachment", 1, 0x10, 1),
+    ("auto_timestamp_attachment", 1, 0x20, 1),
+    ("led_control", 1, 0x40, 1),
+    ("rtc_control", 1, 0x80, 1),
+)
+
+BOOL_FIELDS = {
+    "auto_power_saving",
+    "auto_rssi_attachment",
+    "auto_timestamp_attachment",
+    "led_control",
+    "rtc_control",
+}
+# little endian on the stick, shown as hex string like on the meters
+HEX_FIELDS = {"manufacturer_id", "device_id"}
+
+
+@dataclass
+class DeviceInfo:
+    module_type: int
+    device_mode: int
+    firmware_version: int
+    hci_version: int
+    device_id: str
+
+
+@dataclass
+class StickConfig:
+    """
+    Configuration of the IM871A, a field is None while it is unknown.
+    """
+
+    device_mode: Optional[int] = None
+    link_mode: Optional[int] = None
+    c_field: Optional[int] = None
+    manufacturer_id: Optional[str] = None
+    device_id: Optional[str] = None
+    version: Optional[int] = None
+    device_type: Optional[int] = None
+    radio_channel: Optional[int] = None
+    radio_power_level: Optional[int] = None
+    radio_data_rate: Optional[int] = None
+    radio_rx_window: Optional[int] = None
+    auto_power_saving: Optional[bool] = None
+    auto_rssi_attachment: Optional[bool] = None
+    auto_timestamp_attachment: Optional[bool] = None
+    led_control: Optional[bool] = None
+    rtc_control: Optional[bool] = None
+
+    @classmethod
+    def field_names(cls) -> List[str]:
+        return [config_field.name for config_field in fields(cls)]
+
+    def update(self, values: Dict[str, Any]):
+        for name, value in values.items():
+            setattr(self, name, value)
+
+    def as_dict(self) -> Dict[str, Any]:
+        """
+        The known fields.
+        """
+        return {
+            name: value for name, value in asdict(self).items() if value is not None
+        }
+
+    def changes(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        The values, that differ from the configuration.
+        """
+        return {
+            name: value
+            for name, value in values.items()
+            if getattr(self, name) != value
+        }
+
+
+def _decode_field(name: str, data: bytes) -> Any:
+    if name in HEX_FIELDS:
+        return data[::-1].hex()
+    if name in BOOL_FIELDS:
+        return bool(data[0])
+    return data[0]
+
+
+def _encode_field(name: str, value: Any) -> bytes:
+    if name in HEX_FIELDS:
+        return bytes.fromhex(value)[::-1]
+    return bytes([int(value)])
+
+
+def decode_config(data: bytes) -> Dict[str, Any]:
+    """
+    Fields of the configuration part of a GET_CONFIG response or SET_CONFIG
+    request, starting with the first information indicator flag.
+    """
+    values: Dict[str, Any] = {}
+    flags = [0, 0]
+    offset = 0
+
+    for name, group, bit, length in CONFIG_FIELDS:
+        if bit == 0x01:
+            if offset >= len(data):
+                # the second flag is optional
+                break
+            flags[group] = data[offset]
+            offset += 1
+        if flags[group] & bit:
+            value = data[offset : offset + length]
+            if len(value) != length:
+                raise ValueError(f"The configuration field {name} is cut off.")
+            values[name] = _decode_field(name, value)
+            offset += length
+
+    return values
+
+
+def encode_config(values: Dict[str, Any]) -> bytes:
+    """
+    Configuration part of a SET_CONFIG request with the given fields.
+    """
+    unknown = set(values) - set(StickConfig.field_names())
+    if unknown:
+        raise ValueError(f"Unknown configuration fields: {', '.join(sorted(unknown))}")
+
+    flags = [0, 0]
+    data: List[bytes] = [b"", b""]
+    for name, group, bit, _ in CONFIG_FIELDS:
+        if name in values:
+            flags[group] |= bit
+            data[group] += _encode_field(name, values[name])
+
+    return bytes([flags[0]]) + data[0] + bytes([flags[1]]) + data[1]
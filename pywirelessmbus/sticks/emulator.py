@@ -0,0 +1,519 @@
+"""
+Emulator of an IM871A stick on a pseudo terminal, with a population of simulated
+meters. IM871A_USB and WMbus use the path of the emulator like a real stick, so
+the serial path can be tested and benchmarked without hardware.
+
+    python -m pywirelessmbus.sticks.emulator --meters 100 --rate 50
+"""
+import argparse
+import asyncio
+import os
+import pty
+import random
+import time
+import tty
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from loguru import logger
+
+from pywirelessmbus.devices.registry import manufacturer_id
+from pywirelessmbus.sticks.config import CONFIG_FIELDS
+from pywirelessmbus.sticks.im871a import (
+    CRC_FLAG,
+    DEVMGMT_ID,
+    DEVMGMT_MSG_ENABLE_AES_ENCKEY_REQ,
+    DEVMGMT_MSG_ENABLE_AES_ENCKEY_RSP,
+    DEVMGMT_MSG_FACTORY_RESET_REQ,
+    DEVMGMT_MSG_FACTORY_RESET_RES,
+    DEVMGMT_MSG_GET_CONFIG_REQ,
+    DEVMGMT_MSG_GET_CONFIG_RES,
+    DEVMGMT_MSG_GET_DEVICEINFO_REQ,
+    DEVMGMT_MSG_GET_DEVICEINFO_RES,
+    DEVMGMT_MSG_PING_REQ,
+    DEVMGMT_MSG_PING_RSP,
+    DEVMGMT_MSG_RESET_REQ,
+    DEVMGMT_MSG_RESET_RES,
+    DEVMGMT_MSG_SET_AES_DECKEY_REQ,
+    DEVMGMT_MSG_SET_AES_DECKEY_RSP,
+    DEVMGMT_MSG_SET_CONFIG_REQ,
+    DEVMGMT_MSG_SET_CONFIG_RES,
+    RADIOLINK_ID,
+    RADIOLINK_MSG_WMBUSMSG_IND,
+    RADIOLINK_MSG_WMBUSMSG_REQ,
+    RADIOLINK_MSG_WMBUSMSG_RSP,
+    RSSI_FLAG,
+    START_OF_FRAME,
+    STATUS_OK,
+    TIMESTAMP_FLAG,
+    FrameAssembler,
+)
+from pywirelessmbus.utils.crc import crc16
+
+STATUS_ERROR = 0x01
+MODULE_TYPE_IM871A = 0x33
+
+DEFAULT_CONFIG = {
+    "device_mode": b"\x00",
+    "link_mode": b"\x03",
+    "c_field": b"\x44",
+    "manufacturer_id": b"\xb3\x25",
+    "device_id": b"\x78\x56\x34\x12",
+    "version": b"\x01",
+    "device_type": b"\x31",
+    "radio_channel": b"\x0b",
+    "radio_power_level": b"\x07",
+    "radio_data_rate": b"\x00",
+    "radio_rx_window": b"\x32",
+    "auto_power_saving": b"\x00",
+    "auto_rssi_attachment": b"\x01",
+    "auto_timestamp_attachment": b"\x00",
+    "led_control": b"\x01",
+    "rtc_control": b"\x00",
+}
+
+
+def _bcd(value: int, length: int) -> bytes:
+    """
+    BCD coded value, little endian, negative values with F in the highest nibble.
+    """
+    digits = f"{abs(value):0{length * 2}d}"[-length * 2 :]
+    if value < 0:
+        digits = "f" + digits[1:]
+    return bytes.fromhex(digits)[::-1]
+
+
+class SimulatedMeter(ABC):
+    """
+    Meter that sends a telegram with the link layer header of the given fields.
+    """
+
+    manufacturer = "EMU"
+    version = 1
+    device_type = 0x00
+
+    def __init__(self, address: int, rng: Optional[random.Random] = None):
+        self.address = address
+        self.access_number = 0
+        self.rng = rng or random.Random(address)
+
+    @property
+    def device_id(self) -> bytes:
+        """
+        M-Field, A-Field, version and device type, like the ID of WMbus.devices.
+        """
+        return (
+            manufacturer_id(self.manufacturer)
+            + _bcd(self.address, 4)
+            + bytes([self.version, self.device_type])
+        )
+
+    @abstractmethod
+    def records(self) -> bytes:
+        """
+        Data records of the next telegram.
+        """
+        pass
+
+    def telegram(self) -> bytes:
+        """
+        Next telegram with L-Field, short transport layer header and the records.
+        """
+        self.access_number = (self.access_number + 1) & 0xFF
+        body = (
+            b"\x44"
+            + self.device_id
+            + bytes([0x7A, self.access_number, 0x00, 0x00, 0x00])
+            + b"\x2f\x2f"
+            + self.records()
+        )
+        return bytes([len(body)]) + body
+
+
+class WeptechMeter(SimulatedMeter):
+    """
+    Munia temperature (version 1) or temperature and humidity sensor (version 2).
+    """
+
+    manufacturer = "WEP"
+    device_type = 0x1B
+
+    def __init__(self, address: int, version: int = 2, **kwargs):
+        super().__init__(address, **kwargs)
+        self.version = version
+        self.temperature = 21.0
+        self.humidity = 50.0
+
+    def records(self) -> bytes:
+        self.temperature = round(self.temperature + self.rng.uniform(-0.2, 0.2), 1)
+        records = b"\x0a\x66" + _bcd(round(self.temperature * 10), 2)
+        if self.version == 2:
+            self.humidity = round(
+                min(max(self.humidity + self.rng.uniform(-1, 1), 0), 99), 1
+            )
+            records += b"\x0a\xfb\x1a" + _bcd(round(self.humidity * 10), 2)
+        records += b"\x02\xfd\x97\x1d\x00\x00"
+
+        # the sensors fill their telegrams to a fixed length
+        length = 46 if self.version == 2 else 30
+        return records + b"\x2f" * (length - 16 - len(records))
+
+
+class EnergyCamMeter(SimulatedMeter):
+    """
+    EnergyCam on an electricity (2), gas (3), water (7) or oil meter (1).
+    """
+
+    manufacturer = "FFD"
+
+    def __init__(self, address: int, meter_type: int = 2, **kwargs):
+        super().__init__(address, **kwargs)
+        self.device_type = meter_type
+        self.value = 0
+
+    def records(self) -> bytes:
+        self.value += self.rng.randint(0, 100)
+        # 1 decimal, in Wh for electricity or m3 for the other meters
+        vif = 0x01 if self.device_type == 2 else 0x11
+        return b"\x04" + bytes([vif]) + self.value.to_bytes(4, "little")
+
+
+class GenericMeter(SimulatedMeter):
+    """
+    Heat meter without specific driver, with energy, volume and temperatures.
+    """
+
+    device_type = 0x04
+
+    def __init__(self, address: int, **kwargs):
+        super().__init__(address, **kwargs)
+        self.energy = 0
+        self.volume = 0
+
+    def records(self) -> bytes:
+        self.energy += self.rng.randint(0, 10)
+        self.volume += self.rng.randint(0, 50)
+        flow_temperature = self.rng.randint(550, 700)
+        return (
+            b"\x04\x06"
+            + self.energy.to_bytes(4, "little")
+            + b"\x04\x13"
+            + self.volume.to_bytes(4, "little")
+            + b"\x02\x5a"
+            + flow_temperature.to_bytes(2, "little")
+            + b"\x02\x5e"
+            + (flow_temperature - 200).to_bytes(2, "little")
+        )
+
+
+def create_meters(count: int, seed: int = 0) -> List[SimulatedMeter]:
+    """
+    Population of Weptech, EnergyCam and generic meters with unique addresses.
+    """
+    rng = random.Random(seed)
+    meters: List[SimulatedMeter] = []
+    for index in range(count):
+        address = 10000000 + index
+        kind = index % 4
+        if kind == 0:
+            meters.append(WeptechMeter(address, version=2, rng=rng))
+        elif kind == 1:
+            meters.append(WeptechMeter(address, version=1, rng=rng))
+        elif kind == 2:
+            meters.append(EnergyCamMeter(address, meter_type=2, rng=rng))
+        else:
+            meters.append(GenericMeter(address, rng=rng))
+    return meters
+
+
+class StickEmulator:
+    """
+    IM871A on the master side of a pseudo terminal.
+
+    Answers the device management requests (ping, reset, configuration, device
+    info, AES keys) and the radio link send request. Every meter sends telegrams
+    in turn, rate telegrams per second in total. The RSSI and timestamp fields
+    follow the configuration, CRC fields are attached with crc.
+    """
+
+    def __init__(
+        self,
+        meters: Sequence[SimulatedMeter] = (),
+        rate: float = 10.0,
+        crc: bool = False,
+        key_table_size: int = 64,
+        max_pending_bytes: int = 1 << 20,
+    ):
+        self.meters = list(meters)
+        self.rate = rate
+        self.crc = crc
+        self.key_table_size = key_table_size
+        self.max_pending_bytes = max_pending_bytes
+
+        self.config: Dict[str, bytes] = dict(DEFAULT_CONFIG)
+        # configuration in the non volatile memory, that a reset loads again
+        self.stored_config: Dict[str, bytes] = dict(DEFAULT_CONFIG)
+        self.keys: Dict[int, Tuple[bytes, bytes]] = {}
+        self.requests = 0
+        self.sent_telegrams = 0
+        self.dropped_telegrams = 0
+        self.transmitted = 0
+        # send time of the telegrams per device and access number
+        self.sent_at: Dict[Tuple[bytes, int], float] = {}
+        self.track_latency = False
+
+        self._master: Optional[int] = None
+        self._slave: Optional[int] = None
+        self._assembler = FrameAssembler()
+        self._pending = bytearray()
+        self._writing = False
+        self._traffic: Optional["asyncio.Task[None]"] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def path(self) -> str:
+        if self._slave is None:
+            raise RuntimeError("The emulator is not started.")
+        return os.ttyname(self._slave)
+
+    def start(self) -> str:
+        """
+        Open the pseudo terminal and start the traffic, returns the path for the stick.
+        """
+        self._loop = asyncio.get_event_loop()
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._slave)
+        os.set_blocking(self._master, False)
+        self._loop.add_reader(self._master, self._read)
+
+        if self.meters and self.rate > 0:
+            self._traffic = self._loop.create_task(self._send_traffic())
+
+        logger.info("Emulate IM871A on {} with {} meters.", self.path, len(self.meters))
+        return self.path
+
+    def stop(self):
+        if self._traffic is not None:
+            self._traffic.cancel()
+            self._traffic = None
+        if self._master is not None and self._loop is not None:
+            self._loop.remove_reader(self._master)
+            if self._writing:
+                self._loop.remove_writer(self._master)
+            os.close(self._master)
+            os.close(self._slave)
+            self._master = self._slave = None
+
+    def latency(self, device_id: bytes, access_number: int) -> Optional[float]:
+        """
+        Seconds since the telegram was sent, with track_latency enabled.
+        """
+        sent_at = self.sent_at.pop((device_id, access_number), None)
+        if sent_at is None:
+            return None
+        return time.perf_counter() - sent_at
+
+    # stick to host
+    def frame(
+        self, endpoint_id: int, message_id: bytes, payload: bytes, flags: int = 0
+    ) -> bytes:
+        if self.crc:
+            flags |= CRC_FLAG
+
+        frame = (
+            START_OF_FRAME
+            + bytes([(flags << 4) | endpoint_id])
+            + message_id
+            + bytes([len(payload)])
+            + payload
+        )
+        if flags & TIMESTAMP_FLAG:
+            frame += (time.monotonic_ns() // 1_000_000 & 0xFFFFFFFF).to_bytes(
+                4, "little"
+            )
+        if flags & RSSI_FLAG:
+            frame += bytes([random.randint(0x40, 0xC0)])
+        if flags & CRC_FLAG:
+            frame += crc16(frame[1:]).to_bytes(2, "little")
+        return frame
+
+    def send_telegram(self, meter: SimulatedMeter) -> bool:
+        telegram = meter.telegram()
+        flags = 0
+        if self.config["auto_timestamp_attachment"] != b"\x00":
+            flags |= TIMESTAMP_FLAG
+        if self.config["auto_rssi_attachment"] != b"\x00":
+            flags |= RSSI_FLAG
+
+        # the L-Field of the telegram is the length field of the frame
+        frame = self.frame(
+            RADIOLINK_ID, RADIOLINK_MSG_WMBUSMSG_IND, telegram[1:], flags
+        )
+        if len(self._pending) + len(frame) > self.max_pending_bytes:
+            self.dropped_telegrams += 1
+            return False
+
+        if self.track_latency:
+            self.sent_at[(meter.device_id, meter.access_number)] = time.perf_counter()
+        self.sent_telegrams += 1
+        self._write(frame)
+        return True
+
+    async def _send_traffic(self):
+        loop = asyncio.get_event_loop()
+        interval = 1 / self.rate
+        next_at = loop.time()
+        index = 0
+
+        while True:
+            now = loop.time()
+            while next_at <= now:
+                self.send_telegram(self.meters[index])
+                index = (index + 1) % len(self.meters)
+                next_at += interval
+            await asyncio.sleep(max(next_at - loop.time(), 0))
+
+    def _write(self, data: bytes):
+        self._pending += data
+        if not self._writing:
+            self._flush()
+
+    def _flush(self):
+        if self._master is None:
+            return
+
+        try:
+            written = os.write(self._master, self._pending)
+        except BlockingIOError:
+            written = 0
+        del self._pending[:written]
+        self.transmitted += written
+
+        if self._pending and not self._writing:
+            self._loop.add_writer(self._master, self._flush)
+            self._writing = True
+        elif not self._pending and self._writing:
+            self._loop.remove_writer(self._master)
+            self._writing = False
+
+    # host to stick
+    def _read(self):
+        try:
+            data = os.read(self._master, 4096)
+        except (BlockingIOError, OSError):
+            return
+
+        for frame in self._assembler.feed(data):
+            self.requests += 1
+            self.handle_request(frame[1] & 0x0F, bytes(frame[2:3]), bytes(frame[4:]))
+
+    def handle_request(self, endpoint_id: int, message_id: bytes, data: bytes):
+        if endpoint_id == RADIOLINK_ID and message_id == RADIOLINK_MSG_WMBUSMSG_REQ:
+            self._respond(RADIOLINK_ID, RADIOLINK_MSG_WMBUSMSG_RSP, STATUS_OK)
+            return
+
+        if endpoint_id != DEVMGMT_ID:
+            logger.warning("Emulator ignores request for endpoint {}.", endpoint_id)
+            return
+
+        if message_id == DEVMGMT_MSG_PING_REQ:
+            self._write(self.frame(DEVMGMT_ID, DEVMGMT_MSG_PING_RSP, b""))
+        elif message_id == DEVMGMT_MSG_GET_CONFIG_REQ:
+            self._write(
+                self.frame(DEVMGMT_ID, DEVMGMT_MSG_GET_CONFIG_RES, self._config())
+            )
+        elif message_id == DEVMGMT_MSG_SET_CONFIG_REQ:
+            status = STATUS_OK if self._set_config(data[1:]) else STATUS_ERROR
+            if status == STATUS_OK and data[:1] == b"\x01":
+                self.stored_config = dict(self.config)
+            self._respond(DEVMGMT_ID, DEVMGMT_MSG_SET_CONFIG_RES, status)
+        elif message_id == DEVMGMT_MSG_GET_DEVICEINFO_REQ:
+            info = (
+                bytes([MODULE_TYPE_IM871A, self.config["device_mode"][0], 0x01, 0x01])
+                + self.config["device_id"][::-1]
+            )
+            self._write(self.frame(DEVMGMT_ID, DEVMGMT_MSG_GET_DEVICEINFO_RES, info))
+        elif message_id == DEVMGMT_MSG_SET_AES_DECKEY_REQ:
+            status = STATUS_ERROR
+            if len(data) == 25 and data[0] < self.key_table_size:
+                self.keys[data[0]] = (data[1:9], data[9:])
+                status = STATUS_OK
+            self._respond(DEVMGMT_ID, DEVMGMT_MSG_SET_AES_DECKEY_RSP, status)
+        elif message_id == DEVMGMT_MSG_ENABLE_AES_ENCKEY_REQ:
+            self._respond(DEVMGMT_ID, DEVMGMT_MSG_ENABLE_AES_ENCKEY_RSP, STATUS_OK)
+        elif message_id == DEVMGMT_MSG_RESET_REQ:
+            self._respond(DEVMGMT_ID, DEVMGMT_MSG_RESET_RES, STATUS_OK)
+            self.power_cycle()
+        elif message_id == DEVMGMT_MSG_FACTORY_RESET_REQ:
+            self.config = dict(DEFAULT_CONFIG)
+            self.stored_config = dict(DEFAULT_CONFIG)
+            self.keys.clear()
+            self._respond(DEVMGMT_ID, DEVMGMT_MSG_FACTORY_RESET_RES, STATUS_OK)
+        else:
+            logger.warning("Emulator ignores request {}.", message_id.hex())
+
+    def power_cycle(self):
+        """
+        Restart with the configuration of the non volatile memory.
+        """
+        self.config = dict(self.stored_config)
+
+    def _respond(self, endpoint_id: int, message_id: bytes, status: int):
+        self._write(self.frame(endpoint_id, message_id, bytes([status])))
+
+    def _config(self) -> bytes:
+        flags = [0, 0]
+        fields: List[bytes] = [b"", b""]
+        for name, group, bit, _ in CONFIG_FIELDS:
+            flags[group] |= bit
+            fields[group] += self.config[name]
+        return bytes([flags[0]]) + fields[0] + bytes([flags[1]]) + fields[1]
+
+    def _set_config(self, data: bytes) -> bool:
+        config = dict(self.config)
+        flags = [0, 0]
+        offset = 0
+        try:
+            for name, group, bit, length in CONFIG_FIELDS:
+                if bit == 0x01:
+                    flags[group] = data[offset]
+                    offset += 1
+                if flags[group] & bit:
+                    value = data[offset : offset + length]
+                    if len(value) != length:
+                        return False
+                    config[name] = value
+                    offset += length
+        except IndexError:
+            return False
+
+        self.config = config
+        return True
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Emulate an IM871A stick.")
+    parser.add_argument("--meters", type=int, default=10, help="count of meters")
+    parser.add_argument("--rate", type=float, default=1.0, help="telegrams per s")
+    parser.add_argument("--crc", action="store_true", help="attach CRC fields")
+    arguments = parser.parse_args()
+
+    emulator = StickEmulator(
+        create_meters(arguments.meters), rate=arguments.rate, crc=arguments.crc
+    )
+    print(emulator.start(), flush=True)
+    try:
+        while True:
+            await asyncio.sleep(10)
+            logger.info(
+                "Sent {} telegrams, dropped {}.",
+                emulator.sent_telegrams,
+                emulator.dropped_telegrams,
+            )
+    finally:
+        emulator.stop()
+
+
+if __name__ == "__main__":
+    logger.enable("pywirelessmbus")
+    asyncio.run(main())
@@ -1,18 +1,48 @@
 import asyncio
-from dataclasses import dataclass
-from typing import Any, Callable, Optional
+import time
+from collections import deque
+from dataclasses import dataclass, field, replace
+from functools import partial
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional, Set, Tuple
 
 import serial_asyncio
 from loguru import logger
 from serial_asyncio import SerialTransport
 
-from pywirelessmbus.utils import IMSTMessage
+from pywirelessmbus.exceptions import StickNotConnectedError
+from pywirelessmbus.sticks.command_queue import Command, CommandQueue
+from pywirelessmbus.sticks.config import (
+    DeviceInfo,
+    StickConfig,
+    decode_config,
+    encode_config,
+)
+from pywirelessmbus.sticks.key_slots import KeySlotManager
+from pywirelessmbus.sticks.snapshot import StickSnapshot, StickSnapshots, key_digest
+from pywirelessmbus.utils import AnyIMSTMessage, IMSTFrame
+from pywirelessmbus.utils.capture import CaptureWriter, ReplayTransport
+from pywirelessmbus.utils.crc import check_crc16
+from pywirelessmbus.utils.dispatch import DispatchMode
+from pywirelessmbus.utils.log import lazy_logger
+from pywirelessmbus.utils.metrics import Histogram
 from pywirelessmbus.utils.utils import NOOP
 
 # CONTANTS
 START_OF_FRAME = b"\xa5"
 ZERO_LENGTH = b"\x00"
 
+# Frame layout
+HEADER_LENGTH = 4
+TIMESTAMP_LENGTH = 4
+RSSI_LENGTH = 1
+CRC_LENGTH = 2
+MAX_FRAME_LENGTH = HEADER_LENGTH + 255 + TIMESTAMP_LENGTH + RSSI_LENGTH + CRC_LENGTH
+
+# Control field flags (upper nibble of the second frame byte)
+TIMESTAMP_FLAG = 0x2
+RSSI_FLAG = 0x4
+CRC_FLAG = 0x8
+
 # Link Mode Mapping
 LINK_MODE = {
     0: "S1",
@@ -97,73 +127,321 @@ RADIOLINKTEST_MSG_STATUS_IND = b"\x07"
 HWTEST_MSG_RADIOTEST_REQ = b"\x01"
 HWTEST_MSG_RADIOTEST_REQ = b"\x02"
 
+# Status byte of responses
+STATUS_OK = 0x00
+
+# seconds to collect changes of the stick before the snapshot is written
+SNAPSHOT_DELAY = 1.0
+# seconds a cancelled request without timeout waits for its late response
+LATE_RESPONSE_WINDOW = 5.0
+
+
+def response_status(message: AnyIMSTMessage) -> bool:
+    """
+    True if the status byte of a response reports a successful operation.
+    """
+    if message.payload is None or len(message.payload) < 2:
+        logger.error("Receive response without status byte.")
+        return False
+
+    return message.payload[1] == STATUS_OK
+
+
+def _consume_exception(future: "asyncio.Future[Any]"):
+    if not future.cancelled():
+        future.exception()
+
+
+def _copy_result(target: "asyncio.Future[Any]", source: "asyncio.Future[Any]"):
+    if target.done():
+        return
+    if source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+
+def request_frame(message_id: bytes, payload: bytes = b"") -> bytes:
+    """
+    HCI frame of a device managment request without optional fields.
+    """
+    control_field = bytes([(0 << 4) + DEVMGMT_ID])
+    return START_OF_FRAME + control_field + message_id + bytes([len(payload)]) + payload
+
+
+def frame_length(control_field: int, payload_length: int) -> int:
+    """
+    Total length of a frame including start byte, header and optional trailer fields.
+    """
+    flags = control_field >> 4
+    return (
+        HEADER_LENGTH
+        + payload_length
+        + (flags & TIMESTAMP_FLAG > 0) * TIMESTAMP_LENGTH
+        + (flags & RSSI_FLAG > 0) * RSSI_LENGTH
+        + (flags & CRC_FLAG > 0) * CRC_LENGTH
+    )
+
+
+@dataclass
+class FrameAssembler:
+    """
+    Reassemble complete HCI frames from the byte stream of the serial port.
+
+    Reads from the serial port can contain several frames or only a part of one.
+    The bytes are collected in a preallocated buffer. Every complete frame is cut
+    out with the length byte and the flags of the control field, an incomplete
+    tail stays in the buffer until the next read. Bytes that can't be the start of
+    a frame are skipped. With verify_crc a frame with an invalid CRC is rejected
+    and the search starts again after its start byte, so frames inside it are
+    found.
+
+    Frames are handed out as views on the buffer and a written part of the buffer is
+    never overwritten. When the buffer is full, the tail moves into a new buffer and
+    the old one lives on as long as frames refer to it.
+    """
+
+    capacity: int = 4096
+    dropped_bytes: int = 0
+    verify_crc: bool = False
+    crc_errors: int = 0
+    # bytes handed out as frames or dropped since the start
+    consumed: int = 0
+
+    def __post_init__(self):
+        self._allocate(0)
+
+    @property
+    def pending(self) -> int:
+        return self._end - self._start
+
+    def reset(self):
+        self._allocate(0)
+
+    def feed(self, data: bytes) -> List[memoryview]:
+        size = len(data)
+        if self._end + size > len(self._buffer):
+            self._allocate(size)
+
+        self._view[self._end : self._end + size] = data
+        self._end += size
+
+        return self._extract()
+
+    def skip_frame(self) -> List[memoryview]:
+        """
+        Drop the start byte of the incomplete frame, e.g. a start byte in garbage
+        with a large length, and search the frames after it.
+        """
+        if self._start == self._end:
+            return []
+
+        self.dropped_bytes += 1
+        self.consumed += 1
+        self._start += 1
+        return self._extract()
+
+    def _allocate(self, size: int):
+        tail = self._view[self._start : self._end] if hasattr(self, "_view") else b""
+        pending = len(tail)
+
+        self._buffer = bytearray(max(self.capacity, MAX_FRAME_LENGTH, pending + size))
+        self._view = memoryview(self._buffer)
+        self._view[:pending] = tail
+        self._start = 0
+        self._end = pending
+
+    def _extract(self) -> List[memoryview]:
+        frames = []
+        buffer = self._buffer
+        start = self._start
+        end = self._end
+
+        while start < end:
+            if buffer[start] != START_OF_FRAME[0]:
+                next_start = buffer.find(START_OF_FRAME, start + 1, end)
+                if next_start == -1:
+                    next_start = end
+                self.dropped_bytes += next_start - start
+                start = next_start
+                continue
+
+            if end - start < HEADER_LENGTH:
+                break
+
+            control_field = buffer[start + 1]
+            if not DEVMGMT_ID <= control_field & 0xF <= HWTEST_ID:
+                # not a valid frame header, resync on the next start byte
+                self.dropped_bytes += 1
+                start += 1
+                continue
+
+            length = frame_length(control_field, buffer[start + 3])
+            if end - start < length:
+                break
+
+            frame = self._view[start : start + length]
+            if (
+                self.verify_crc
+                and control_field >> 4 & CRC_FLAG
+                and not check_crc16(frame[1:-2], frame[-2:])
+            ):
+                # the start byte can be garbage, frames can follow it
+                self.crc_errors += 1
+                self.dropped_bytes += 1
+                start += 1
+                continue
+
+            frames.append(frame)
+            start += length
+
+        self.consumed += start - self._start
+        self._start = start
+
+        return frames
+
 
 @dataclass
 class MessageProtocol(asyncio.Protocol):
     transport = None
-    on_message: Callable[[Any, IMSTMessage], None] = NOOP
+    on_message: Callable[[Any, AnyIMSTMessage], None] = NOOP
+    assembler: FrameAssembler = field(default_factory=FrameAssembler)
+    verify_crc: bool = True
+    crc_errors: int = 0
+    capture: Optional[CaptureWriter] = None
+    frames_received: int = 0
+    bytes_received: int = 0
+    write_pauses: int = 0
+    decode_latency: Histogram = field(default_factory=Histogram)
+    dispatch: DispatchMode = DispatchMode.BATCH
+    on_pause_writing: Callable[[], None] = NOOP
+    on_resume_writing: Callable[[], None] = NOOP
+    # seconds an incomplete frame may wait for its rest, before its start byte is
+    # taken as garbage
+    frame_timeout: float = 0.2
+
+    def __post_init__(self):
+        self._pending_frames: List[memoryview] = []
+        self._frame_timer: Optional[asyncio.TimerHandle] = None
 
     def connection_made(self, transport: SerialTransport):
         self.transport = transport
+        self.assembler.reset()
         logger.info("Serialport opened")
 
     def data_received(self, data):
-        logger.debug("data received {}", repr(data))
-        if data.startswith(START_OF_FRAME):
-            asyncio.create_task(self.decode_message(data))
+        lazy_logger.debug("data received {}", lambda: repr(data))
+        self.bytes_received += len(data)
+        self._receive_frames(self.assembler.feed, data)
+
+    def _receive_frames(self, extract: Callable[..., List[memoryview]], *args: Any):
+        dropped_bytes = self.assembler.dropped_bytes
+        crc_errors = self.assembler.crc_errors
+        self.assembler.verify_crc = self.verify_crc
+
+        frames = extract(*args)
+        self.crc_errors += self.assembler.crc_errors - crc_errors
+        self.frames_received += len(frames)
+        if self.capture is not None:
+            timestamp = time.monotonic_ns()
+            for frame in frames:
+                self.capture.write(frame, timestamp)
+
+        if self.dispatch != DispatchMode.BATCH:
+            for frame in frames:
+                self._decode_frame(frame)
+        elif frames:
+            if not self._pending_frames:
+                asyncio.get_running_loop().call_soon(self._decode_pending_frames)
+            self._pending_frames.extend(frames)
+
+        if self.assembler.dropped_bytes != dropped_bytes:
+            logger.warning(
+                "Skipped {} bytes without valid frame start.",
+                self.assembler.dropped_bytes - dropped_bytes,
+            )
+
+        self._watch_incomplete_frame()
+
+    def _watch_incomplete_frame(self):
+        if self._frame_timer is not None or self.assembler.pending == 0:
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._frame_timer = loop.call_later(
+            self.frame_timeout, self._drop_incomplete_frame, self.assembler.consumed
+        )
+
+    def _drop_incomplete_frame(self, consumed: int):
+        self._frame_timer = None
+        if self.assembler.pending and self.assembler.consumed == consumed:
+            logger.warning(
+                "Drop the start of a frame, that is incomplete after {} s.",
+                self.frame_timeout,
+            )
+            self._receive_frames(self.assembler.skip_frame)
+        else:
+            self._watch_incomplete_frame()
 
     def connection_lost(self, exc):
         logger.info("Serialport closed")
-        self.transport.loop.stop()
+        if exc is not None:
+            # the stick is gone, a closed transport leaves the loop running
+            self.transport.loop.stop()
 
     def pause_writing(self):
-        logger.info("pause writing")
-        logger.info(self.transport.get_write_buffer_size())
+        self.write_pauses += 1
+        logger.info(
+            "Pause writing with {} bytes in the write buffer.",
+            self.transport.get_write_buffer_size(),
+        )
+        self.on_pause_writing()
 
     def resume_writing(self):
-        logger.info(self.transport.get_write_buffer_size())
-        logger.info("resume writing")
+        logger.info(
+            "Resume writing with {} bytes in the write buffer.",
+            self.transport.get_write_buffer_size(),
+        )
+        self.on_resume_writing()
 
     def write_message(self, message):
         self.transport.write(message)
 
-    async def decode_message(self, data: bytes):
-        logger.debug("Receive new message: {}", data.hex())
-        control_field = data[1] >> 4
-        message = IMSTMessage(
-            endpoint_id=data[1] & 0xF,
-            message_id=data[2:3],
-            payload_length=int(data[3]),
-            with_timestamp_field=control_field & 0x2 > 0,
-            with_rssi_field=control_field & 0x4 > 0,
-            with_crc_field=control_field & 0x8 > 0,
-        )
-        message.payload = data[3 : 4 + int(message.payload_length)]
-
-        logger.debug("Receive raw message: {}", data.hex())
-        logger.debug("Endpoint ID: {}", message.endpoint_id)
-        logger.debug("Message ID: {}", message.message_id)
-        logger.debug("Payload Length: {}", message.payload_length)
-        logger.debug("Payload: {}", message.payload.hex())
-
-        if message.with_crc_field:
-            message.crc = data[-2:]
-            logger.debug("CRC: {}", message.crc)
-            # TODO: add CRC Check
-
-        if message.with_rssi_field:
-            message.rssi = data[
-                4 + message.payload_length + message.with_timestamp_field * 4
-            ]
-            logger.debug("RSSI: {}", message.rssi)
-
-        if message.with_timestamp_field:
-            message.timestamp = data[
-                4 + message.payload_length : 4 + message.payload_length + 4
-            ]
-            logger.debug("Timestamp: {}", message.timestamp)
+    def _decode_pending_frames(self):
+        frames = self._pending_frames
+        self._pending_frames = []
+        for frame in frames:
+            self._decode_frame(frame)
+
+    def decode_message(self, data: memoryview):
+        """
+        Decode a frame, that didn't come from the assembler, and check its CRC.
+        """
+        if (
+            self.verify_crc
+            and data[1] >> 4 & CRC_FLAG
+            and not check_crc16(data[1:-2], data[-2:])
+        ):
+            self.crc_errors += 1
+            logger.warning("Drop message with invalid CRC: {}", bytes(data).hex())
+            return
+
+        self._decode_frame(data)
+
+    def _decode_frame(self, data: memoryview):
+        # the assembler checked the CRC already
+        started_at = time.perf_counter()
+        message = IMSTFrame(data)
+        # the frame formats itself only if the debug level is active
+        logger.debug("Receive new message: {}", message)
 
         self.on_message(message)
+        self.decode_latency.observe(time.perf_counter() - started_at)
 
 
 @dataclass
@@ -173,30 +451,100 @@ class IM871A_USB:
     on_new_message: Callable[[Any, bytes], None] = NOOP
     transport: Optional[SerialTransport] = None
     message_protocol: Optional[MessageProtocol] = None
-    on_radio_message: Callable[[Any, IMSTMessage], None] = NOOP
+    on_radio_message: Callable[[Any, AnyIMSTMessage], None] = NOOP
+    verify_crc: bool = True
+    request_timeout: Optional[float] = 2.0
+    # slots of the AES key table, assigned to the devices by the key slot manager
+    key_table_size: int = 64
+    # records every received frame
+    capture: Optional[CaptureWriter] = None
+    dispatch: DispatchMode = DispatchMode.BATCH
+    # configuration and key table of the last run, to skip the setup at start
+    snapshots: Optional[StickSnapshots] = None
+    # fields of the StickConfig, that watch() writes persistently if they differ
+    desired_config: Dict[str, Any] = field(default_factory=dict)
+    # commands per second to the stick, None writes them as fast as possible
+    command_rate: Optional[float] = None
+    # seconds a request may wait in the command queue, e.g. while the transport
+    # pauses writing, before it fails, None waits forever
+    queue_timeout: Optional[float] = 60.0
+    # bytes in the write buffer of the transport, that pause the command queue
+    write_buffer_limit: int = 1024
 
     def __post_init__(self):
-        self._device_mode = None
-        self._link_mode = None
-        self._manufacturer_id = None
-        self._device_id = None
-        self._auto_rssi_attachment = None
-        self._auto_timestamp_attachment = None
+        # cached configuration, updated by GET_CONFIG responses and SET_CONFIG
+        self.config = StickConfig()
+        # configuration in the non volatile memory, that the stick loads on start,
+        # only this goes into the snapshot
+        self.persisted_config = StickConfig()
+        # fields, that were set without storing them, until a reset
+        self._volatile_fields: Set[str] = set()
+        # persistence and fields of the outstanding SET_CONFIG requests
+        self._pending_configs: Dict[
+            "asyncio.Future[bool]", Tuple[bool, Dict[str, Any]]
+        ] = {}
+        self.info: Optional[DeviceInfo] = None
+        # digests of the loaded keys and of the keys of the outstanding requests
+        self._key_digests: Dict[bytes, str] = {}
+        self._pending_keys: Dict["asyncio.Future[bool]", Tuple[bytes, str]] = {}
+        self._snapshot_timer: Optional[asyncio.TimerHandle] = None
+        # synchronize() got no answer, it runs again after the next response
+        self._sync_pending = False
+        self._sync_task: Optional["asyncio.Task[bool]"] = None
         self._loop = asyncio.get_event_loop()
-        self._serial_coro = serial_asyncio.create_serial_connection(
-            self._loop, MessageProtocol, self.path, baudrate=self.baudrate, timeout=0.1
-        )
+        self._pending_requests: Dict[
+            Tuple[int, bytes], Deque["asyncio.Future[Any]"]
+        ] = {}
         self.keepalive = False
+        self.key_slots = KeySlotManager(self.key_table_size)
+        self.key_reloads = 0
+        self.aes_errors = 0
+        self._reloading_keys: Set[bytes] = set()
+        self.command_queue = CommandQueue(
+            self._write_frame, rate=self.command_rate, loop=self._loop
+        )
 
     @property
     def device_mode(self):
-        return self._device_mode
+        return self.config.device_mode
+
+    @property
+    def rejected_frames(self) -> int:
+        """
+        Count of received frames that were dropped because of an invalid CRC.
+        """
+        if self.message_protocol is None:
+            return 0
+        return self.message_protocol.crc_errors
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Counters and the decode latency histogram of the stick.
+        """
+        stats: Dict[str, Any] = {
+            "aes_errors": self.aes_errors,
+            "key_reloads": self.key_reloads,
+            "command_queue_depth": self.command_queue.depth,
+            "commands_written": self.command_queue.written,
+            "commands_coalesced": self.command_queue.coalesced,
+        }
+        protocol = self.message_protocol
+        if protocol is not None:
+            stats.update(
+                frames_received=protocol.frames_received,
+                bytes_received=protocol.bytes_received,
+                frames_rejected=protocol.crc_errors,
+                dropped_bytes=protocol.assembler.dropped_bytes,
+                write_pauses=protocol.write_pauses,
+                decode_latency=protocol.decode_latency.snapshot(),
+            )
+        return stats
 
     @property
     def link_mode(self) -> int:
-        if self._link_mode is None:
+        if self.config.link_mode is None:
             return -1
-        return self._link_mode
+        return self.config.link_mode
 
     @link_mode.setter
     def link_mode(self, new_link_mode: str):
@@ -212,19 +560,19 @@ class IM871A_USB:
             )
             return
 
-        self.set_device_configuration(b"\x02" + bytes([link_mode_code]) + b"\x00")
+        self.configure(link_mode=link_mode_code)
 
     @property
     def manufacturer_id(self):
-        return self._manufacturer_id
+        return self.config.manufacturer_id
 
     @property
     def device_id(self):
-        return self._device_id
+        return self.config.device_id
 
     @property
     def auto_rssi_attachment(self):
-        return self._auto_rssi_attachment
+        return self.config.auto_rssi_attachment
 
     @auto_rssi_attachment.setter
     def auto_rssi_attachment(self, activate: bool):
@@ -234,11 +582,11 @@ class IM871A_USB:
             logger.error("Tried to set with non bool param. Possible is True and False")
             return
 
-        self.set_device_configuration(b"\x00\x10" + bytes([activate]))
+        self.configure(auto_rssi_attachment=activate)
 
     @property
     def auto_timestamp_attachment(self):
-        return self._auto_timestamp_attachment
+        return self.config.auto_timestamp_attachment
 
     @auto_timestamp_attachment.setter
     def auto_timestamp_attachment(self, activate: bool):
@@ -248,23 +596,153 @@ class IM871A_USB:
             logger.error("Tried to set with non bool param. Possible is True and False")
             return
 
-        self.set_device_configuration(b"\x00\x20" + bytes([activate]))
+        self.configure(auto_timestamp_attachment=activate)
+
+    def pause_reading(self):
+        if self.transport is not None:
+            self.transport.pause_reading()
+
+    def resume_reading(self):
+        if self.transport is not None:
+            self.transport.resume_reading()
 
     def stop_watch(self):
         logger.info("Stop watching input from pywirelessmbus stick iM871a.")
         self.keepalive = False
+        self.cancel_requests()
+        if self.capture is not None:
+            self.capture.flush()
+        if self._snapshot_timer is not None:
+            self.save_snapshot()
+        self._sync_pending = False
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+            self._sync_task = None
 
     async def watch(self):
         logger.info("Start to watch input from pywirelessmbus stick iM871a.")
-        [self.transport, self.message_protocol] = await self._serial_coro
+        connection = serial_asyncio.create_serial_connection(
+            self._loop,
+            lambda: MessageProtocol(
+                verify_crc=self.verify_crc, capture=self.capture, dispatch=self.dispatch
+            ),
+            self.path,
+            baudrate=self.baudrate,
+            timeout=0.1,
+        )
+        [self.transport, self.message_protocol] = await connection
 
         # Register events
         self.message_protocol.on_message = self.process_message
+        self.message_protocol.on_pause_writing = self.command_queue.pause
+        self.message_protocol.on_resume_writing = self.command_queue.resume
+        self.transport.set_write_buffer_limits(high=self.write_buffer_limit)
+
+        if self.snapshots is None and not self.desired_config:
+            # Load config from stick
+            self.get_device_configuration()
+            return
+
+        await self.synchronize()
+
+    async def synchronize(self) -> bool:
+        """
+        Write the fields of desired_config, that differ on the stick, with one
+        persistent SET_CONFIG request. Returns True if the stick was changed.
+
+        With snapshots the configuration and the key table of the last run are
+        used instead of loading the configuration, if the hardware device id of
+        the stick matches.
+
+        If the stick doesn't answer, the synchronisation runs again after the
+        next successful response of the stick.
+        """
+        try:
+            snapshot = None
+            if self.snapshots is not None:
+                info = await self.get_device_infos()
+                if info is not None:
+                    snapshot = self.snapshots.get(info.device_id)
+
+            if snapshot is None:
+                await self.get_device_configuration()
+            else:
+                self.restore_snapshot(snapshot)
+
+            changes = self.config.changes(self.desired_config)
+            if changes:
+                logger.info("Fix the drift of the stick configuration: {}", changes)
+                await self.configure(persistant=True, **changes)
+        except asyncio.TimeoutError as error:
+            logger.warning(
+                "Can't synchronize the stick {}: {} Try again after the next "
+                "response.",
+                self.path,
+                error,
+            )
+            self._sync_pending = True
+            return False
+
+        self.save_snapshot()
+        return bool(changes)
+
+    def restore_snapshot(self, snapshot: StickSnapshot):
+        logger.info("Use the snapshot of stick {}.", snapshot.info.device_id)
+        self.info = snapshot.info
+        self.config.update(snapshot.config.as_dict())
+        self.persisted_config.update(snapshot.config.as_dict())
+
+        for slot, (device_id, digest) in snapshot.key_table.items():
+            address = bytes.fromhex(device_id)
+            self.key_slots.claim(slot, address)
+            self._key_digests[address] = digest
+
+    def save_snapshot(self):
+        if self._snapshot_timer is not None:
+            self._snapshot_timer.cancel()
+            self._snapshot_timer = None
+
+        if self.snapshots is None or self.info is None:
+            return
+
+        key_table = {
+            slot: (device_id.hex(), self._key_digests[device_id])
+            for device_id, slot in self.key_slots.items()
+            if device_id in self._key_digests
+        }
+        self.snapshots.save(
+            StickSnapshot(
+                info=self.info,
+                config=replace(self.persisted_config),
+                key_table=key_table,
+            )
+        )
+
+    def _schedule_snapshot(self):
+        # many keys are stored at once, so write the file only once
+        if self.snapshots is not None and self._snapshot_timer is None:
+            self._snapshot_timer = self._loop.call_later(
+                SNAPSHOT_DELAY, self.save_snapshot
+            )
+
+    async def replay(self, capture_path: str, speed: float = 1.0):
+        """
+        Receive the frames of a capture instead of the serial port, e.g. to test
+        and profile without a stick. Commands to the stick are not answered.
+        """
+        logger.info("Replay the capture {} with speed {}.", capture_path, speed)
+        self.message_protocol = MessageProtocol(
+            verify_crc=self.verify_crc, dispatch=self.dispatch
+        )
+        self.message_protocol.on_message = self.process_message
+        transport = ReplayTransport(capture_path, self.message_protocol, speed=speed)
+        self.transport = transport
 
-        # Load config from stick
-        self.get_device_configuration()
+        await transport.start()
+        # let the decoding of the last frames finish
+        await asyncio.sleep(0)
 
-    def process_message(self, message: IMSTMessage):
+    def process_message(self, message: AnyIMSTMessage):
         if message.endpoint_id == RADIOLINK_ID:
             self.process_radio_message(message)
         elif message.endpoint_id == DEVMGMT_ID:
@@ -278,323 +756,475 @@ class IM871A_USB:
         else:
             logger.warning("Receive message with unknown endpoint id.")
 
-    def process_radio_message(self, message: IMSTMessage):
+    def process_radio_message(self, message: AnyIMSTMessage):
+        payload = message.payload
+        if self.key_slots and payload is not None and len(payload) >= 10:
+            self.key_slots.touch(bytes(payload[2:10]))
         self.on_radio_message(message)
 
-    def process_devicemanagment_message(self, message: IMSTMessage):
+    def process_devicemanagment_message(self, message: AnyIMSTMessage):
+        response: Any = None
+
         if message.message_id == DEVMGMT_MSG_PING_RSP:
             logger.info("Receive a valid ping response from IM871A")
+            response = True
         elif message.message_id == DEVMGMT_MSG_RESET_RES:
+            response = response_status(message)
             logger.info("Receive a valid reset response. Stick will reset soon.")
         elif message.message_id == DEVMGMT_MSG_GET_DEVICEINFO_RES:
-            self.process_device_info_message(message)
+            response = self.process_device_info_message(message)
         elif message.message_id == DEVMGMT_MSG_GET_CONFIG_RES:
-            self.process_device_config_message(message)
+            response = self.process_device_config_message(message)
         elif message.message_id == DEVMGMT_MSG_SET_CONFIG_RES:
+            # the cache is updated from the request, no need to load the config
+            response = response_status(message)
             logger.info(
-                "Receive a valid config set response. Reload config from device."
+                "Set the device configuration. Operation {}",
+                "was successful" if response else "failed",
             )
-            self.get_device_configuration()
         elif message.message_id == DEVMGMT_MSG_SET_AES_DECKEY_RSP:
-            if message.payload is None:
-                logger.error("Receive invalid response for setting AES Key.")
-                return
-
-            status = bool(message.payload[1])
+            response = response_status(message)
             logger.info(
                 "Set the AES Key. Operation {}",
-                "was successful" if status else "failed",
+                "was successful" if response else "failed",
             )
         elif message.message_id == DEVMGMT_MSG_ENABLE_AES_ENCKEY_RSP:
-            if message.payload is None:
-                logger.error(
-                    "Receive invalid response for enable/disable AES encryption."
-                )
-                return
-
-            status = bool(message.payload[1])
+            response = response_status(message)
             logger.info(
                 "Activating/Deactivating the AES Encrytion. Operation {}",
-                "was successful" if status else "failed",
+                "was successful" if response else "failed",
             )
         elif message.message_id == DEVMGMT_MSG_AES_DEC_ERROR_IND:
+            self.aes_errors += 1
             logger.warning(
                 "Failed to decrypt the message a device. Maybe the wrong or no key is stored."
             )
             if message.payload is not None:
                 logger.info("Device Header: {}", message.payload.hex())
+                self.reload_aes_key(bytes(message.payload[2:10]))
+            return
         elif message.message_id == DEVMGMT_MSG_FACTORY_RESET_RES:
-            if message.payload is None:
-                logger.error("Receive invalid response for factory reset.")
-                return
-
-            status = bool(message.payload[1])
+            response = response_status(message)
+            if response:
+                # the factory reset clears the key table
+                self.key_slots.clear()
             logger.info(
                 "Requested the factory reset. Operation {}",
-                "was successful" if status else "failed",
+                "was successful" if response else "failed",
             )
         else:
             logger.warning("Received devicemanagment message is not implemented yet.")
+            return
 
-    def process_device_info_message(self, info_message: IMSTMessage):
-        if info_message.payload is None:
-            logger.warning("Receive device info message with no content.")
+        future = self._resolve_request(message, response)
+        if not response:
             return
 
+        if self._sync_pending:
+            # the stick answers again
+            self._sync_pending = False
+            self._sync_task = self._loop.create_task(self.synchronize())
+
+        if message.message_id == DEVMGMT_MSG_SET_CONFIG_RES:
+            persistant, values = self._pending_configs.pop(future, (False, {}))
+            self.config.update(values)
+            if persistant:
+                self.persisted_config.update(values)
+                self._volatile_fields.difference_update(values)
+                self._schedule_snapshot()
+            else:
+                self._volatile_fields.update(values)
+        elif message.message_id == DEVMGMT_MSG_RESET_RES:
+            # the stick starts again with the stored configuration
+            self.config = replace(self.persisted_config)
+            self._volatile_fields.clear()
+        elif message.message_id == DEVMGMT_MSG_SET_AES_DECKEY_RSP:
+            pending_key = self._pending_keys.pop(future, None)
+            if pending_key is not None:
+                self._key_digests[pending_key[0]] = pending_key[1]
+                self._schedule_snapshot()
+        elif message.message_id == DEVMGMT_MSG_FACTORY_RESET_RES:
+            # the defaults are unknown, the next GET_CONFIG loads them
+            self.config = StickConfig()
+            self.persisted_config = StickConfig()
+            self._volatile_fields.clear()
+            self._key_digests.clear()
+            self._schedule_snapshot()
+
+    def process_device_info_message(
+        self, info_message: AnyIMSTMessage
+    ) -> Optional[DeviceInfo]:
+        if info_message.payload is None or len(info_message.payload) < 9:
+            logger.warning("Receive device info message with no content.")
+            return None
+
+        info = DeviceInfo(
+            module_type=info_message.payload[1],
+            device_mode=info_message.payload[2],
+            firmware_version=info_message.payload[3],
+            hci_version=info_message.payload[4],
+            device_id=info_message.payload[5:9].hex(),
+        )
+
         logger.info("Receive device infos from stick:")
         logger.info("Module Type: {}", info_message.payload[1:2].hex())
 
-        self._device_mode = info_message.payload[2:3].hex()
+        self.info = info
+        self.config.device_mode = info.device_mode
         logger.info("Device Mode: {}", self.device_mode)
 
         logger.info("Firmware: {}", info_message.payload[3:4].hex())
         logger.info("HCI Protocol version: {}", info_message.payload[4:5].hex())
-        logger.info("Device ID: {}", info_message.payload[5:9].hex())
-
-    def process_device_config_message(self, config_message: IMSTMessage):
-        logger.info("Receive device config from stick:")
-        if config_message.payload is None:
-            logger.warning("Receive device config with no content.")
-            return
+        logger.info("Device ID: {}", info.device_id)
 
-        information_indicator_flag = config_message.payload[1]
-        offset = 2
+        return info
 
-        """
-        Device Mode
-        """
-        if information_indicator_flag & 1:
-            self._device_mode = config_message.payload[offset]
-            logger.info("Device Mode: {}", "Meter" if self.device_mode else "Other")
-            offset += 1
-
-        """
-        Link Mode
-        """
-        if information_indicator_flag & 2:
-            self._link_mode = config_message.payload[offset]
-            logger.info("Link Mode: {}", LINK_MODE[self.link_mode])
-            offset += 1
-
-        """
-        WM-Bus C Field
-        """
-        if information_indicator_flag & 4:
+    def process_device_config_message(
+        self, config_message: AnyIMSTMessage
+    ) -> Optional[StickConfig]:
+        if config_message.payload is None or len(config_message.payload) < 2:
+            logger.warning("Receive device config with no content.")
+            return None
+
+        try:
+            values = decode_config(bytes(config_message.payload[1:]))
+        except ValueError as error:
+            logger.warning("Receive invalid device config: {}", error)
+            return None
+
+        self.config.update(values)
+        # without the fields, that the stick loses on a reset
+        self.persisted_config.update(
+            {
+                name: value
+                for name, value in values.items()
+                if name not in self._volatile_fields
+            }
+        )
+        logger.info("Receive device config from stick: {}", values)
+        if "link_mode" in values:
+            logger.info("Link Mode: {}", LINK_MODE.get(values["link_mode"]))
+        if "radio_channel" in values:
+            logger.info("Radio Channel: {}", RF_CHANNEL.get(values["radio_channel"]))
+        if "radio_power_level" in values:
             logger.info(
-                "WM-Bus C Field: {}", config_message.payload[offset : offset + 1].hex()
+                "Radio Power Level: {}", RADIO_POWER.get(values["radio_power_level"])
             )
-            offset += 1
-
-        """
-        Manufacturer ID
-        """
-        if information_indicator_flag & 8:
-            self._manufacturer_id = config_message.payload[offset : offset + 2][
-                ::-1
-            ].hex()
-            logger.info("WM-Bus Manufacturer ID: {}", self._manufacturer_id)
-            offset += 2
 
-        """
-        Device ID
-        """
-        if information_indicator_flag & 16:
-            self._device_id = config_message.payload[offset : offset + 4][::-1].hex()
-            logger.info("WM-Bus Device ID: {}", self.device_id)
-            offset += 4
+        return StickConfig(**values)
 
+    def send_message(
+        self,
+        message: bytes,
+        key: Optional[Hashable] = None,
+        future: Optional["asyncio.Future[Any]"] = None,
+        on_write: Callable[[], None] = NOOP,
+    ) -> bool:
         """
-        WM-Bus Version
+        Queue the frame for the stick. A waiting frame can be replaced by a frame
+        with the same key.
         """
-        if information_indicator_flag & 32:
-            logger.info(
-                "WM-Bus Version: {}", config_message.payload[offset : offset + 1].hex()
-            )
-            offset += 1
+        if self.transport is None:
+            logger.warning("No transport initiliazed. Can't send the message.")
+            return False
 
-        """
-        WM-Bus Device Type
-        """
-        if information_indicator_flag & 64:
-            logger.info(
-                "WM-Bus Device Type: {}",
-                config_message.payload[offset : offset + 1].hex(),
-            )
-            offset += 1
+        self.command_queue.put(Command(message, key, future, on_write))
+        return True
 
-        """
-        Radio Channel
-        """
-        if information_indicator_flag & 128:
-            logger.info("Radio Channel: {}", RF_CHANNEL[config_message.payload[offset]])
-            offset += 1
+    def _write_frame(self, message: bytes):
+        if self.transport is None:
+            logger.warning("Transport closed. Drop the message {}.", message)
+            return
 
-        information_indicator_flag_2 = config_message.payload[offset]
-        offset += 1
+        logger.debug("Send message to RF Module: {}", message)
+        self.transport.write(message)
 
+    def send_request(
+        self,
+        message_id: bytes,
+        response_id: bytes,
+        payload: bytes = b"",
+        timeout: Optional[float] = None,
+        command_key: Optional[Hashable] = None,
+    ) -> "asyncio.Future[Any]":
         """
-        Radio Power Level
-        """
-        if information_indicator_flag_2 & 1:
-            logger.info(
-                "Radio Power Level: {}", RADIO_POWER[config_message.payload[offset]]
-            )
-            offset += 1
+        Send a device managment request and return a future for the decoded response.
 
+        Responses are matched by endpoint and message id. The stick answers in the
+        order of the requests, so several requests can be outstanding at once. The
+        timeout starts, when the request leaves the command queue. A request, that
+        waits longer than queue_timeout in the queue, fails without being sent.
+
+        A written request, that timed out or was cancelled, keeps its place for
+        the timeout once more, so its late response doesn't resolve the next
+        request. Later responses are assumed to be lost.
         """
-        Radio Data Rate
-        """
-        if information_indicator_flag_2 & 2:
-            logger.info(
-                "Radio Data Rate: {}", config_message.payload[offset : offset + 1].hex()
+        future = self._loop.create_future()
+        # the result is optional for the caller, so don't warn about unread errors
+        future.add_done_callback(_consume_exception)
+
+        key = (DEVMGMT_ID, response_id)
+        self._pending_requests.setdefault(key, deque()).append(future)
+
+        timeout = self.request_timeout if timeout is None else timeout
+
+        queue_timer: Optional[asyncio.TimerHandle] = None
+        if self.queue_timeout is not None:
+            queue_timer = self._loop.call_later(
+                self.queue_timeout,
+                self._expire_request,
+                key,
+                future,
+                f"Message id {message_id.hex()} waited {self.queue_timeout} s "
+                "in the command queue.",
             )
-            offset += 1
+            future.add_done_callback(lambda _: queue_timer.cancel())
 
-        """
-        Radio Rx-Window
-        """
-        if information_indicator_flag_2 & 4:
-            logger.info("Radio Rx Window: {} ms", config_message.payload[offset])
-            offset += 1
+        written = False
 
-        """
-        Auto Power Saving
-        """
-        if information_indicator_flag_2 & 8:
-            logger.info("Auto Power Saving: {}", bool(config_message.payload[offset]))
-            offset += 1
+        def discard_request(_):
+            if future not in self._pending_requests[key]:
+                # resolved by its response
+                return
+            if written:
+                self._loop.call_later(
+                    LATE_RESPONSE_WINDOW if timeout is None else timeout,
+                    self._discard_request,
+                    key,
+                    future,
+                )
+            else:
+                self._discard_request(key, future)
 
-        """
-        Auto RSSI Attachment
-        """
-        if information_indicator_flag_2 & 16:
-            self._auto_rssi_attachment = bool(config_message.payload[offset])
-            logger.info("Auto RSSI Attachment: {}", self.auto_rssi_attachment)
-            offset += 1
+        future.add_done_callback(discard_request)
 
-        """
-        Auto Timestamp Attachment
-        """
-        if information_indicator_flag_2 & 32:
-            self._auto_timestamp_attachment = bool(config_message.payload[offset])
-            logger.info("Auto Timestamp Attachment: {}", self.auto_timestamp_attachment)
-            offset += 1
+        def start_timeout():
+            nonlocal written
+            written = True
+            if queue_timer is not None:
+                queue_timer.cancel()
+            if timeout is None or future.done():
+                return
+            timer = self._loop.call_later(
+                timeout,
+                self._expire_request,
+                key,
+                future,
+                f"No response for message id {response_id.hex()} after {timeout} s.",
+            )
+            future.add_done_callback(lambda _: timer.cancel())
 
-        """
-        LED Control
-        """
-        if information_indicator_flag_2 & 64:
-            logger.info("LED Control: {}", bool(config_message.payload[offset]))
-            offset += 1
+        sent = self.send_message(
+            request_frame(message_id, payload), command_key, future, start_timeout
+        )
+        if not sent:
+            future.set_exception(
+                StickNotConnectedError("No transport initiliazed to send the request.")
+            )
 
-        """
-        RTC Control
-        """
-        if information_indicator_flag_2 & 128:
-            logger.info("RTC Control: {}", bool(config_message.payload[offset]))
-            offset += 1
+        return future
+
+    def _expire_request(
+        self, key: Tuple[int, bytes], future: "asyncio.Future[Any]", reason: str
+    ):
+        if not future.done():
+            future.set_exception(asyncio.TimeoutError(reason))
+
+    def _discard_request(self, key: Tuple[int, bytes], future: "asyncio.Future[Any]"):
+        pending = self._pending_requests.get(key)
+        if pending is not None and future in pending:
+            pending.remove(future)
+
+    def _resolve_request(
+        self, message: AnyIMSTMessage, response: Any
+    ) -> Optional["asyncio.Future[Any]"]:
+        pending = self._pending_requests.get((message.endpoint_id, message.message_id))
+        if not pending:
+            return None
+
+        future = pending.popleft()
+        if future.done():
+            # the late response of a request, that timed out or was cancelled
+            logger.warning(
+                "Drop the late response {} of an expired request.",
+                message.message_id.hex(),
+            )
+            return None
 
-    def send_message(self, message: bytes):
-        if self.transport is None:
-            logger.warning("No transport initiliazed. Can't send the message.")
-            return
+        future.set_result(response)
+        return future
 
-        logger.debug("Send message to RF Module: " + str(message))
-        self.transport.write(message)
+    def cancel_requests(self):
+        self.command_queue.clear()
+        for pending in self._pending_requests.values():
+            while pending:
+                pending.popleft().cancel()
 
-    def ping(self):
+    def ping(self, timeout: Optional[float] = None) -> "asyncio.Future[bool]":
         logger.info("Send Ping Command to RF Module")
-        payload_length = b"\x00"
-        control_field = bytes([(0 << 4) + DEVMGMT_ID])
-
-        self.send_message(
-            START_OF_FRAME + control_field + DEVMGMT_MSG_PING_REQ + payload_length
+        return self.send_request(
+            DEVMGMT_MSG_PING_REQ, DEVMGMT_MSG_PING_RSP, timeout=timeout
         )
 
-    def reset(self):
+    def reset(self, timeout: Optional[float] = None) -> "asyncio.Future[bool]":
         logger.info("Request Reset")
-        payload_length = b"\x00"
-        control_field = bytes([(0 << 4) + DEVMGMT_ID])
-
-        self.send_message(
-            START_OF_FRAME + control_field + DEVMGMT_MSG_RESET_REQ + payload_length
+        return self.send_request(
+            DEVMGMT_MSG_RESET_REQ, DEVMGMT_MSG_RESET_RES, timeout=timeout
         )
 
-    def factory_reset(self, reboot: bool = False):
+    def factory_reset(
+        self, reboot: bool = False, timeout: Optional[float] = None
+    ) -> "asyncio.Future[bool]":
         logger.info("Request factory reset")
-        payload_length = b"\x01"
         reboot_flag = b"\x01" if reboot else b"\x00"
-        control_field = bytes([(0 << 4) + DEVMGMT_ID])
-
-        self.send_message(
-            START_OF_FRAME
-            + control_field
-            + DEVMGMT_MSG_FACTORY_RESET_REQ
-            + payload_length
-            + reboot_flag
+
+        return self.send_request(
+            DEVMGMT_MSG_FACTORY_RESET_REQ,
+            DEVMGMT_MSG_FACTORY_RESET_RES,
+            reboot_flag,
+            timeout=timeout,
         )
 
-    def get_device_infos(self):
+    def get_device_infos(
+        self, timeout: Optional[float] = None
+    ) -> "asyncio.Future[Optional[DeviceInfo]]":
         logger.info("Send device info request")
-        payload_length = b"\x00"
-        control_field = bytes([(0 << 4) + DEVMGMT_ID])
-
-        self.send_message(
-            START_OF_FRAME
-            + control_field
-            + DEVMGMT_MSG_GET_DEVICEINFO_REQ
-            + payload_length
+        return self.send_request(
+            DEVMGMT_MSG_GET_DEVICEINFO_REQ,
+            DEVMGMT_MSG_GET_DEVICEINFO_RES,
+            timeout=timeout,
         )
 
-    def get_device_configuration(self):
+    def get_device_configuration(
+        self, timeout: Optional[float] = None
+    ) -> "asyncio.Future[Optional[StickConfig]]":
+        """
+        Ask the stick for its configuration. Resolves with a StickConfig, that
+        is cached as the config of the stick, or None for an invalid response.
+        """
         logger.info("Send device configuration request")
-        payload_length = b"\x00"
-        control_field = bytes([(0 << 4) + DEVMGMT_ID])
-
-        self.send_message(
-            START_OF_FRAME + control_field + DEVMGMT_MSG_GET_CONFIG_REQ + payload_length
+        return self.send_request(
+            DEVMGMT_MSG_GET_CONFIG_REQ, DEVMGMT_MSG_GET_CONFIG_RES, timeout=timeout
         )
 
-    def set_device_configuration(self, configuration: bytes, persistant: bool = False):
+    def set_device_configuration(
+        self,
+        configuration: bytes,
+        persistant: bool = False,
+        timeout: Optional[float] = None,
+    ) -> "asyncio.Future[bool]":
+        """
+        Send the configuration part of a SET_CONFIG request, starting with the
+        first information indicator flag. The cached config is updated from the
+        request, when the stick confirms it.
+        """
         logger.info("Set device configuration")
-        payload_length = bytes([len(configuration) + 1])
-        control_field = bytes([(0 << 4) + DEVMGMT_ID])
         # store persistant
         nvm_flag = b"\x01" if persistant else b"\x00"
 
-        self.send_message(
-            START_OF_FRAME
-            + control_field
-            + DEVMGMT_MSG_SET_CONFIG_REQ
-            + payload_length
-            + nvm_flag
-            + configuration
+        try:
+            values = decode_config(configuration)
+        except ValueError as error:
+            logger.warning("Can't read the configuration for the cache: {}", error)
+            values = {}
+
+        command_key = (DEVMGMT_MSG_SET_CONFIG_REQ, nvm_flag)
+        waiting = self.command_queue.queued(command_key)
+        if values and waiting is not None and waiting.future in self._pending_configs:
+            # the waiting request wasn't sent yet, so it takes the new fields
+            merged = {**self._pending_configs[waiting.future][1], **values}
+            waiting.frame = request_frame(
+                DEVMGMT_MSG_SET_CONFIG_REQ, nvm_flag + encode_config(merged)
+            )
+            self._pending_configs[waiting.future] = (persistant, merged)
+            self.command_queue.coalesced += 1
+
+            future = self._loop.create_future()
+            future.add_done_callback(_consume_exception)
+            waiting.future.add_done_callback(partial(_copy_result, future))
+            return future
+
+        future = self.send_request(
+            DEVMGMT_MSG_SET_CONFIG_REQ,
+            DEVMGMT_MSG_SET_CONFIG_RES,
+            nvm_flag + configuration,
+            timeout=timeout,
+            command_key=command_key if values else None,
         )
+        self._pending_configs[future] = (persistant, values)
+        future.add_done_callback(self._discard_pending_config)
+        return future
+
+    def _discard_pending_config(self, future: "asyncio.Future[bool]"):
+        self._pending_configs.pop(future, None)
 
-    def _change_aes_encryption(self, enable: bool, persistant: bool = False):
+    def configure(
+        self, persistant: bool = False, timeout: Optional[float] = None, **values: Any
+    ) -> "asyncio.Future[bool]":
+        """
+        Set several fields of the StickConfig with one SET_CONFIG request, e.g.
+        configure(link_mode=3, auto_rssi_attachment=True). Fields, that already
+        have the value in the cached config with the outstanding requests applied,
+        are not sent.
+        """
+        unknown = set(values) - set(StickConfig.field_names())
+        if unknown:
+            raise ValueError(
+                f"Unknown configuration fields: {', '.join(sorted(unknown))}"
+            )
+
+        # the non volatile memory gets all fields, it can differ from the cache
+        changes = values if persistant else self._expected_config().changes(values)
+        if not changes:
+            future = self._loop.create_future()
+            future.set_result(True)
+            return future
+
+        return self.set_device_configuration(
+            encode_config(changes), persistant=persistant, timeout=timeout
+        )
+
+    def _expected_config(self) -> StickConfig:
+        """
+        The cached config, after the stick confirmed the outstanding requests.
+        """
+        config = replace(self.config)
+        for _, values in self._pending_configs.values():
+            config.update(values)
+        return config
+
+    def _change_aes_encryption(
+        self, enable: bool, persistant: bool = False, timeout: Optional[float] = None
+    ) -> "asyncio.Future[bool]":
         logger.info("{} the aes encryption.", "Enable " if enable else "Disable ")
 
-        payload_length = b"\x02"
-        control_field = bytes([(0 << 4) + DEVMGMT_ID])
         nvm_flag = b"\x01" if persistant else b"\x00"
         activation_flag = b"\x01" if enable else b"\x00"
 
-        self.send_message(
-            START_OF_FRAME
-            + control_field
-            + DEVMGMT_MSG_ENABLE_AES_ENCKEY_REQ
-            + payload_length
-            + nvm_flag
-            + activation_flag
+        return self.send_request(
+            DEVMGMT_MSG_ENABLE_AES_ENCKEY_REQ,
+            DEVMGMT_MSG_ENABLE_AES_ENCKEY_RSP,
+            nvm_flag + activation_flag,
+            timeout=timeout,
         )
 
-    def enable_aes_encryption(self, persistant: bool = False):
-        self._change_aes_encryption(True, persistant)
-
-    def disable_aes_encryption(self, persistant: bool = False):
-        self._change_aes_encryption(False, persistant)
-
-    def set_aes_decryption_key(self, table_index: int, device_id: str, key: bytes):
+    def enable_aes_encryption(
+        self, persistant: bool = False, timeout: Optional[float] = None
+    ) -> "asyncio.Future[bool]":
+        return self._change_aes_encryption(True, persistant, timeout)
+
+    def disable_aes_encryption(
+        self, persistant: bool = False, timeout: Optional[float] = None
+    ) -> "asyncio.Future[bool]":
+        return self._change_aes_encryption(False, persistant, timeout)
+
+    def set_aes_decryption_key(
+        self,
+        table_index: int,
+        device_id: str,
+        key: bytes,
+        timeout: Optional[float] = None,
+    ) -> "asyncio.Future[bool]":
         """
         Set multiple keys for divices.
         The process activate the decryption. Resetable with factory reset.
@@ -604,16 +1234,71 @@ class IM871A_USB:
             device_id,
             table_index,
         )
+        self.key_slots.claim(table_index, bytes.fromhex(device_id), key)
+
+        return self._send_key(table_index, bytes.fromhex(device_id), key, timeout)
+
+    def store_aes_key(
+        self, device_id: str, key: bytes, timeout: Optional[float] = None
+    ) -> "asyncio.Future[bool]":
+        """
+        Load the key of the device into the key table. The slot is chosen by the
+        key slot manager, if the table is full the least recently heard device
+        loses its slot and its key is loaded again on a decryption error.
+        """
+        address = bytes.fromhex(device_id)
+        if (
+            self._key_digests.get(address) == key_digest(key)
+            and address in self.key_slots
+        ):
+            # the stick has the key already, e.g. from the snapshot
+            self.key_slots.assign(address, key)
+            future = self._loop.create_future()
+            future.set_result(True)
+            return future
+
+        slot, evicted = self.key_slots.assign(address, key)
+        if evicted is not None:
+            logger.info(
+                "Key table is full. Replace the key of device {} in slot {}.",
+                evicted.hex(),
+                slot,
+            )
 
-        payload_length = b"\x19"
-        control_field = bytes([(0 << 4) + DEVMGMT_ID])
-
-        self.send_message(
-            START_OF_FRAME
-            + control_field
-            + DEVMGMT_MSG_SET_AES_DECKEY_REQ
-            + payload_length
-            + bytes([table_index])
-            + bytes.fromhex(device_id)
-            + key
+        logger.info("Set decryption key for device {} on slot {}.", device_id, slot)
+        return self._send_key(slot, address, key, timeout)
+
+    def _send_key(
+        self, slot: int, address: bytes, key: bytes, timeout: Optional[float]
+    ) -> "asyncio.Future[bool]":
+        # the key isn't known as loaded until the stick confirms it
+        self._key_digests.pop(address, None)
+        future = self.send_request(
+            DEVMGMT_MSG_SET_AES_DECKEY_REQ,
+            DEVMGMT_MSG_SET_AES_DECKEY_RSP,
+            bytes([slot]) + address + key,
+            timeout=timeout,
         )
+        self._pending_keys[future] = (address, key_digest(key))
+        future.add_done_callback(self._discard_pending_key)
+        return future
+
+    def _discard_pending_key(self, future: "asyncio.Future[bool]"):
+        self._pending_keys.pop(future, None)
+
+    def reload_aes_key(self, device_id: bytes) -> Optional["asyncio.Future[bool]"]:
+        """
+        Load a known key again, after the stick failed to decrypt a telegram.
+        """
+        key = self.key_slots.key(device_id)
+        if key is None or device_id in self._reloading_keys:
+            return None
+
+        logger.info("Reload the AES key of device {}.", device_id.hex())
+        self.key_reloads += 1
+        # the stick lost the key, even if it was confirmed before
+        self._key_digests.pop(device_id, None)
+        self._reloading_keys.add(device_id)
+        future = self.store_aes_key(device_id.hex(), key)
+        future.add_done_callback(lambda _: self._reloading_keys.discard(device_id))
+        return future
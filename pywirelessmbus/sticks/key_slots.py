@@ -0,0 +1,115 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+
+class KeySlotManager:
+    """
+    Assignment of the slots in the AES key table of a stick to devices.
+
+    The loaded devices are kept in the order they were last heard. If the table is
+    full, the slot of the least recently heard device is given to the new one. The
+    keys of all devices are kept, so an evicted key can be loaded again.
+    """
+
+    def __init__(self, size: int = 64):
+        if size < 1:
+            raise ValueError("The key table needs at least one slot.")
+
+        self.size = size
+        self.evictions = 0
+        # device address -> slot, least recently heard first
+        self._slots: Dict[bytes, int] = OrderedDict()
+        self._keys: Dict[bytes, bytes] = {}
+        self._free: List[int] = list(range(size - 1, -1, -1))
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, device_id: bytes) -> bool:
+        return device_id in self._slots
+
+    def slot(self, device_id: bytes) -> Optional[int]:
+        return self._slots.get(device_id)
+
+    def key(self, device_id: bytes) -> Optional[bytes]:
+        return self._keys.get(device_id)
+
+    def items(self) -> List[Tuple[bytes, int]]:
+        """
+        Devices with their slot, least recently heard first.
+        """
+        return list(self._slots.items())
+
+    def owner(self, slot: int) -> Optional[bytes]:
+        for device_id, owned_slot in self._slots.items():
+            if owned_slot == slot:
+                return device_id
+        return None
+
+    def touch(self, device_id: bytes) -> bool:
+        """
+        Mark the device as heard, True if its key is loaded.
+        """
+        if device_id not in self._slots:
+            return False
+        self._slots.move_to_end(device_id)
+        return True
+
+    def assign(self, device_id: bytes, key: bytes) -> Tuple[int, Optional[bytes]]:
+        """
+        Slot for the key of the device and the device that lost the slot.
+        """
+        self._keys[device_id] = key
+
+        slot = self._slots.get(device_id)
+        if slot is not None:
+            self._slots.move_to_end(device_id)
+            return slot, None
+
+        evicted = None
+        if self._free:
+            slot = self._free.pop()
+        else:
+            evicted, slot = self._slots.popitem(last=False)
+            self.evictions += 1
+
+        self._slots[device_id] = slot
+        return slot, evicted
+
+    def claim(self, slot: int, device_id: bytes, key: Optional[bytes] = None):
+        """
+        Record a key, that was written to a given slot without the manager. Without
+        key the slot is only marked as used, e.g. for a key table from a snapshot.
+        """
+        if not 0 <= slot < self.size:
+            return
+
+        if key is not None:
+            self._keys[device_id] = key
+        previous_slot = self._slots.pop(device_id, None)
+        if previous_slot is not None and previous_slot != slot:
+            self._free.append(previous_slot)
+
+        owner = self.owner(slot)
+        if owner is not None:
+            del self._slots[owner]
+        elif slot in self._free:
+            self._free.remove(slot)
+
+        self._slots[device_id] = slot
+
+    def release(self, device_id: bytes):
+        """
+        Forget the device and its key.
+        """
+        self._keys.pop(device_id, None)
+        slot = self._slots.pop(device_id, None)
+        if slot is not None:
+            self._free.append(slot)
+
+    def clear(self):
+        """
+        Mark all slots as free, e.g. after a factory reset. The keys are kept.
+        """
+        self._slots.clear()
+        self._free = list(range(self.size - 1, -1, -1))
@@ -1,3 +1,15 @@
 class MockStick:
     def set_aes_decryption_key(self, table_index: int, device_id: str, key: bytes):
         pass
+
+    def store_aes_key(self, device_id: str, key: bytes):
+        pass
+
+    def pause_reading(self):
+        pass
+
+    def resume_reading(self):
+        pass
+
+    def stop_watch(self):
+        pass
@@ -0,0 +1,218 @@
+"""
+Bulk loading of AES keys into an IM871A, e.g. to commission the meters of a
+building from a key file.
+
+    pywirelessmbus-provision /dev/ttyUSB0 keys.csv --window 8
+"""
+import argparse
+import asyncio
+import csv
+import json
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+from pywirelessmbus.exceptions import StickNotConnectedError
+from pywirelessmbus.sticks.im871a import IM871A_USB
+from pywirelessmbus.sticks.snapshot import StickSnapshots
+from pywirelessmbus.utils.utils import NOOP
+
+# manufacturer, id, version and type of the meter
+DEVICE_ID_LENGTH = 8
+KEY_LENGTH = 16
+
+
+@dataclass
+class KeyStatus:
+    device_id: str
+    success: bool = False
+    attempts: int = 0
+    error: Optional[str] = None
+
+
+def _parse_entry(device_id: Any, key: Any, position: str) -> Tuple[str, bytes]:
+    try:
+        address = bytes.fromhex(str(device_id).strip())
+        key_bytes = bytes.fromhex(str(key).strip())
+    except ValueError:
+        raise ValueError(f"Invalid hex value in {position}.")
+
+    if len(address) != DEVICE_ID_LENGTH:
+        raise ValueError(f"The device id in {position} needs {DEVICE_ID_LENGTH} bytes.")
+    if len(key_bytes) != KEY_LENGTH:
+        raise ValueError(f"The key in {position} needs {KEY_LENGTH} bytes.")
+
+    return address.hex(), key_bytes
+
+
+def _read_csv(key_file) -> Iterable[Tuple[str, bytes]]:
+    for line_number, row in enumerate(csv.reader(key_file), start=1):
+        if not row or not "".join(row).strip() or row[0].lstrip().startswith("#"):
+            continue
+        if line_number == 1 and row[0].strip().lower() == "device_id":
+            # header
+            continue
+        if len(row) < 2:
+            raise ValueError(f"Line {line_number} needs a device id and a key.")
+        yield _parse_entry(row[0], row[1], f"line {line_number}")
+
+
+def _read_json(key_file) -> Iterable[Tuple[str, bytes]]:
+    data = json.load(key_file)
+    if isinstance(data, dict):
+        for device_id, key in data.items():
+            yield _parse_entry(device_id, key, f"entry {device_id}")
+    elif isinstance(data, list):
+        for index, entry in enumerate(data):
+            try:
+                yield _parse_entry(entry["device_id"], entry["key"], f"entry {index}")
+            except (KeyError, TypeError):
+                raise ValueError(f"Entry {index} needs a device_id and a key.")
+    else:
+        raise ValueError("The key file needs an object or a list of entries.")
+
+
+def load_key_file(path: str) -> Dict[str, bytes]:
+    """
+    Keys by device id as hex string. CSV files have the columns device_id and
+    key, JSON files map the device ids to the keys or list objects with
+    device_id and key. A later entry of a device replaces an earlier one.
+    """
+    with open(path, newline="") as key_file:
+        if path.lower().endswith(".json"):
+            entries = list(_read_json(key_file))
+        else:
+            entries = list(_read_csv(key_file))
+
+    keys: Dict[str, bytes] = {}
+    for device_id, key in entries:
+        if device_id in keys:
+            logger.warning("Key file contains device {} twice.", device_id)
+        keys[device_id] = key
+    return keys
+
+
+async def provision_keys(
+    stick: IM871A_USB,
+    keys: Dict[str, bytes],
+    window: int = 8,
+    retries: int = 2,
+    timeout: Optional[float] = None,
+    on_status: Callable[[KeyStatus], None] = NOOP,
+) -> List[KeyStatus]:
+    """
+    Load the keys with up to window requests outstanding, so the stick is kept
+    busy instead of waiting for every response. Rejected and unanswered keys
+    are sent again up to retries times. Returns the status of every key in the
+    order of keys.
+
+    The slots are assigned by the key slot manager of the stick. With more keys
+    than slots, the keys of the least recently heard devices are loaded again
+    when their telegrams arrive.
+    """
+    if window < 1:
+        raise ValueError("The window needs at least one request.")
+    if len(keys) > stick.key_slots.size:
+        logger.warning(
+            "{} keys for {} slots, the keys loaded first are replaced.",
+            len(keys),
+            stick.key_slots.size,
+        )
+
+    statuses = [KeyStatus(device_id) for device_id in keys]
+    entries = iter(statuses)
+
+    async def load(status: KeyStatus):
+        key = keys[status.device_id]
+        while status.attempts <= retries:
+            status.attempts += 1
+            try:
+                if await stick.store_aes_key(status.device_id, key, timeout=timeout):
+                    status.success = True
+                    status.error = None
+                    return
+                status.error = "rejected by the stick"
+            except asyncio.TimeoutError:
+                status.error = "no response"
+            except StickNotConnectedError as error:
+                status.error = str(error)
+                return
+            logger.warning(
+                "Loading the key of device {} failed: {}",
+                status.device_id,
+                status.error,
+            )
+
+    async def worker():
+        # the workers share the iterator, so every key is loaded by one of them
+        for status in entries:
+            await load(status)
+            on_status(status)
+
+    await asyncio.gather(*(worker() for _ in range(min(window, len(statuses)))))
+    return statuses
+
+
+async def _provision(arguments: argparse.Namespace, keys: Dict[str, bytes]):
+    stick = IM871A_USB(
+        arguments.path,
+        baudrate=arguments.baudrate,
+        request_timeout=arguments.timeout,
+        snapshots=StickSnapshots(arguments.snapshots) if arguments.snapshots else None,
+    )
+    try:
+        await stick.watch()
+        return await provision_keys(
+            stick,
+            keys,
+            window=arguments.window,
+            retries=arguments.retries,
+            on_status=_print_status,
+        )
+    finally:
+        # writes the snapshot with the loaded keys
+        stick.stop_watch()
+        stick.pause_reading()
+        if stick.transport is not None:
+            # releases the serial port
+            stick.transport.close()
+
+
+def _print_status(status: KeyStatus):
+    result = "ok" if status.success else f"failed ({status.error})"
+    print(f"{status.device_id} {result} after {status.attempts} attempts", flush=True)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Load the AES keys of a CSV or JSON key file into an IM871A."
+    )
+    parser.add_argument("path", help="serial port of the stick")
+    parser.add_argument("key_file", help="CSV or JSON file with device ids and keys")
+    parser.add_argument("--baudrate", type=int, default=57600)
+    parser.add_argument(
+        "--window", type=int, default=8, help="outstanding requests at once"
+    )
+    parser.add_argument("--retries", type=int, default=2, help="retries per key")
+    parser.add_argument(
+        "--timeout", type=float, default=2.0, help="seconds to wait for a response"
+    )
+    parser.add_argument(
+        "--snapshots", help="snapshot file of the stick, to skip loaded keys"
+    )
+    arguments = parser.parse_args(argv)
+
+    try:
+        keys = load_key_file(arguments.key_file)
+    except (OSError, ValueError) as error:
+        parser.error(str(error))
+
+    statuses = asyncio.run(_provision(arguments, keys))
+    failed = sum(not status.success for status in statuses)
+    print(f"Loaded {len(statuses) - failed} of {len(statuses)} keys.")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
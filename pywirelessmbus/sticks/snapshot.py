@@ -0,0 +1,113 @@
+"""
+Snapshots of the sticks on disk, so a restarted gateway knows the configuration
+and the key table of a stick without asking it and without loading it again.
+"""
+import hashlib
+import json
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+from loguru import logger
+
+from pywirelessmbus.sticks.config import DeviceInfo, StickConfig
+
+VERSION = 1
+
+
+def key_digest(key: bytes) -> str:
+    """
+    Fingerprint of an AES key, the snapshot never contains the keys themselves.
+    """
+    return hashlib.sha256(key).hexdigest()
+
+
+@dataclass
+class StickSnapshot:
+    info: DeviceInfo
+    config: StickConfig
+    # slot -> device id as hex and digest of the key
+    key_table: Dict[int, Tuple[str, str]] = field(default_factory=dict)
+    updated_at: float = 0.0
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "info": asdict(self.info),
+            "config": self.config.as_dict(),
+            "key_table": {
+                str(slot): list(entry) for slot, entry in self.key_table.items()
+            },
+            "updated_at": self.updated_at,
+        }
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "StickSnapshot":
+        return cls(
+            info=DeviceInfo(**data["info"]),
+            config=StickConfig(**data["config"]),
+            key_table={
+                int(slot): (entry[0], entry[1])
+                for slot, entry in data.get("key_table", {}).items()
+            },
+            updated_at=data.get("updated_at", 0.0),
+        )
+
+
+class StickSnapshots:
+    """
+    JSON file with the snapshots of the sticks, by the hardware device id of the
+    stick. Written with a rename, so a crash leaves the old or the new file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._snapshots: Dict[str, StickSnapshot] = {}
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._snapshots)
+
+    def _load(self):
+        try:
+            with open(self.path) as snapshot_file:
+                data = json.load(snapshot_file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as error:
+            logger.warning("Ignore the stick snapshots {}: {}", self.path, error)
+            return
+
+        if data.get("version") != VERSION:
+            logger.warning("Ignore the stick snapshots of an other version.")
+            return
+
+        for device_id, snapshot in data.get("sticks", {}).items():
+            try:
+                self._snapshots[device_id] = StickSnapshot.from_json(snapshot)
+            except (KeyError, TypeError, IndexError) as error:
+                logger.warning(
+                    "Ignore invalid snapshot of stick {}: {}", device_id, error
+                )
+
+    def get(self, device_id: str) -> Optional[StickSnapshot]:
+        return self._snapshots.get(device_id)
+
+    def save(self, snapshot: StickSnapshot):
+        snapshot.updated_at = time.time()
+        self._snapshots[snapshot.info.device_id] = snapshot
+
+        data = {
+            "version": VERSION,
+            "sticks": {
+                device_id: snapshot.to_json()
+                for device_id, snapshot in self._snapshots.items()
+            },
+        }
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "w") as snapshot_file:
+            json.dump(data, snapshot_file, indent=2)
+        os.replace(temporary_path, self.path)
+
+    def remove(self, device_id: str):
+        self._snapshots.pop(device_id, None)
@@ -1,3 +1,8 @@
-from pywirelessmbus.utils.message import IMSTMessage, WMbusMessage
+from pywirelessmbus.utils.message import (
+    AnyIMSTMessage,
+    IMSTFrame,
+    IMSTMessage,
+    WMbusMessage,
+)
 
-__all__ = ["IMSTMessage", "WMbusMessage"]
+__all__ = ["IMSTMessage", "IMSTFrame", "AnyIMSTMessage", "WMbusMessage"]
@@ -0,0 +1,234 @@
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Dict, Optional, Tuple, Union
+
+from pywirelessmbus.exceptions import DecryptionError
+
+try:
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    from cryptography.hazmat.primitives.cmac import CMAC
+except ImportError:  # pragma: no cover - optional dependency
+    Cipher = None
+
+# CI fields of the transport layer
+CI_SHORT_HEADER = 0x7A
+CI_LONG_HEADER = 0x72
+CI_AFL = 0x90
+
+# AFL fragmentation control flags
+AFL_MCL_PRESENT = 0x2000
+AFL_KI_PRESENT = 0x0200
+AFL_MCR_PRESENT = 0x1000
+
+SECURITY_MODE_NONE = 0
+SECURITY_MODE_5 = 5
+SECURITY_MODE_7 = 7
+
+BLOCK_SIZE = 16
+DECRYPTION_CHECK = b"\x2f\x2f"
+
+
+def _require_cryptography():
+    if Cipher is None:
+        raise ImportError(
+            "The software decryption needs the package cryptography. "
+            "Install it with: pip install pywirelessmbus[aes]"
+        )
+
+
+def _to_bytes(value: Union[str, bytes]) -> bytes:
+    return bytes.fromhex(value) if isinstance(value, str) else bytes(value)
+
+
+class KeyStore:
+    """
+    AES keys of the devices, addressed like the devices of WMbus.
+
+    The address are the bytes 2 to 10 of the payload (manufacturer, id, version
+    and device type) or the same as hex string like Device.id.
+    """
+
+    def __init__(
+        self, keys: Optional[Dict[Union[str, bytes], Union[str, bytes]]] = None
+    ):
+        self._keys: Dict[bytes, bytes] = {}
+        for address, key in (keys or {}).items():
+            self.add(address, key)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, address: Union[str, bytes]) -> bool:
+        return _to_bytes(address) in self._keys
+
+    def add(self, address: Union[str, bytes], key: Union[str, bytes]):
+        key = _to_bytes(key)
+        if len(key) != BLOCK_SIZE:
+            raise ValueError("AES-128 keys are 16 bytes long.")
+        self._keys[_to_bytes(address)] = key
+
+    def remove(self, address: Union[str, bytes]):
+        self._keys.pop(_to_bytes(address), None)
+
+    def get(self, address: bytes) -> Optional[bytes]:
+        return self._keys.get(address)
+
+
+def transport_header(payload: bytes) -> Tuple[int, Optional[int]]:
+    """
+    Offset of the transport layer CI field and the message counter of the AFL.
+    """
+    if payload[10] != CI_AFL:
+        return 10, None
+
+    afl_length = payload[11]
+    fragmentation_control = int.from_bytes(payload[12:14], "little")
+    offset = 14
+    message_counter = None
+
+    if fragmentation_control & AFL_MCL_PRESENT:
+        offset += 1
+    if fragmentation_control & AFL_KI_PRESENT:
+        offset += 2
+    if fragmentation_control & AFL_MCR_PRESENT:
+        message_counter = int.from_bytes(payload[offset : offset + 4], "little")
+
+    return 12 + afl_length, message_counter
+
+
+def security_mode(payload: bytes) -> int:
+    """
+    Security mode of the configuration word, 0 for unencrypted or unknown telegrams.
+    """
+    if len(payload) < 15:
+        return SECURITY_MODE_NONE
+
+    offset, _ = transport_header(payload)
+    if offset >= len(payload):
+        return SECURITY_MODE_NONE
+
+    ci_field = payload[offset]
+    if ci_field == CI_SHORT_HEADER:
+        configuration_offset = offset + 3
+    elif ci_field == CI_LONG_HEADER:
+        configuration_offset = offset + 11
+    else:
+        return SECURITY_MODE_NONE
+
+    if configuration_offset + 2 > len(payload):
+        return SECURITY_MODE_NONE
+
+    return payload[configuration_offset + 1] & 0x1F
+
+
+def _decrypt_cbc(key: bytes, iv: bytes, data: bytes) -> bytes:
+    decryptor = Cipher(algorithms.AES(key), modes.CBC(iv)).decryptor()
+    return decryptor.update(data) + decryptor.finalize()
+
+
+def derive_mode7_key(key: bytes, message_counter: int, device_id: bytes) -> bytes:
+    """
+    Ephemeral encryption key of security mode 7 (EN 13757-7), derived with AES-CMAC.
+    """
+    cmac = CMAC(algorithms.AES(key))
+    cmac.update(
+        b"\x00" + message_counter.to_bytes(4, "little") + device_id + b"\x07" * 7
+    )
+    return cmac.finalize()
+
+
+def decrypt_telegram(payload: bytes, key: bytes) -> bytes:
+    """
+    Payload with the encrypted blocks replaced by the decrypted data.
+
+    Supports security mode 5 (AES-CBC, IV from address and access number) and
+    mode 7 (AES-CBC with a key derived from the message counter of the AFL).
+    The MAC of mode 7 telegrams is not verified.
+    """
+    _require_cryptography()
+
+    offset, message_counter = transport_header(payload)
+    if offset + 3 >= len(payload):
+        raise DecryptionError("Telegram is too short for a transport layer header.")
+
+    ci_field = payload[offset]
+    if ci_field == CI_SHORT_HEADER:
+        # address of the link layer
+        address = payload[2:10]
+        access_number = payload[offset + 1]
+        configuration_offset = offset + 3
+    elif ci_field == CI_LONG_HEADER:
+        # address of the transport layer: id, manufacturer, version, type
+        header = payload[offset + 1 : offset + 9]
+        address = header[4:6] + header[0:4] + header[6:8]
+        access_number = payload[offset + 9]
+        configuration_offset = offset + 11
+    else:
+        raise DecryptionError(f"Unsupported CI field {ci_field:02x} for decryption.")
+
+    configuration = payload[configuration_offset : configuration_offset + 2]
+    mode = configuration[1] & 0x1F
+    blocks = configuration[0] >> 4
+    start = configuration_offset + 2
+
+    if mode == SECURITY_MODE_5:
+        iv = bytes(address) + bytes([access_number]) * 8
+    elif mode == SECURITY_MODE_7:
+        if message_counter is None:
+            raise DecryptionError("Mode 7 telegram without message counter.")
+        key = derive_mode7_key(key, message_counter, bytes(address[2:6]))
+        iv = bytes(BLOCK_SIZE)
+        # configuration field extension
+        start += 1
+    else:
+        raise DecryptionError(f"Unsupported security mode {mode}.")
+
+    if payload[start : start + 2] == DECRYPTION_CHECK:
+        # already decrypted by the stick
+        return bytes(payload)
+
+    length = blocks * BLOCK_SIZE
+    if not length:
+        length = (len(payload) - start) // BLOCK_SIZE * BLOCK_SIZE
+    if length == 0 or start + length > len(payload):
+        raise DecryptionError("Telegram is too short for the encrypted blocks.")
+
+    decrypted = _decrypt_cbc(key, iv, bytes(payload[start : start + length]))
+    if not decrypted.startswith(DECRYPTION_CHECK):
+        raise DecryptionError("Decrypted data doesn't start with 2F2F. Wrong key?")
+
+    return bytes(payload[:start]) + decrypted + bytes(payload[start + length :])
+
+
+class AESDecryptor:
+    """
+    Decrypts telegrams with the keys of a KeyStore on an executor.
+
+    Without executor a thread pool is created, so the decryption runs beside the
+    event loop. A process pool can be passed for many encrypted meters.
+    """
+
+    def __init__(
+        self,
+        key_store: KeyStore,
+        executor: Optional[Executor] = None,
+        max_workers: int = 2,
+    ):
+        _require_cryptography()
+        self.key_store = key_store
+        self._own_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="pywirelessmbus-aes"
+        )
+
+    def submit(self, address: bytes, payload: bytes) -> Optional["Future[bytes]"]:
+        """
+        Future for the decrypted payload or None if no key is stored for the address.
+        """
+        key = self.key_store.get(address)
+        if key is None:
+            return None
+        return self.executor.submit(decrypt_telegram, bytes(payload), key)
+
+    def shutdown(self):
+        if self._own_executor:
+            self.executor.shutdown(wait=False)
@@ -0,0 +1,54 @@
+import asyncio
+from typing import Any, Callable, List, Optional, Tuple
+
+
+class MessageBatcher:
+    """
+    Collects processed radio messages and hands them over as a list of
+    (device, message) pairs, e.g. for bulk inserts into a database.
+
+    A batch is flushed when it has max_size messages or its first message waits
+    max_latency seconds, whatever comes first.
+    """
+
+    def __init__(
+        self,
+        on_batch: Callable[[List[Tuple[Any, Any]]], None],
+        max_size: int = 100,
+        max_latency: float = 1.0,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+    ):
+        if max_size < 1:
+            raise ValueError("A batch needs a size of at least one message.")
+
+        self.on_batch = on_batch
+        self.max_size = max_size
+        self.max_latency = max_latency
+        self.batches = 0
+        self._loop = loop or asyncio.get_event_loop()
+        self._items: List[Tuple[Any, Any]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def add(self, device: Any, message: Any):
+        self._items.append((device, message))
+
+        if len(self._items) >= self.max_size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = self._loop.call_later(self.max_latency, self.flush)
+
+    def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        if not self._items:
+            return
+
+        items = self._items
+        self._items = []
+        self.batches += 1
+        self.on_batch(items)
@@ -0,0 +1,161 @@
+"""
+Capture of the raw HCI frames of a stick and replay of a capture.
+
+A capture file starts with the magic bytes, followed by one record per frame:
+the monotonic time of the reception in nanoseconds (8 bytes), the length of the
+frame (2 bytes), both little endian, and the frame itself. Records are only
+appended, so a capture can be continued and read while it grows.
+"""
+import asyncio
+import os
+import struct
+import time
+from typing import BinaryIO, Iterator, Optional, Tuple, Union
+
+from loguru import logger
+
+MAGIC = b"WMBCAP01"
+RECORD_HEADER = struct.Struct("<QH")
+
+
+class CaptureWriter:
+    """
+    Appends frames to a capture file.
+    """
+
+    def __init__(self, path: Union[str, "os.PathLike[str]"], buffering: int = 65536):
+        self.path = path
+        self.frames = 0
+        self._file: Optional[BinaryIO] = open(path, "ab", buffering=buffering)
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+
+    @property
+    def closed(self) -> bool:
+        return self._file is None
+
+    def write(self, frame: Union[bytes, memoryview], timestamp: Optional[int] = None):
+        if self._file is None:
+            return
+
+        if timestamp is None:
+            timestamp = time.monotonic_ns()
+        self._file.write(RECORD_HEADER.pack(timestamp, len(frame)))
+        self._file.write(frame)
+        self.frames += 1
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def read_capture(path: Union[str, "os.PathLike[str]"]) -> Iterator[Tuple[int, bytes]]:
+    """
+    Timestamp in nanoseconds and frame of every record in the capture.
+    """
+    with open(path, "rb") as capture:
+        if capture.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a capture file.")
+
+        while True:
+            header = capture.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            timestamp, length = RECORD_HEADER.unpack(header)
+            frame = capture.read(length)
+            if len(frame) < length:
+                logger.warning("Capture {} ends with an incomplete frame.", path)
+                return
+            yield timestamp, frame
+
+
+class ReplayTransport(asyncio.Transport):
+    """
+    Transport, that feeds the frames of a capture into a protocol.
+
+    With speed 1 the frames keep the gaps of the capture, with speed 10 they come ten
+    times faster and with speed 0 as fast as possible. Written data is dropped.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, "os.PathLike[str]"],
+        protocol: asyncio.Protocol,
+        speed: float = 1.0,
+    ):
+        super().__init__()
+        self.path = path
+        self.speed = speed
+        self.frames = 0
+        self._protocol = protocol
+        self._reading = asyncio.Event()
+        self._reading.set()
+        self._closing = False
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    def start(self) -> "asyncio.Task[None]":
+        self._protocol.connection_made(self)
+        self._task = asyncio.ensure_future(self._replay())
+        return self._task
+
+    async def wait_finished(self):
+        if self._task is not None:
+            await asyncio.shield(self._task)
+
+    async def _replay(self):
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        first_timestamp = None
+
+        for timestamp, frame in read_capture(self.path):
+            if self._closing:
+                return
+
+            if first_timestamp is None:
+                first_timestamp = timestamp
+
+            if self.speed > 0:
+                due = started_at + (timestamp - first_timestamp) / 1e9 / self.speed
+                delay = due - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            elif self.frames % 256 == 0:
+                # give the tasks of the decoded frames a chance to run
+                await asyncio.sleep(0)
+
+            if not self._reading.is_set():
+                paused_at = loop.time()
+                await self._reading.wait()
+                started_at += loop.time() - paused_at
+
+            self._protocol.data_received(frame)
+            self.frames += 1
+
+        logger.info("Replayed {} frames from {}", self.frames, self.path)
+
+    def write(self, data):
+        pass
+
+    def is_reading(self) -> bool:
+        return self._reading.is_set()
+
+    def pause_reading(self):
+        self._reading.clear()
+
+    def resume_reading(self):
+        self._reading.set()
+
+    def is_closing(self) -> bool:
+        return self._closing
+
+    def close(self):
+        self._closing = True
+        self._reading.set()
+
+    def get_write_buffer_size(self) -> int:
+        return 0
@@ -0,0 +1,31 @@
+from binascii import crc_hqx
+from typing import Union
+
+CRC16_INIT = 0xFFFF
+
+# Bit reversed value for every byte. Used to calculate the reflected CRC-16 of the
+# stick with the (not reflected) CRC-CCITT implementation of binascii.
+REVERSED_BITS = bytes(int(f"{byte:08b}"[::-1], 2) for byte in range(256))
+
+
+def _reverse_16(value: int) -> int:
+    return (REVERSED_BITS[value & 0xFF] << 8) | REVERSED_BITS[value >> 8]
+
+
+def crc16(data: Union[bytes, memoryview]) -> int:
+    """
+    CRC-16 of the IMST HCI protocol (polynomial 0x1021 reflected, start 0xFFFF, inverted).
+
+    The bytes are mirrored with a precomputed table and the checksum is calculated
+    by binascii in C, so no python code runs per byte.
+    """
+    if not isinstance(data, bytes):
+        data = bytes(data)
+    return _reverse_16(crc_hqx(data.translate(REVERSED_BITS), CRC16_INIT)) ^ 0xFFFF
+
+
+def check_crc16(data: Union[bytes, memoryview], crc: Union[bytes, memoryview]) -> bool:
+    """
+    Compare the checksum of data with the CRC field of a frame (low byte first).
+    """
+    return crc16(data) == int.from_bytes(crc, "little")
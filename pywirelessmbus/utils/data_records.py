@@ -0,0 +1,313 @@
+"""
+Decoder for the data records of the application layer (EN 13757-3).
+
+Every record starts with a DIF and optional DIFEs, followed by a VIF with optional
+VIFEs and the data. Length, coding, unit and scale come from tables that are built
+once at import, so decoding a telegram is a single pass over its bytes.
+"""
+import calendar
+import struct
+import time
+from typing import List, NamedTuple, Optional, Tuple
+
+from loguru import logger
+
+from pywirelessmbus.utils.aes import CI_LONG_HEADER, CI_SHORT_HEADER, transport_header
+from pywirelessmbus.utils.message import Value, ValueType
+
+# CI field without transport layer header
+CI_NO_HEADER = 0x78
+
+# Coding of the data field
+NO_DATA = 0
+INTEGER = 1
+BCD = 2
+REAL = 3
+VARIABLE = 4
+DATE = 5
+DATE_TIME = 6
+
+# DIF values with special meaning
+DIF_MANUFACTURER_DATA = 0x0F
+DIF_MORE_RECORDS_FOLLOW = 0x1F
+DIF_IDLE_FILLER = 0x2F
+
+# Extension tables
+VIF_TABLE_FB = 0xFB
+VIF_TABLE_FD = 0xFD
+VIF_PLAIN_TEXT = 0x7C
+VIF_MANUFACTURER = 0x7F
+
+# data field code -> (length, coding)
+DATA_FIELDS: Tuple[Tuple[int, int], ...] = (
+    (0, NO_DATA),
+    (1, INTEGER),
+    (2, INTEGER),
+    (3, INTEGER),
+    (4, INTEGER),
+    (4, REAL),
+    (6, INTEGER),
+    (8, INTEGER),
+    (0, NO_DATA),  # selection for readout
+    (1, BCD),
+    (2, BCD),
+    (3, BCD),
+    (4, BCD),
+    (-1, VARIABLE),
+    (6, BCD),
+    (0, NO_DATA),  # special functions
+)
+
+
+class Unit(NamedTuple):
+    unit: str
+    exponent: int
+    type: ValueType
+    coding: Optional[int] = None
+
+
+UNKNOWN_UNIT = Unit("unset", 0, ValueType.UNKNOWN)
+TIME_UNITS = ("s", "min", "h", "d")
+
+
+def _build_primary_table() -> Tuple[Unit, ...]:
+    table = [UNKNOWN_UNIT] * 128
+
+    def scale(start: int, count: int, unit: str, offset: int, value_type: ValueType):
+        for n in range(count):
+            table[start + n] = Unit(unit, n + offset, value_type)
+
+    scale(0x00, 8, "Wh", -3, ValueType.ENERGY)
+    scale(0x08, 8, "J", 0, ValueType.ENERGY)
+    scale(0x10, 8, "m3", -6, ValueType.VOLUME)
+    scale(0x18, 8, "kg", -3, ValueType.MASS)
+    for n in range(4):
+        table[0x20 + n] = Unit(TIME_UNITS[n], 0, ValueType.DURATION)
+        table[0x24 + n] = Unit(TIME_UNITS[n], 0, ValueType.DURATION)
+    scale(0x28, 8, "W", -3, ValueType.POWER)
+    scale(0x30, 8, "J/h", 0, ValueType.POWER)
+    scale(0x38, 8, "m3/h", -6, ValueType.VOLUME_FLOW)
+    scale(0x40, 8, "m3/min", -7, ValueType.VOLUME_FLOW)
+    scale(0x48, 8, "m3/s", -9, ValueType.VOLUME_FLOW)
+    scale(0x50, 8, "kg/h", -3, ValueType.MASS_FLOW)
+    scale(0x58, 4, "°C", -3, ValueType.TEMPERATURE)
+    scale(0x5C, 4, "°C", -3, ValueType.TEMPERATURE)
+    scale(0x60, 4, "K", -3, ValueType.TEMPERATURE_DIFFERENCE)
+    scale(0x64, 4, "°C", -3, ValueType.TEMPERATURE)
+    scale(0x68, 4, "bar", -3, ValueType.PRESSURE)
+    table[0x6C] = Unit("timestamp", 0, ValueType.DATE, DATE)
+    table[0x6D] = Unit("timestamp", 0, ValueType.DATE, DATE_TIME)
+    table[0x6E] = Unit("", 0, ValueType.HCA_UNITS)
+    for n in range(4):
+        table[0x70 + n] = Unit(TIME_UNITS[n], 0, ValueType.DURATION)
+        table[0x74 + n] = Unit(TIME_UNITS[n], 0, ValueType.DURATION)
+    table[0x78] = Unit("", 0, ValueType.FABRICATION_NUMBER)
+
+    return tuple(table)
+
+
+def _build_fb_table() -> Tuple[Unit, ...]:
+    table = [UNKNOWN_UNIT] * 128
+    for n in range(2):
+        table[0x00 + n] = Unit("MWh", n - 1, ValueType.ENERGY)
+        table[0x08 + n] = Unit("GJ", n - 1, ValueType.ENERGY)
+        table[0x10 + n] = Unit("m3", n + 2, ValueType.VOLUME)
+        table[0x18 + n] = Unit("t", n + 2, ValueType.MASS)
+        table[0x1A + n] = Unit("%", n - 1, ValueType.HUMIDITY)
+        table[0x28 + n] = Unit("MW", n - 1, ValueType.POWER)
+        table[0x30 + n] = Unit("GJ/h", n - 1, ValueType.POWER)
+    for n in range(4):
+        table[0x58 + n] = Unit("°F", n - 3, ValueType.TEMPERATURE)
+        table[0x5C + n] = Unit("°F", n - 3, ValueType.TEMPERATURE)
+        table[0x60 + n] = Unit("°F", n - 3, ValueType.TEMPERATURE_DIFFERENCE)
+        table[0x64 + n] = Unit("°F", n - 3, ValueType.TEMPERATURE)
+    return tuple(table)
+
+
+def _build_fd_table() -> Tuple[Unit, ...]:
+    table = [UNKNOWN_UNIT] * 128
+    table[0x08] = Unit("", 0, ValueType.ACCESS_NUMBER)
+    table[0x0E] = Unit("", 0, ValueType.FIRMWARE_VERSION)
+    table[0x17] = Unit("", 0, ValueType.ERROR_FLAGS)
+    table[0x3A] = Unit("", 0, ValueType.DIMENSIONLESS)
+    for n in range(16):
+        table[0x40 + n] = Unit("V", n - 9, ValueType.VOLTAGE)
+        table[0x50 + n] = Unit("A", n - 12, ValueType.CURRENT)
+    table[0x74] = Unit("d", 0, ValueType.BATTERY_LIFETIME)
+    return tuple(table)
+
+
+PRIMARY_VIF = _build_primary_table()
+VIF_FB = _build_fb_table()
+VIF_FD = _build_fd_table()
+
+# powers of ten, negative exponents divide so 239 * 10^-1 stays exactly 23.9
+POWERS = tuple(10**n for n in range(16))
+
+
+def _decode_bcd(data: bytes) -> Optional[int]:
+    digits = data[::-1].hex()
+    sign = 1
+    if digits[0] == "f":
+        # the highest nibble F marks a negative number
+        sign = -1
+        digits = digits[1:]
+    if not digits.isdigit():
+        return None
+    return sign * int(digits) if digits else 0
+
+
+def _decode_date(data: bytes) -> Optional[float]:
+    day = data[0] & 0x1F
+    month = data[1] & 0x0F
+    year = ((data[0] & 0xE0) >> 5) | ((data[1] & 0xF0) >> 1)
+    if not 1 <= day <= 31 or not 1 <= month <= 12:
+        return None
+    return float(calendar.timegm((2000 + year, month, day, 0, 0, 0)))
+
+
+def _decode_date_time(data: bytes) -> Optional[float]:
+    if data[0] & 0x80:
+        # time is invalid
+        return None
+    minute = data[0] & 0x3F
+    hour = data[1] & 0x1F
+    day = data[2] & 0x1F
+    month = data[3] & 0x0F
+    year = ((data[2] & 0xE0) >> 5) | ((data[3] & 0xF0) >> 1)
+    if not 1 <= day <= 31 or not 1 <= month <= 12:
+        return None
+    return float(calendar.timegm((2000 + year, month, day, hour, minute, 0)))
+
+
+def application_data_offset(payload: bytes) -> int:
+    """
+    Offset of the first data record behind the transport layer header.
+    """
+    offset, _ = transport_header(payload)
+    ci_field = payload[offset]
+    if ci_field == CI_SHORT_HEADER:
+        return offset + 5
+    if ci_field == CI_LONG_HEADER:
+        return offset + 13
+    if ci_field == CI_NO_HEADER:
+        return offset + 1
+    raise ValueError(f"Unsupported CI field {ci_field:02x}.")
+
+
+def decode_data_records(
+    data: bytes, timestamp: Optional[float] = None, offset: int = 0
+) -> List[Value]:
+    """
+    Decode all data records from offset to the end of data into values.
+
+    Records with unknown coding are skipped, manufacturer specific data ends
+    the decoding.
+    """
+    if timestamp is None:
+        timestamp = time.time()
+
+    values = []
+    end = len(data)
+
+    while offset < end:
+        dif = data[offset]
+        offset += 1
+
+        if dif == DIF_IDLE_FILLER:
+            continue
+        if dif == DIF_MANUFACTURER_DATA or dif == DIF_MORE_RECORDS_FOLLOW:
+            break
+
+        length, coding = DATA_FIELDS[dif & 0x0F]
+
+        # DIFEs with storage number, tariff and subunit
+        while dif & 0x80 and offset < end:
+            dif = data[offset]
+            offset += 1
+
+        if offset >= end:
+            break
+
+        vif = data[offset]
+        offset += 1
+        plain_text = vif & 0x7F == VIF_PLAIN_TEXT
+        if vif == VIF_TABLE_FB or vif == VIF_TABLE_FD:
+            table = VIF_FB if vif == VIF_TABLE_FB else VIF_FD
+            if offset >= end:
+                break
+            vif = data[offset]
+            offset += 1
+            unit = table[vif & 0x7F]
+        elif plain_text:
+            unit = UNKNOWN_UNIT
+        else:
+            unit = PRIMARY_VIF[vif & 0x7F]
+
+        # VIFEs with additional information are skipped
+        while vif & 0x80 and offset < end:
+            vif = data[offset]
+            offset += 1
+
+        if plain_text and offset < end:
+            # unit as text behind the VIFEs
+            offset += 1 + data[offset]
+
+        sign = 1
+        if coding == VARIABLE:
+            if offset >= end:
+                break
+            lvar = data[offset]
+            offset += 1
+            if 0xC0 <= lvar <= 0xDF:
+                length = lvar & 0x0F
+                coding = BCD
+                sign = -1 if lvar >= 0xD0 else 1
+            elif 0xE0 <= lvar <= 0xEF:
+                length = lvar & 0x0F
+                coding = INTEGER
+            elif lvar < 0xC0:
+                # text is not decoded into a value
+                length = lvar
+                coding = NO_DATA
+            else:
+                logger.warning("Unsupported variable length format {:02x}.", lvar)
+                break
+
+        raw = data[offset : offset + length]
+        offset += length
+        if len(raw) < length:
+            logger.warning("Data record is cut off at the end of the telegram.")
+            break
+
+        if coding == NO_DATA:
+            continue
+
+        coding = unit.coding or coding
+        value: Optional[float]
+        if coding == INTEGER:
+            value = int.from_bytes(raw, "little", signed=True)
+        elif coding == BCD:
+            value = _decode_bcd(raw)
+            if value is not None:
+                value *= sign
+        elif coding == REAL:
+            value = struct.unpack("<f", raw)[0]
+        elif coding == DATE and length == 2:
+            value = _decode_date(raw)
+        elif coding == DATE_TIME and length == 4:
+            value = _decode_date_time(raw)
+        else:
+            value = int.from_bytes(raw, "little")
+
+        if value is None:
+            continue
+
+        if unit.exponent > 0:
+            value = value * POWERS[unit.exponent]
+        elif unit.exponent < 0:
+            value = value / POWERS[-unit.exponent]
+
+        values.append(Value(value, unit.unit, timestamp, unit.type))
+
+    return values
@@ -0,0 +1,81 @@
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable
+
+
+class DedupCache:
+    """
+    Remembers telegrams for ttl seconds to recognize repeated copies.
+
+    Entries are kept in insertion order, which is also the order they expire. So
+    expired entries are always at the front and every lookup costs O(1) amortized.
+    The cache holds at most max_entries keys (about 200 bytes each) and drops the
+    oldest when it is full.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 60.0,
+        max_entries: int = 100_000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if max_entries < 1:
+            raise ValueError("The cache needs space for at least one entry.")
+
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: Dict[Hashable, float] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        expires_at = self._entries.get(key)
+        return expires_at is not None and expires_at > self.clock()
+
+    def seen(self, key: Hashable) -> bool:
+        """
+        True if the key was already seen within the ttl, otherwise the key is stored.
+        """
+        now = self.clock()
+        entries = self._entries
+
+        while entries:
+            oldest = next(iter(entries))
+            if entries[oldest] > now:
+                break
+            del entries[oldest]
+
+        if key in entries:
+            self.hits += 1
+            return True
+
+        self.misses += 1
+        entries[key] = now + self.ttl
+        if len(entries) > self.max_entries:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+        return False
+
+    def clear(self):
+        self._entries.clear()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hit_rate,
+        }
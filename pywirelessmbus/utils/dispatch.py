@@ -0,0 +1,147 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from enum import Enum
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from loguru import logger
+
+from pywirelessmbus.utils.metrics import Histogram
+from pywirelessmbus.utils.stream import OverflowPolicy
+from pywirelessmbus.utils.utils import NOOP
+
+
+class DispatchMode(Enum):
+    # decode the frames and run the callbacks directly in data_received
+    INLINE = "inline"
+    # decode all frames of the read chunks in one callback of the event loop
+    BATCH = "batch"
+    # run on_radio_message in a thread pool, in order per device
+    EXECUTOR = "executor"
+
+
+class CallbackDispatcher:
+    """
+    Runs callbacks in an executor, so slow callbacks don't delay the reading from
+    the sticks.
+
+    Callbacks with the same key, e.g. the device id, run one after the other in the
+    order of submit(). Callbacks of different keys run in parallel.
+
+    At most maxsize callbacks are pending, the policy works like the one of a
+    MessageStream. With BLOCK on_full is called, so the producer can pause, and
+    on_drain from a worker thread when half of the callbacks are done. The drop
+    policies drop the callbacks of the submitted key.
+    """
+
+    def __init__(
+        self,
+        executor: Optional[Executor] = None,
+        max_workers: int = 4,
+        latency: Optional[Histogram] = None,
+        maxsize: int = 10000,
+        policy: OverflowPolicy = OverflowPolicy.BLOCK,
+        on_full: Callable[["CallbackDispatcher"], None] = NOOP,
+        on_drain: Callable[["CallbackDispatcher"], None] = NOOP,
+    ):
+        if maxsize < 1:
+            raise ValueError("The dispatcher needs a size of at least one callback.")
+
+        self._own_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="pywirelessmbus-dispatch"
+        )
+        self.latency = latency
+        self.maxsize = maxsize
+        self.policy = policy
+        self.on_full = on_full
+        self.on_drain = on_drain
+        self.pending = 0
+        self.errors = 0
+        self.dropped = 0
+        self.full = False
+        self._lock = threading.Lock()
+        # waiting callbacks of the keys, that have a callback running
+        self._queues: Dict[Any, Deque[Tuple[Callable[..., Any], tuple]]] = {}
+
+    def submit(self, key: Any, function: Callable[..., Any], *args) -> bool:
+        """
+        Queue the callback, False if it was dropped.
+        """
+        with self._lock:
+            queue = self._queues.get(key)
+            if self.policy == OverflowPolicy.LATEST_PER_DEVICE and queue:
+                # only the newest waiting callback of the key stays
+                self.dropped += len(queue)
+                self.pending -= len(queue)
+                queue.clear()
+            elif self.pending >= self.maxsize and self.policy != OverflowPolicy.BLOCK:
+                # with BLOCK the callbacks on the way are queued above the limit
+                if self.policy == OverflowPolicy.DROP_OLDEST and queue:
+                    queue.popleft()
+                    self.pending -= 1
+                    self.dropped += 1
+                else:
+                    self.dropped += 1
+                    return False
+
+            self.pending += 1
+            became_full = (
+                self.policy == OverflowPolicy.BLOCK
+                and not self.full
+                and self.pending >= self.maxsize
+            )
+            if became_full:
+                self.full = True
+
+            if queue is not None:
+                queue.append((function, args))
+            else:
+                self._queues[key] = deque()
+
+        if became_full:
+            self.on_full(self)
+        if queue is None:
+            self.executor.submit(self._run, key, function, args)
+        return True
+
+    def _run(self, key: Any, function: Callable[..., Any], args: tuple):
+        # the worker keeps the key until its queue is empty, that keeps the order
+        while True:
+            started_at = time.perf_counter()
+            failed = False
+            try:
+                function(*args)
+            except Exception:
+                failed = True
+                logger.exception("Callback for {} failed.", key)
+
+            with self._lock:
+                self.pending -= 1
+                self.errors += failed
+                if self.latency is not None:
+                    self.latency.observe(time.perf_counter() - started_at)
+
+                drained = self.full and self.pending <= self.maxsize // 2
+                if drained:
+                    self.full = False
+
+                queue = self._queues[key]
+                done = not queue
+                if done:
+                    del self._queues[key]
+                else:
+                    function, args = queue.popleft()
+
+            if drained:
+                self.on_drain(self)
+            if done:
+                return
+
+    def shutdown(self, wait: bool = True):
+        """
+        Shut down the executor, if the dispatcher created it.
+        """
+        if self._own_executor:
+            self.executor.shutdown(wait=wait)
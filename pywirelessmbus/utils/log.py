@@ -0,0 +1,14 @@
+"""
+Logger for the receive path, that evaluates callable arguments only if a handler
+accepts the level.
+
+The package disables its logger by default, but the arguments of a call are still
+computed. Expensive arguments like hex dumps or formatted timestamps are passed as
+lambdas to this logger instead:
+
+    lazy_logger.debug("Raw Message: {}", lambda: message.raw.hex())
+"""
+from loguru import logger
+
+# shares the handlers and the enabled modules with the global logger
+lazy_logger = logger.opt(lazy=True)
@@ -1,7 +1,7 @@
 import time
 from dataclasses import dataclass
 from enum import Enum
-from typing import List, Optional
+from typing import List, Optional, Union
 
 from pywirelessmbus.exceptions import InvalidMessageLength
 
@@ -13,11 +13,32 @@ class ValueType(Enum):
     ELECTRICAL_ENERGY = "electrical Energy"
     GAS = "gas"
     WATER = "water"
+    ENERGY = "energy"
+    VOLUME = "volume"
+    MASS = "mass"
+    DURATION = "duration"
+    POWER = "power"
+    VOLUME_FLOW = "volume flow"
+    MASS_FLOW = "mass flow"
+    TEMPERATURE_DIFFERENCE = "temperature difference"
+    PRESSURE = "pressure"
+    DATE = "date"
+    HCA_UNITS = "heat cost allocation units"
+    FABRICATION_NUMBER = "fabrication number"
+    ACCESS_NUMBER = "access number"
+    FIRMWARE_VERSION = "firmware version"
+    ERROR_FLAGS = "error flags"
+    DIMENSIONLESS = "dimensionless"
+    VOLTAGE = "voltage"
+    CURRENT = "current"
+    BATTERY_LIFETIME = "battery lifetime"
     UNKNOWN = "unknown"
 
 
 @dataclass
 class Value:
+    __slots__ = ("value", "unit", "timestamp", "type")
+
     value: float
     unit: str
     timestamp: float
@@ -60,45 +81,167 @@ class IMSTMessage:
         return True
 
 
+# Every possible single byte, to hand out message ids without allocating
+SINGLE_BYTES = tuple(bytes([byte]) for byte in range(256))
+
+
+class IMSTFrame:
+    """
+    Variant of the IMSTMessage, that is backed by the raw frame from the receive buffer.
+
+    Nothing is decoded up front. The fields are read from fixed offsets of the frame
+    on access and byte fields are views on the frame, so no bytes get copied.
+    """
+
+    __slots__ = ("frame",)
+
+    def __init__(self, frame: Union[bytes, memoryview]):
+        self.frame = frame if isinstance(frame, memoryview) else memoryview(frame)
+
+    def __repr__(self) -> str:
+        return (
+            f"IMSTFrame(endpoint_id={self.endpoint_id}, "
+            f"message_id={self.message_id.hex()}, "
+            f"payload_length={self.payload_length}, "
+            f"payload={self.payload.hex()}, "
+            f"rssi={self.rssi}, "
+            f"timestamp={None if self.timestamp is None else self.timestamp.hex()}, "
+            f"crc={None if self.crc is None else self.crc.hex()})"
+        )
+
+    @property
+    def endpoint_id(self) -> int:
+        return self.frame[1] & 0xF
+
+    @property
+    def message_id(self) -> bytes:
+        return SINGLE_BYTES[self.frame[2]]
+
+    @property
+    def payload_length(self) -> int:
+        return self.frame[3]
+
+    @property
+    def with_timestamp_field(self) -> bool:
+        return self.frame[1] & 0x20 > 0
+
+    @property
+    def with_rssi_field(self) -> bool:
+        return self.frame[1] & 0x40 > 0
+
+    @property
+    def with_crc_field(self) -> bool:
+        return self.frame[1] & 0x80 > 0
+
+    @property
+    def payload(self) -> memoryview:
+        return self.frame[3 : 4 + self.frame[3]]
+
+    @property
+    def crc(self) -> Optional[memoryview]:
+        if not self.frame[1] & 0x80:
+            return None
+        return self.frame[-2:]
+
+    @property
+    def rssi(self) -> Optional[int]:
+        if not self.frame[1] & 0x40:
+            return None
+        return self.frame[4 + self.frame[3] + (self.frame[1] & 0x20 > 0) * 4]
+
+    @property
+    def timestamp(self) -> Optional[memoryview]:
+        if not self.frame[1] & 0x20:
+            return None
+        offset = 4 + self.frame[3]
+        return self.frame[offset : offset + 4]
+
+    def check_message_length(self):
+        if len(self.frame) != (
+            4
+            + self.payload_length
+            + self.with_timestamp_field * 4
+            + self.with_rssi_field
+            + self.with_crc_field * 2
+        ):
+            raise InvalidMessageLength(
+                f"The length of the message {self.message_id} differ from the given."
+            )
+
+        return True
+
+
+AnyIMSTMessage = Union[IMSTMessage, IMSTFrame]
+
+
 class WMbusMessage:
-    length: int
-    manufacturer_id: bytes
-    serial_number: bytes
-    version: bytes
-    device_type: bytes
-    control_field: bytes
-    access_number: int
-    status: int
-    raw: bytes
+    """
+    Wireless M-Bus message from the payload of a radio message.
+
+    Only the payload is stored. The link layer fields are decoded from their
+    offsets when they are read, so fields nobody looks at cost nothing.
+    """
+
+    __slots__ = ("raw", "values")
+
+    raw: Union[bytes, memoryview]
     values: List[Value]
 
-    def __init__(self, raw_message):
+    def __init__(self, raw_message: AnyIMSTMessage):
         self.raw = raw_message.payload
-
-        # Link Layer
-        ## L-Field
-        self.length = raw_message.payload[0]
-        ## C-Field
-        self.command = raw_message.payload[1:2]
-        ## M-Field
-        self.manufacturer_id = raw_message.payload[2:4]
-        ## A-Field
-        self.serial_number = raw_message.payload[3:8]
-        self.version = raw_message.payload[8:9]
-        self.device_type = raw_message.payload[9:10]
-
-        ## CRC0
-        ## TODO: Implement byte 10 and 11 if exists
-
-        ## CI Field
-        self.control_field = raw_message.payload[10:11]
-        self.access_number = raw_message.payload[11]
-        self.status = raw_message.payload[12]
-        self.configuration_word = raw_message.payload[13:14]
         self.values = []
 
-        ## CRC1
-        ## TODO: Implement byte 28 and 29 if exists
+    # Link Layer
+    @property
+    def length(self) -> int:
+        """L-Field"""
+        return self.raw[0]
+
+    @property
+    def command(self) -> bytes:
+        """C-Field"""
+        return SINGLE_BYTES[self.raw[1]]
+
+    @property
+    def manufacturer_id(self) -> bytes:
+        """M-Field"""
+        return bytes(self.raw[2:4])
+
+    @property
+    def serial_number(self) -> bytes:
+        """A-Field"""
+        return bytes(self.raw[3:8])
+
+    @property
+    def version(self) -> bytes:
+        return SINGLE_BYTES[self.raw[8]]
+
+    @property
+    def device_type(self) -> bytes:
+        return SINGLE_BYTES[self.raw[9]]
+
+    ## CRC0
+    ## TODO: Implement byte 10 and 11 if exists
+
+    # CI Field
+    @property
+    def control_field(self) -> bytes:
+        return SINGLE_BYTES[self.raw[10]]
+
+    @property
+    def access_number(self) -> int:
+        return self.raw[11]
+
+    @property
+    def status(self) -> int:
+        return self.raw[12]
+
+    @property
+    def configuration_word(self) -> bytes:
+        return SINGLE_BYTES[self.raw[13]]
+
+    ## CRC1
+    ## TODO: Implement byte 28 and 29 if exists
 
     def add_value(
         self,
@@ -0,0 +1,287 @@
+"""
+Histograms for the runtime metrics and an exporter in the Prometheus text format.
+
+The counters are plain attributes of the sticks and WMbus, so counting costs one
+addition. stats() of WMbus collects them with the histograms into a dict, that the
+exporter renders on every scrape.
+"""
+import asyncio
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from loguru import logger
+
+# seconds, from 10 µs to 1 s
+LATENCY_BUCKETS = (
+    0.00001,
+    0.000025,
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+)
+
+PREFIX = "pywirelessmbus"
+
+# name in stats, metric name, type, help
+STICK_METRICS = (
+    ("frames_received", "frames_received_total", "counter", "Received HCI frames."),
+    ("bytes_received", "bytes_received_total", "counter", "Bytes read from the stick."),
+    (
+        "frames_rejected",
+        "frames_rejected_total",
+        "counter",
+        "Frames dropped because of an invalid CRC.",
+    ),
+    (
+        "dropped_bytes",
+        "dropped_bytes_total",
+        "counter",
+        "Bytes skipped without a valid frame start.",
+    ),
+    (
+        "write_pauses",
+        "write_pauses_total",
+        "counter",
+        "Pauses of the transport because of a full write buffer.",
+    ),
+    (
+        "aes_errors",
+        "aes_errors_total",
+        "counter",
+        "Telegrams the stick failed to decrypt.",
+    ),
+    ("key_reloads", "key_reloads_total", "counter", "AES keys loaded again."),
+    (
+        "command_queue_depth",
+        "command_queue_depth",
+        "gauge",
+        "Commands waiting to be written to the stick.",
+    ),
+    (
+        "commands_written",
+        "commands_written_total",
+        "counter",
+        "Commands written to the stick.",
+    ),
+    (
+        "commands_coalesced",
+        "commands_coalesced_total",
+        "counter",
+        "Configuration commands merged into a waiting one.",
+    ),
+    (
+        "decode_latency",
+        "decode_latency_seconds",
+        "histogram",
+        "Time to decode and process a frame.",
+    ),
+)
+
+WMBUS_METRICS = (
+    ("telegrams", "telegrams_total", "counter", "Processed telegrams."),
+    (
+        "duplicates",
+        "duplicates_total",
+        "counter",
+        "Copies of telegrams received by several sticks.",
+    ),
+    (
+        "short_telegrams",
+        "short_telegrams_total",
+        "counter",
+        "Telegrams dropped because they end before the access number.",
+    ),
+    (
+        "unknown_manufacturers",
+        "unknown_manufacturers_total",
+        "counter",
+        "Telegrams without a driver for the device.",
+    ),
+    (
+        "decryption_errors",
+        "decryption_errors_total",
+        "counter",
+        "Telegrams that failed to decrypt on the host.",
+    ),
+    (
+        "callbacks_pending",
+        "callbacks_pending",
+        "gauge",
+        "Callbacks waiting for or running in the executor.",
+    ),
+    (
+        "callbacks_errors",
+        "callback_errors_total",
+        "counter",
+        "Callbacks in the executor, that raised an exception.",
+    ),
+    (
+        "callbacks_dropped",
+        "callbacks_dropped_total",
+        "counter",
+        "Callbacks dropped because the executor fell behind.",
+    ),
+    (
+        "callback_latency",
+        "callback_latency_seconds",
+        "histogram",
+        "Time spent in the on_radio_message callback.",
+    ),
+)
+
+
+class Histogram:
+    """
+    Count of observations per bucket, with their sum.
+    """
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Cumulative counts per upper bound, like the buckets of Prometheus.
+        """
+        cumulative = []
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            cumulative.append((bound, total))
+        return {"buckets": cumulative, "sum": self.sum, "count": self.count}
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return (
+        "{"
+        + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+        + "}"
+    )
+
+
+def _bound(bound: float) -> str:
+    return "+Inf" if bound == float("inf") else repr(bound)
+
+
+def _render_family(
+    lines: List[str],
+    metric: Tuple[str, str, str, str],
+    samples: List[Tuple[Dict[str, str], Any]],
+):
+    key, name, metric_type, description = metric
+    name = f"{PREFIX}_{name}"
+    lines.append(f"# HELP {name} {description}")
+    lines.append(f"# TYPE {name} {metric_type}")
+
+    for labels, value in samples:
+        if metric_type != "histogram":
+            lines.append(f"{name}{_labels(labels)} {value}")
+            continue
+
+        for bound, count in value["buckets"]:
+            bucket_labels = dict(labels, le=_bound(bound))
+            lines.append(f"{name}_bucket{_labels(bucket_labels)} {count}")
+        lines.append(f"{name}_sum{_labels(labels)} {value['sum']}")
+        lines.append(f"{name}_count{_labels(labels)} {value['count']}")
+
+
+def render_prometheus(stats: Dict[str, Any]) -> str:
+    """
+    Prometheus text format of the stats of WMbus.
+    """
+    lines: List[str] = []
+
+    for metric in WMBUS_METRICS:
+        if metric[0] in stats:
+            _render_family(lines, metric, [({}, stats[metric[0]])])
+
+    _render_family(
+        lines,
+        ("devices", "device_telegrams_total", "counter", "Telegrams per device."),
+        [({"device": device}, count) for device, count in stats["devices"].items()],
+    )
+
+    sticks = stats.get("sticks", {})
+    for metric in STICK_METRICS:
+        samples = [
+            ({"stick": path}, stick_stats[metric[0]])
+            for path, stick_stats in sticks.items()
+            if metric[0] in stick_stats
+        ]
+        if samples:
+            _render_family(lines, metric, samples)
+
+    return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    """
+    HTTP endpoint for Prometheus, that serves the stats of WMbus on /metrics.
+    """
+
+    def __init__(self, wmbus: Any, host: str = "127.0.0.1", port: int = 9464):
+        self.wmbus = wmbus
+        self.host = host
+        self.port = port
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        if self.port == 0:
+            self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("Serve metrics on http://{}:{}/metrics", self.host, self.port)
+
+    def stop(self):
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await reader.readuntil(b"\r\n\r\n")
+            path = request.split(b" ", 2)[1] if request.count(b" ") >= 2 else b""
+
+            if path.split(b"?")[0] == b"/metrics":
+                status = "200 OK"
+                body = render_prometheus(self.wmbus.stats()).encode()
+            else:
+                status = "404 Not Found"
+                body = b"Not Found\n"
+
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,398 @@
+"""
+Decoding of telegrams in worker processes, for gateways where one core can't keep
+up with the telegrams of all sticks.
+
+Every worker owns a shard of the devices, chosen by the device id, and its own
+ring buffer in shared memory. The event loop writes the payloads into the ring of
+the shard and tells the worker once per loop iteration up to which position it
+can read. The worker runs WMbusMessage and Device.process_new_message for the new
+telegrams and sends back the results of all of them in one batch, together with
+its read position. So the order of the telegrams of a device is kept and all
+synchronisation goes through the pipes, the shared memory only carries the bytes.
+
+The first telegram of a device carries the driver and the state of the device in
+the main process, so the worker continues with the same state. After an error
+the device is sent again. Shared memory needs Python 3.8.
+"""
+import asyncio
+import multiprocessing
+import pickle
+import struct
+import zlib
+from collections import deque
+from multiprocessing.connection import Connection
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from pywirelessmbus.devices.device import Device
+from pywirelessmbus.devices.registry import import_driver
+from pywirelessmbus.devices.store import driver_path
+from pywirelessmbus.utils.message import IMSTMessage, Value, WMbusMessage
+from pywirelessmbus.utils.utils import NOOP
+
+RECORD_HEADER = struct.Struct("<HI")
+POSITION = struct.Struct("<Q")
+# attributes of a device, that the main process keeps itself
+LOCAL_ATTRIBUTES = ("id", "index", "label", "on_set_aes_key", "ctx", "last_values")
+# attributes of a device, that are not sent to the worker
+UNSHARED_ATTRIBUTES = ("on_set_aes_key", "ctx")
+
+# values and changed attributes of the device, or the error
+Result = Tuple[Optional[List[Value]], Optional[Dict[str, Any]], Optional[str]]
+
+
+class SharedRing:
+    """
+    Ring buffer in shared memory for records up to 64 KiB with a tag in front,
+    with one producer and one consumer. The positions are counted by each side
+    itself.
+    """
+
+    def __init__(self, capacity: int = 1 << 20, name: Optional[str] = None):
+        if name is None:
+            self.memory = SharedMemory(create=True, size=capacity)
+        else:
+            self.memory = SharedMemory(name=name)
+        self.capacity = capacity
+        self.buffer = self.memory.buf
+        self.write_position = 0
+        self.read_position = 0
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    @property
+    def free(self) -> int:
+        return self.capacity - (self.write_position - self.read_position)
+
+    def fits(self, record: bytes, tag: bytes = b"") -> bool:
+        """
+        True if the record with the tag fits into the empty ring.
+        """
+        size = RECORD_HEADER.size + len(tag) + len(record)
+        return size <= self.capacity and len(record) <= 0xFFFF
+
+    def write(self, record: bytes, tag: bytes = b"") -> bool:
+        """
+        Append the record with the tag in front, False if the ring is full.
+        Raises ValueError for a record, that never fits.
+        """
+        if not self.fits(record, tag):
+            raise ValueError(
+                f"A record of {len(record)} bytes with a tag of {len(tag)} bytes "
+                f"doesn't fit into the ring of {self.capacity} bytes."
+            )
+        size = RECORD_HEADER.size + len(tag) + len(record)
+        if size > self.free:
+            return False
+
+        self._copy_in(RECORD_HEADER.pack(len(record), len(tag)) + tag)
+        self._copy_in(record)
+        return True
+
+    def read(self, until: int) -> List[Tuple[bytes, bytes]]:
+        """
+        All (tag, record) pairs up to the position of the producer.
+        """
+        records = []
+        while self.read_position < until:
+            header = self._copy_out(RECORD_HEADER.size)
+            length, tag_length = RECORD_HEADER.unpack(header)
+            tag = self._copy_out(tag_length)
+            records.append((tag, self._copy_out(length)))
+        return records
+
+    def _copy_in(self, data: bytes):
+        start = self.write_position % self.capacity
+        first = min(len(data), self.capacity - start)
+        self.buffer[start : start + first] = data[:first]
+        self.buffer[: len(data) - first] = data[first:]
+        self.write_position += len(data)
+
+    def _copy_out(self, size: int) -> bytes:
+        start = self.read_position % self.capacity
+        first = min(size, self.capacity - start)
+        data = bytes(self.buffer[start : start + first])
+        if first < size:
+            data += bytes(self.buffer[: size - first])
+        self.read_position += size
+        return data
+
+    def close(self, unlink: bool = False):
+        self.buffer = None
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+
+def device_announcement(device: Device) -> bytes:
+    """
+    Driver and state of the device, to create it in a worker.
+    """
+    state = {
+        name: value
+        for name, value in vars(device).items()
+        if name not in UNSHARED_ATTRIBUTES
+    }
+    return pickle.dumps((driver_path(device), state))
+
+
+def _create_device(announcement: bytes) -> Device:
+    path, state = pickle.loads(announcement)
+    cls = import_driver(path)
+    device = cls.__new__(cls)
+    vars(device).update(state)
+    device.on_set_aes_key = NOOP
+    device.ctx = None
+    return device
+
+
+def _process_record(
+    devices: Dict[bytes, Device], announcement: bytes, payload: bytes
+) -> Result:
+    device_id = payload[2:10]
+    message = WMbusMessage(
+        IMSTMessage(
+            endpoint_id=2,
+            message_id=b"\x03",
+            payload_length=len(payload) - 1,
+            with_timestamp_field=False,
+            with_rssi_field=False,
+            with_crc_field=False,
+            payload=payload,
+        )
+    )
+
+    try:
+        if announcement:
+            devices[device_id] = _create_device(announcement)
+        device = devices.get(device_id)
+        if device is None:
+            raise KeyError(f"Device {device_id.hex()} wasn't sent to the worker.")
+
+        processed_message = device.process_new_message(message)
+    except Exception as error:
+        return None, None, f"{type(error).__name__}: {error}"
+
+    state = {
+        name: value
+        for name, value in vars(device).items()
+        if name not in LOCAL_ATTRIBUTES
+    }
+    return processed_message.values, state, None
+
+
+def decode_worker(name: str, capacity: int, connection: Connection):
+    """
+    Main function of a worker process.
+    """
+    ring = SharedRing(capacity, name=name)
+    devices: Dict[bytes, Device] = {}
+
+    try:
+        while True:
+            data = connection.recv_bytes()
+            if not data:
+                break
+
+            (until,) = POSITION.unpack(data)
+            results = [
+                _process_record(devices, announcement, payload)
+                for announcement, payload in ring.read(until)
+            ]
+            connection.send((ring.read_position, results))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        try:
+            connection.send(None)
+        except OSError:
+            pass
+        ring.close()
+
+
+class DecodePipeline:
+    """
+    Pool of worker processes, that decode the telegrams of their shard of devices.
+
+    on_results is called on the event loop with a batch of (context, result)
+    pairs, where context is the object given to submit().
+    """
+
+    def __init__(
+        self,
+        on_results: Callable[[List[Tuple[Any, Result]]], None],
+        workers: int = 2,
+        capacity: int = 1 << 20,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+    ):
+        if workers < 1:
+            raise ValueError("The pipeline needs at least one worker.")
+
+        self.on_results = on_results
+        self.workers = workers
+        self.capacity = capacity
+        self.pending = 0
+        # telegrams, that are too large for the ring
+        self.dropped = 0
+        self._loop = loop or asyncio.get_event_loop()
+        self._rings: List[SharedRing] = []
+        self._connections: List[Connection] = []
+        self._processes: List[Any] = []
+        # device ids and contexts of the telegrams in the ring or the backlog, in
+        # the same order
+        self._contexts: List[Deque[Tuple[bytes, Any]]] = []
+        self._backlogs: List[Deque[Tuple[bytes, bytes]]] = []
+        self._announced: List[Set[bytes]] = []
+        self._dirty: Set[int] = set()
+        self._flush_scheduled = False
+
+    def start(self):
+        context = multiprocessing.get_context("spawn")
+        for shard in range(self.workers):
+            ring = SharedRing(self.capacity)
+            connection, worker_connection = context.Pipe()
+            process = context.Process(
+                target=decode_worker,
+                args=(ring.name, self.capacity, worker_connection),
+                name=f"pywirelessmbus-decode-{shard}",
+                daemon=True,
+            )
+            process.start()
+            worker_connection.close()
+
+            self._rings.append(ring)
+            self._connections.append(connection)
+            self._processes.append(process)
+            self._contexts.append(deque())
+            self._backlogs.append(deque())
+            self._announced.append(set())
+            self._loop.add_reader(connection.fileno(), self._receive, shard)
+
+        logger.info("Started {} decode worker processes.", self.workers)
+
+    def shard(self, device_id: bytes) -> int:
+        return zlib.crc32(device_id) % self.workers
+
+    def submit(self, device: Device, payload: bytes, context: Any):
+        """
+        Queue the payload of a telegram of the device for its worker.
+        """
+        device_id = bytes(payload[2:10])
+        shard = self.shard(device_id)
+
+        # the worker creates its copy of the device with the first telegram
+        announcement = b""
+        if device_id not in self._announced[shard]:
+            announcement = device_announcement(device)
+
+        ring = self._rings[shard]
+        if not ring.fits(payload, announcement):
+            # it would wait for space forever
+            self.dropped += 1
+            logger.error(
+                "Drop the telegram of device {}, it doesn't fit into the ring of "
+                "{} bytes with the device.",
+                device_id.hex(),
+                ring.capacity,
+            )
+            return
+
+        self._announced[shard].add(device_id)
+        self.pending += 1
+        self._contexts[shard].append((device_id, context))
+        backlog = self._backlogs[shard]
+        if backlog or not ring.write(bytes(payload), announcement):
+            backlog.append((bytes(payload), announcement))
+
+        self._dirty.add(shard)
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            self._loop.call_soon(self._flush)
+
+    def _flush(self):
+        self._flush_scheduled = False
+        for shard in self._dirty:
+            self._connections[shard].send_bytes(
+                POSITION.pack(self._rings[shard].write_position)
+            )
+        self._dirty.clear()
+
+    def _receive(self, shard: int):
+        try:
+            batch = self._connections[shard].recv()
+        except EOFError:
+            batch = None
+
+        if batch is None:
+            logger.error("Decode worker {} stopped.", shard)
+            self._loop.remove_reader(self._connections[shard].fileno())
+            return
+
+        self._deliver(shard, batch)
+
+    def _deliver(self, shard: int, batch: Tuple[int, List[Result]]):
+        read_position, results = batch
+        ring = self._rings[shard]
+        ring.read_position = read_position
+
+        contexts = self._contexts[shard]
+        self.pending -= len(results)
+        items = []
+        for result in results:
+            device_id, context = contexts.popleft()
+            if result[2] is not None:
+                # the worker may have no or a broken copy, send the device again
+                self._announced[shard].discard(device_id)
+            items.append((context, result))
+
+        # the worker made room for the telegrams, that didn't fit before
+        backlog = self._backlogs[shard]
+        while backlog and ring.write(*backlog[0]):
+            backlog.popleft()
+            self._dirty.add(shard)
+        if shard in self._dirty and not self._flush_scheduled:
+            self._flush_scheduled = True
+            self._loop.call_soon(self._flush)
+
+        self.on_results(items)
+
+    def close(self):
+        """
+        Stop the workers after they decoded all queued telegrams, and deliver the
+        results of them.
+        """
+        if self._flush_scheduled:
+            self._flush()
+
+        for shard, connection in enumerate(self._connections):
+            self._loop.remove_reader(connection.fileno())
+            # the backlog can only be written after the worker made room
+            while self._backlogs[shard]:
+                self._deliver(shard, connection.recv())
+                self._flush()
+            connection.send_bytes(b"")
+
+        for shard, connection in enumerate(self._connections):
+            try:
+                while True:
+                    batch = connection.recv()
+                    if batch is None:
+                        break
+                    self._deliver(shard, batch)
+            except EOFError:
+                pass
+            connection.close()
+
+        for process in self._processes:
+            process.join(timeout=5)
+        for ring in self._rings:
+            ring.close(unlink=True)
+
+        self._rings.clear()
+        self._connections.clear()
+        self._processes.clear()
+        logger.info("Stopped the decode worker processes.")
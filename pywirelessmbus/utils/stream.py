@@ -0,0 +1,150 @@
+import asyncio
+from collections import OrderedDict, deque
+from enum import Enum
+from typing import Any, Callable, Deque, Dict, Tuple
+
+from pywirelessmbus.utils.utils import NOOP
+
+
+class OverflowPolicy(Enum):
+    # stop reading from the stick until the consumer catches up
+    BLOCK = "block"
+    DROP_OLDEST = "drop_oldest"
+    DROP_NEWEST = "drop_newest"
+    # only the newest unread message of every device stays in the queue
+    LATEST_PER_DEVICE = "latest_per_device"
+
+
+class MessageStream:
+    """
+    Bounded queue of processed radio messages, that can be read with async for.
+
+    With the policy BLOCK no message is dropped. When the queue is full on_full is
+    called, so the producer can pause, and on_drain when the queue is half empty
+    again. Messages that are already on the way are queued above the limit.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        policy: OverflowPolicy = OverflowPolicy.BLOCK,
+        on_full: Callable[["MessageStream"], None] = NOOP,
+        on_drain: Callable[["MessageStream"], None] = NOOP,
+        on_close: Callable[["MessageStream"], None] = NOOP,
+    ):
+        if maxsize < 1:
+            raise ValueError("The stream needs a size of at least one message.")
+
+        self.maxsize = maxsize
+        self.policy = policy
+        self.on_full = on_full
+        self.on_drain = on_drain
+        self.on_close = on_close
+
+        self.dropped = 0
+        self.delivered = 0
+        self.max_depth = 0
+        self.full = False
+
+        self._items: Deque[Tuple[Any, Any]] = deque()
+        self._latest: Dict[Any, Tuple[Any, Any]] = OrderedDict()
+        self._closed = False
+        self._event = asyncio.Event()
+
+    @property
+    def depth(self) -> int:
+        if self.policy == OverflowPolicy.LATEST_PER_DEVICE:
+            return len(self._latest)
+        return len(self._items)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
+
+    def put(self, device: Any, message: Any):
+        if self._closed:
+            return
+
+        if self.policy == OverflowPolicy.LATEST_PER_DEVICE:
+            self._put_latest(device, message)
+        elif len(self._items) < self.maxsize:
+            self._items.append((device, message))
+        elif self.policy == OverflowPolicy.BLOCK:
+            self._items.append((device, message))
+        elif self.policy == OverflowPolicy.DROP_OLDEST:
+            self._items.popleft()
+            self._items.append((device, message))
+            self.dropped += 1
+        else:
+            self.dropped += 1
+
+        depth = self.depth
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+        if (
+            self.policy == OverflowPolicy.BLOCK
+            and not self.full
+            and depth >= self.maxsize
+        ):
+            self.full = True
+            self.on_full(self)
+
+        self._event.set()
+
+    def _put_latest(self, device: Any, message: Any):
+        key = device.id
+        if key in self._latest:
+            # replaces the unread message, the device keeps its place in the queue
+            self.dropped += 1
+        elif len(self._latest) >= self.maxsize:
+            self._latest.popitem(last=False)
+            self.dropped += 1
+
+        self._latest[key] = (device, message)
+
+    def get_nowait(self) -> Tuple[Any, Any]:
+        if self.policy == OverflowPolicy.LATEST_PER_DEVICE:
+            if not self._latest:
+                raise IndexError("The stream is empty.")
+            _, item = self._latest.popitem(last=False)
+        else:
+            item = self._items.popleft()
+
+        self.delivered += 1
+        if self.full and self.depth <= self.maxsize // 2:
+            self.full = False
+            self.on_drain(self)
+
+        return item
+
+    def close(self):
+        if self._closed:
+            return
+
+        self._closed = True
+        self._event.set()
+        if self.full:
+            self.full = False
+            self.on_drain(self)
+        self.on_close(self)
+
+    def __aiter__(self) -> "MessageStream":
+        return self
+
+    async def __anext__(self) -> Tuple[Any, Any]:
+        while not self.depth:
+            if self._closed:
+                raise StopAsyncIteration
+            self._event.clear()
+            await self._event.wait()
+
+        return self.get_nowait()
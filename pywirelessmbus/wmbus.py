@@ -1,16 +1,43 @@
 import asyncio
+import time
+from collections import deque
+from concurrent.futures import Executor
 from dataclasses import dataclass, field
-from typing import Callable, Dict, Optional, Union
+from functools import partial
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
 from loguru import logger
 
-from pywirelessmbus.devices import (Device, EnergyCam, MockDevice,
-                                    WeptechOMSv1, WeptechOMSv2)
+from pywirelessmbus.devices import Device
+from pywirelessmbus.devices.registry import DRIVERS, DriverRegistry
+from pywirelessmbus.devices.store import DeviceStore
 from pywirelessmbus.exceptions import UnknownDeviceTypeError
 from pywirelessmbus.sticks import IM871A_USB
-from pywirelessmbus.utils import IMSTMessage, WMbusMessage
+from pywirelessmbus.sticks.snapshot import StickSnapshots
+from pywirelessmbus.utils import AnyIMSTMessage, IMSTMessage, WMbusMessage
+from pywirelessmbus.utils.aes import AESDecryptor, KeyStore, security_mode
+from pywirelessmbus.utils.batch import MessageBatcher
+from pywirelessmbus.utils.dedup import DedupCache
+from pywirelessmbus.utils.dispatch import CallbackDispatcher, DispatchMode
+from pywirelessmbus.utils.log import lazy_logger
+from pywirelessmbus.utils.metrics import Histogram
+from pywirelessmbus.utils.stream import MessageStream, OverflowPolicy
 from pywirelessmbus.utils.utils import NOOP
 
+if TYPE_CHECKING:
+    from pywirelessmbus.utils.pipeline import DecodePipeline, Result
+
 STICK_TYPES = {"IM871A_USB": IM871A_USB}
 
 # Manufacturer
@@ -20,6 +47,10 @@ IMST = b"\x25\xb3"[::-1]
 MOCK = b"\xff\xff"[::-1]
 
 
+def _rssi(message: AnyIMSTMessage) -> int:
+    return -1 if message.rssi is None else message.rssi
+
+
 @dataclass
 class WMbus:
     device_type: str
@@ -30,109 +61,472 @@ class WMbus:
     on_radio_message: Callable[[Device, WMbusMessage], None] = NOOP
     on_start: Callable[[], None] = NOOP
     on_stop: Callable[[], None] = NOOP
+    # receives the processed messages as lists of (device, message) pairs
+    on_radio_batch: Optional[Callable[[List[Tuple[Device, WMbusMessage]]], None]] = None
+    # a batch is delivered with this many messages or after this many seconds
+    batch_size: int = 100
+    batch_latency: float = 1.0
+    # several sticks on the same event loop, path is used without paths
+    paths: List[str] = field(default_factory=list)
+    sticks: List[IM871A_USB] = field(default_factory=list)
+    # time to wait for copies of a telegram from other sticks
+    dedup_window: float = 0.05
+    # drops repeated telegrams of a device with the same access number
+    dedup_cache: Optional[DedupCache] = None
+    # keys to decrypt telegrams on the host, in addition to the key table of the stick
+    key_store: Optional[KeyStore] = None
+    decryption_executor: Optional[Executor] = None
+    # drivers for new devices, the default registry has the built in drivers
+    drivers: DriverRegistry = DRIVERS
+    # known devices, loaded at start
+    device_store: Optional[DeviceStore] = None
+    # where frames are decoded and on_radio_message runs, see DispatchMode
+    dispatch: DispatchMode = DispatchMode.BATCH
+    # thread pool for DispatchMode.EXECUTOR, a pool with 4 threads if not given
+    callback_executor: Optional[Executor] = None
+    # pending callbacks of DispatchMode.EXECUTOR and what happens above the limit
+    callback_queue_size: int = 10000
+    callback_overflow: OverflowPolicy = OverflowPolicy.BLOCK
+    # worker processes for the drivers, 0 processes the telegrams on the event loop
+    decode_workers: int = 0
+    # stick configuration of the last run and the configuration to apply at start
+    stick_snapshots: Optional[StickSnapshots] = None
+    stick_config: Dict[str, Any] = field(default_factory=dict)
+    # commands per second to every stick, None writes them as fast as possible
+    command_rate: Optional[float] = None
 
     def __post_init__(self):
         self.running = False
+        self.duplicates = 0
         self._loop = asyncio.get_event_loop()
+        self._streams: List[MessageStream] = []
+        self._full_streams: Set[int] = set()
+        self._pending_copies: Dict[Tuple[bytes, int], AnyIMSTMessage] = {}
+        self.decryption_errors = 0
+        self.telegrams = 0
+        self.short_telegrams = 0
+        self.unknown_manufacturers = 0
+        # devices, that got the fallback driver of the registry
+        self._fallback_devices: Set[bytes] = set()
+        self.device_telegrams: Dict[bytes, int] = {}
+        self.callback_latency = Histogram()
+        self._decryptor: Optional[AESDecryptor] = None
+        self._pending_decryptions: Deque[
+            Tuple["asyncio.Future[bytes]", bytes, AnyIMSTMessage]
+        ] = deque()
+        self._dispatcher: Optional[CallbackDispatcher] = None
+        self._batcher: Optional[MessageBatcher] = None
+        self._pipeline: Optional["DecodePipeline"] = None
+        if self.on_radio_batch is not None:
+            self._batcher = MessageBatcher(
+                self._deliver_batch,
+                max_size=self.batch_size,
+                max_latency=self.batch_latency,
+                loop=self._loop,
+            )
+        self._next_index = self._free_index()
+
+    def _free_index(self) -> int:
+        return max((device.index for device in self.devices.values()), default=-1) + 1
+
+    def load_devices(self):
+        """
+        Register all devices of the device store, before their first telegram.
+        """
+        if self.device_store is None:
+            return
+
+        for device in self.device_store.load(on_set_aes_key=self._set_device_key):
+            device_id = bytes.fromhex(device.id)
+            if device_id in self.devices:
+                continue
+            if self.drivers.is_fallback(device_id[0:2], device_id[6], device_id[7]):
+                self._fallback_devices.add(device_id)
+            self.devices[device_id] = device
+            self.on_device_registration(device)
+
+        self._next_index = self._free_index()
 
     async def start(self):
         try:
-            self.stick = STICK_TYPES[self.device_type](path=self.path)
+            stick_type = STICK_TYPES[self.device_type]
         except KeyError:
             raise UnknownDeviceTypeError(
                 "The choosen device type is unfornatly unknown. Possible variants [IM871A_USB]"
             )
 
+        self.load_devices()
+        self.sticks = [
+            stick_type(
+                path=path,
+                dispatch=self.dispatch,
+                snapshots=self.stick_snapshots,
+                desired_config=self.stick_config,
+                command_rate=self.command_rate,
+            )
+            for path in self.paths or [self.path]
+        ]
+        self.stick = self.sticks[0]
+
         # register events
-        self.stick.on_radio_message = self.process_radio_message
+        for stick in self.sticks:
+            stick.on_radio_message = partial(self._handle_stick_message, stick)
+        self.running = True
+        await asyncio.gather(*(stick.watch() for stick in self.sticks))
+        self.on_start()
+
+    async def replay(self, capture_path: str, speed: float = 1.0):
+        """
+        Process a capture of a stick like live traffic and return when it ends.
+        """
+        self.load_devices()
+        self.stick = IM871A_USB(path=capture_path, dispatch=self.dispatch)
+        self.sticks = [self.stick]
+        self.stick.on_radio_message = partial(self._handle_stick_message, self.stick)
         self.running = True
-        await self.stick.watch()
         self.on_start()
 
+        await self.stick.replay(capture_path, speed=speed)
+
     def stop(self):
         if self.stick is not None:
-            self.stick.stop_watch()
+            for stick in self._all_sticks():
+                stick.stop_watch()
             self.running = False
+            if self._pipeline is not None:
+                self._pipeline.close()
+                self._pipeline = None
+            if self._batcher is not None:
+                self._batcher.flush()
+            for stream in list(self._streams):
+                stream.close()
+            if self._decryptor is not None:
+                self._decryptor.shutdown()
+                self._decryptor = None
+            if self._dispatcher is not None:
+                self._dispatcher.shutdown(wait=False)
+                self._full_streams.discard(id(self._dispatcher))
+                self._dispatcher = None
+            if self.device_store is not None:
+                self.device_store.flush()
             self.on_stop()
 
-    def process_radio_message(self, message: IMSTMessage):
+    def messages(
+        self, maxsize: int = 1024, policy: OverflowPolicy = OverflowPolicy.BLOCK
+    ) -> MessageStream:
+        """
+        Stream of all processed messages for async for device, message in ...
+
+        Every call creates an independent stream, that ends with stop() or close().
+        """
+        stream = MessageStream(
+            maxsize=maxsize,
+            policy=policy,
+            on_full=self._handle_full_stream,
+            on_drain=self._handle_drained_stream,
+            on_close=self._streams.remove,
+        )
+        self._streams.append(stream)
+        return stream
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Counters and histograms of WMbus and its sticks, e.g. for MetricsExporter.
+        """
+        stats: Dict[str, Any] = {
+            "telegrams": self.telegrams,
+            "duplicates": self.duplicates,
+            "short_telegrams": self.short_telegrams,
+            "unknown_manufacturers": self.unknown_manufacturers,
+            "decryption_errors": self.decryption_errors,
+            "callback_latency": self.callback_latency.snapshot(),
+            "devices": {
+                device_id.hex(): count
+                for device_id, count in self.device_telegrams.items()
+            },
+            "sticks": {
+                stick.path: stick.stats()
+                for stick in self._all_sticks()
+                if hasattr(stick, "stats")
+            },
+        }
+        dispatcher = self._dispatcher
+        if dispatcher is not None:
+            stats.update(
+                callbacks_pending=dispatcher.pending,
+                callbacks_errors=dispatcher.errors,
+                callbacks_dropped=dispatcher.dropped,
+            )
+        return stats
+
+    def _all_sticks(self) -> List[Any]:
+        if self.sticks:
+            return self.sticks
+        return [] if self.stick is None else [self.stick]
+
+    def _handle_full_stream(self, stream: Any):
+        # stream is a MessageStream or the CallbackDispatcher
+        if not self._full_streams:
+            logger.info("Message stream is full. Pause reading from the sticks.")
+            for stick in self._all_sticks():
+                stick.pause_reading()
+        self._full_streams.add(id(stream))
+
+    def _handle_drained_stream(self, stream: Any):
+        self._full_streams.discard(id(stream))
+        if not self._full_streams:
+            logger.info("Message streams have capacity again. Resume reading.")
+            for stick in self._all_sticks():
+                stick.resume_reading()
+
+    def set_aes_decryption_key(self, device_id: str, key: bytes):
+        """
+        Store the key on every stick, because every stick can receive the device.
+        The sticks choose the key table slot themselves.
+        """
+        results = [stick.store_aes_key(device_id, key) for stick in self._all_sticks()]
+        if len(results) == 1:
+            return results[0]
+        return asyncio.gather(*results)
+
+    def _set_device_key(self, _index: int, device_id: str, key: bytes):
+        # callback of Device.set_aes_key, that passes the index of the device too
+        return self.set_aes_decryption_key(device_id, key)
+
+    def _handle_stick_message(self, stick: Any, message: AnyIMSTMessage):
+        if len(self.sticks) < 2:
+            self.process_radio_message(message)
+            return
+
+        payload = message.payload
+        if payload is None or len(payload) < 12 or payload[1] != 0x44:
+            self.process_radio_message(message)
+            return
+
+        # the same telegram heard by several sticks, keep the strongest copy
+        key = (bytes(payload[2:8]), payload[11])
+        pending = self._pending_copies.get(key)
+        if pending is None:
+            self._pending_copies[key] = message
+            self._loop.call_later(self.dedup_window, self._release_copy, key)
+            return
+
+        self.duplicates += 1
+        if _rssi(message) > _rssi(pending):
+            self._pending_copies[key] = message
+
+    def _release_copy(self, key: Tuple[bytes, int]):
+        message = self._pending_copies.pop(key, None)
+        if message is not None:
+            self.process_radio_message(message)
+
+    def process_radio_message(self, message: AnyIMSTMessage):
         if message.payload is None:
             return
 
         # 44 -> SND_NR (Send, No Response)
-        if not message.payload[1:2] == b"\x44":
+        if len(message.payload) < 2 or message.payload[1] != 0x44:
             logger.warning("Unknown radio message.")
             return
 
-        device = None
-        device_id = message.payload[2:10]
+        # the header up to the access number is needed for the device and dedup
+        if len(message.payload) < 12:
+            self.short_telegrams += 1
+            lazy_logger.debug(
+                "Drop short telegram {}", lambda: bytes(message.payload).hex()
+            )
+            return
+
+        # the payload can be a view on the receive buffer, keys must be hashable
+        device_id = bytes(message.payload[2:10])
+
+        if self.dedup_cache is not None and self.dedup_cache.seen(
+            (device_id, message.payload[11])
+        ):
+            lazy_logger.debug(
+                "Drop repeated telegram of device {}", lambda: device_id.hex()
+            )
+            return
+
+        if self.key_store is not None and security_mode(message.payload):
+            self._decrypt_message(device_id, message)
+            return
+
+        self._process_telegram(device_id, message)
+
+    def _decrypt_message(self, device_id: bytes, message: AnyIMSTMessage):
+        if self._decryptor is None:
+            self._decryptor = AESDecryptor(
+                self.key_store, executor=self.decryption_executor
+            )
+
+        future = self._decryptor.submit(device_id, message.payload)
+        if future is None:
+            # no key on the host, maybe the stick decrypts the telegram
+            self._process_telegram(device_id, message)
+            return
+
+        pending = (asyncio.wrap_future(future, loop=self._loop), device_id, message)
+        self._pending_decryptions.append(pending)
+        pending[0].add_done_callback(self._deliver_decrypted_messages)
+
+    def _deliver_decrypted_messages(self, _):
+        # deliver in the order of arrival, even if a later telegram was faster
+        while self._pending_decryptions and self._pending_decryptions[0][0].done():
+            future, device_id, message = self._pending_decryptions.popleft()
+            if future.cancelled():
+                continue
+
+            if future.exception() is not None:
+                self.decryption_errors += 1
+                logger.warning(
+                    "Failed to decrypt telegram of device {}: {}",
+                    device_id.hex(),
+                    future.exception(),
+                )
+                continue
+
+            payload = future.result()
+            decrypted_message = IMSTMessage(
+                endpoint_id=message.endpoint_id,
+                message_id=message.message_id,
+                payload_length=len(payload) - 1,
+                with_timestamp_field=message.with_timestamp_field,
+                with_rssi_field=message.with_rssi_field,
+                with_crc_field=message.with_crc_field,
+                payload=payload,
+                rssi=message.rssi,
+                timestamp=message.timestamp,
+            )
+            self._process_telegram(device_id, decrypted_message)
+
+    def _process_telegram(self, device_id: bytes, message: AnyIMSTMessage):
         wmbus_message = WMbusMessage(message)
 
         logger.debug("Decoded to following wireless mbus message:")
-        logger.debug("Manufactur ID: {}", wmbus_message.manufacturer_id[::-1].hex())
-        logger.debug("Serial Number: {}", wmbus_message.serial_number[::-1].hex())
-        logger.debug("Version: {}", wmbus_message.version.hex())
-        logger.debug("Device Type: {}", wmbus_message.device_type.hex())
+        lazy_logger.debug(
+            "Manufactur ID: {}", lambda: wmbus_message.manufacturer_id[::-1].hex()
+        )
+        lazy_logger.debug(
+            "Serial Number: {}", lambda: wmbus_message.serial_number[::-1].hex()
+        )
+        lazy_logger.debug("Version: {}", lambda: wmbus_message.version.hex())
+        lazy_logger.debug("Device Type: {}", lambda: wmbus_message.device_type.hex())
 
-        if device_id in self.devices:
-            device = self.devices[device_id]
-        else:
-            # try to find manufacturar for message
-            if wmbus_message.manufacturer_id == WEPTECH:
-                if wmbus_message.version == b"\x01":
-                    # Temp Sensor
-                    device = WeptechOMSv1(
-                        device_id=device_id.hex(),
-                        index=len(self.devices),
-                        on_set_aes_key=self.stick.set_aes_decryption_key,
-                    )
-                elif wmbus_message.version == b"\x02":
-                    # Temp/Hum Sensor
-                    device = WeptechOMSv2(
-                        device_id=device_id.hex(),
-                        index=len(self.devices),
-                        on_set_aes_key=self.stick.set_aes_decryption_key,
-                    )
-                else:
-                    logger.error(
-                        "The message belongs to an unsupported weptech device. Version: {}",
-                        wmbus_message.version,
-                    )
-                    return
-
-            elif wmbus_message.manufacturer_id == FASTFORWARD:
-                if wmbus_message.version == b"\x01":
-                    # Energy Cam
-                    meter_type = message.payload[9]
-                    device = EnergyCam(
-                        device_id=device_id.hex(),
-                        meter_type=meter_type,
-                        index=len(self.devices),
-                        on_set_aes_key=self.stick.set_aes_decryption_key,
-                    )
-                else:
-                    logger.error(
-                        "The message belongs to an unsupported fastforward device. Version: {}",
-                        wmbus_message.version,
-                    )
-                    return
-
-            elif wmbus_message.manufacturer_id == MOCK:
-                device = MockDevice(
-                    device_id=device_id.hex(),
-                    index=len(self.devices),
-                    on_set_aes_key=self.stick.set_aes_decryption_key,
-                )
-            else:
+        device = self.devices.get(device_id)
+        if device is None:
+            fields = (
+                bytes(message.payload[2:4]),
+                message.payload[8],
+                message.payload[9],
+            )
+            driver = self.drivers.lookup(*fields)
+            if driver is None:
+                self.unknown_manufacturers += 1
                 logger.warning(
                     "Got message from unknown manufactur: {}",
                     wmbus_message.manufacturer_id,
                 )
                 return
 
+            device = driver.from_message(
+                device_id.hex(),
+                wmbus_message,
+                index=self._next_index,
+                on_set_aes_key=self._set_device_key,
+            )
+            self._next_index += 1
+            if self.drivers.is_fallback(*fields):
+                self._fallback_devices.add(device_id)
+
             logger.info("Create new Device with id {}", device_id.hex())
             self.devices[device_id] = device
             self.on_device_registration(device)
 
-        processed_message = device.process_new_message(wmbus_message)
-        self.on_radio_message(device, processed_message)
+        if device_id in self._fallback_devices:
+            self.unknown_manufacturers += 1
+
+        if self.decode_workers > 0:
+            self._get_pipeline().submit(
+                device, message.payload, (device_id, device, message)
+            )
+            return
+
+        self._deliver_message(
+            device_id, device, device.process_new_message(wmbus_message)
+        )
+
+    def _get_pipeline(self) -> "DecodePipeline":
+        if self._pipeline is None:
+            # shared memory needs Python 3.8, so import it only for the workers
+            from pywirelessmbus.utils.pipeline import DecodePipeline
+
+            self._pipeline = DecodePipeline(
+                self._handle_pipeline_results,
+                workers=self.decode_workers,
+                loop=self._loop,
+            )
+            self._pipeline.start()
+        return self._pipeline
+
+    def _handle_pipeline_results(self, results: List[Tuple[Any, "Result"]]):
+        for (device_id, device, message), (values, state, error) in results:
+            if error is not None:
+                logger.warning(
+                    "Failed to process telegram of device {}: {}", device.id, error
+                )
+                continue
+
+            vars(device).update(state)
+            processed_message = WMbusMessage(message)
+            processed_message.values = values
+            self._deliver_message(device_id, device, processed_message)
+
+    def _deliver_message(
+        self, device_id: bytes, device: Device, processed_message: WMbusMessage
+    ):
+        device.last_values = processed_message.values
+        if self.device_store is not None:
+            self.device_store.update(device)
+
+        self.telegrams += 1
+        self.device_telegrams[device_id] = self.device_telegrams.get(device_id, 0) + 1
+        if self.dispatch == DispatchMode.EXECUTOR:
+            self._get_dispatcher().submit(
+                device_id, self.on_radio_message, device, processed_message
+            )
+        else:
+            started_at = time.perf_counter()
+            self.on_radio_message(device, processed_message)
+            self.callback_latency.observe(time.perf_counter() - started_at)
+
+        if self._batcher is not None:
+            self._batcher.add(device, processed_message)
+
+        for stream in self._streams:
+            stream.put(device, processed_message)
+
+    def _get_dispatcher(self) -> CallbackDispatcher:
+        if self._dispatcher is None:
+            self._dispatcher = CallbackDispatcher(
+                self.callback_executor,
+                latency=self.callback_latency,
+                maxsize=self.callback_queue_size,
+                policy=self.callback_overflow,
+                on_full=self._handle_full_stream,
+                # called by a worker thread of the dispatcher
+                on_drain=lambda dispatcher: self._loop.call_soon_threadsafe(
+                    self._handle_drained_stream, dispatcher
+                ),
+            )
+        return self._dispatcher
+
+    def _deliver_batch(self, batch: List[Tuple[Device, WMbusMessage]]):
+        if self.on_radio_batch is None:
+            return
+
+        if self.dispatch == DispatchMode.EXECUTOR:
+            # one key for all batches, so they arrive in order
+            self._get_dispatcher().submit("batches", self.on_radio_batch, batch)
+        else:
+            self.on_radio_batch(batch)
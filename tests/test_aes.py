@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from pywirelessmbus import KeyStore, WMbus
+from pywirelessmbus.exceptions import DecryptionError
+from pywirelessmbus.sticks import MockStick
+from pywirelessmbus.utils import IMSTMessage
+from pywirelessmbus.utils.aes import decrypt_telegram, security_mode
+
+cryptography = pytest.importorskip("cryptography")
+from cryptography.hazmat.primitives.ciphers import (  # noqa: E402
+    Cipher,
+    algorithms,
+    modes,
+)
+from cryptography.hazmat.primitives.cmac import CMAC  # noqa: E402
+
+KEY = bytes(range(16))
+ADDRESS = b"\xff\xff\x78\x56\x34\x12\x01\x07"
+PLAIN_DATA = b"\x2f\x2f\x0c\x13\x27\x04\x85\x02\x2f\x2f\x2f\x2f\x2f\x2f\x2f\x2f"
+
+
+def encrypt(key: bytes, iv: bytes, data: bytes) -> bytes:
+    encryptor = Cipher(algorithms.AES(key), modes.CBC(iv)).encryptor()
+    return encryptor.update(data) + encryptor.finalize()
+
+
+def mode5_telegram(data: bytes, key: bytes = KEY) -> bytes:
+    access_number = 0x2A
+    iv = ADDRESS + bytes([access_number]) * 8
+    body = b"\x44" + ADDRESS + b"\x7a" + bytes([access_number, 0x00, 0x10, 0x05])
+    body += encrypt(key, iv, data)
+    return bytes([len(body)]) + body
+
+
+def test_security_mode():
+    assert security_mode(mode5_telegram(PLAIN_DATA)) == 5
+
+
+def test_decrypt_mode5():
+    payload = mode5_telegram(PLAIN_DATA)
+    decrypted = decrypt_telegram(payload, KEY)
+
+    assert decrypted[:15] == payload[:15]
+    assert decrypted[15:] == PLAIN_DATA
+
+
+def test_decrypt_with_wrong_key():
+    with pytest.raises(DecryptionError):
+        decrypt_telegram(mode5_telegram(PLAIN_DATA), bytes(16))
+
+
+def test_decrypt_mode7():
+    message_counter = 0x01020304
+    cmac = CMAC(algorithms.AES(KEY))
+    counter = message_counter.to_bytes(4, "little")
+    cmac.update(b"\x00" + counter + b"\x78\x56\x34\x12" + b"\x07" * 7)
+    encrypted = encrypt(cmac.finalize(), bytes(16), PLAIN_DATA)
+
+    afl = b"\x90\x0e\x00\x14" + counter + bytes(8)
+    tpl = b"\x7a\x2a\x00\x10\x07\x10"
+    body = b"\x44" + ADDRESS + afl + tpl + encrypted
+    payload = bytes([len(body)]) + body
+
+    assert security_mode(payload) == 7
+    assert decrypt_telegram(payload, KEY).endswith(PLAIN_DATA)
+
+
+@pytest.mark.asyncio
+async def test_wmbus_decrypts_on_executor():
+    received = []
+    wMbus = WMbus(
+        "IM871A_USB",
+        stick=MockStick(),
+        key_store=KeyStore({ADDRESS.hex(): KEY.hex()}),
+        on_radio_message=lambda device, message: received.append(message),
+    )
+    payload = mode5_telegram(PLAIN_DATA)
+    message = IMSTMessage(
+        endpoint_id=2,
+        message_id=b"\x03",
+        payload_length=len(payload) - 1,
+        with_timestamp_field=False,
+        with_crc_field=False,
+        with_rssi_field=False,
+        payload=payload,
+    )
+    wMbus.process_radio_message(message)
+    assert received == []
+
+    for _ in range(100):
+        await asyncio.sleep(0.01)
+        if received:
+            break
+
+    assert received[0].raw[15:] == PLAIN_DATA
+    wMbus.stop()
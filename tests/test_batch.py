@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from pywirelessmbus import WMbus
+from pywirelessmbus.sticks import MockStick
+from pywirelessmbus.utils import IMSTMessage
+from pywirelessmbus.utils.batch import MessageBatcher
+
+MOCK_MESSAGE = IMSTMessage(
+    endpoint_id=2,
+    message_id=b"\x03",
+    payload_length=15,
+    with_timestamp_field=False,
+    with_crc_field=False,
+    with_rssi_field=False,
+    payload=b"\x0f\x44\xff\xff\x12\xaa\xaa\xbb\x12\x13\x14\x15\x12\x13\x14\x15",
+)
+
+
+@pytest.mark.asyncio
+async def test_flush_by_size():
+    batches = []
+    batcher = MessageBatcher(batches.append, max_size=3, max_latency=10)
+    for number in range(7):
+        batcher.add("device", number)
+
+    assert [[message for _, message in batch] for batch in batches] == [
+        [0, 1, 2],
+        [3, 4, 5],
+    ]
+    assert len(batcher) == 1
+
+    batcher.flush()
+    assert batches[-1] == [("device", 6)]
+    assert batcher.batches == 3
+
+
+@pytest.mark.asyncio
+async def test_flush_by_latency():
+    batches = []
+    batcher = MessageBatcher(batches.append, max_size=100, max_latency=0.01)
+    batcher.add("device", 1)
+    batcher.add("device", 2)
+    assert batches == []
+
+    await asyncio.sleep(0.05)
+    assert batches == [[("device", 1), ("device", 2)]]
+
+
+@pytest.mark.asyncio
+async def test_wmbus_radio_batch():
+    batches = []
+    wMbus = WMbus(
+        "IM871A_USB",
+        stick=MockStick(),
+        on_radio_batch=batches.append,
+        batch_size=2,
+    )
+    for _ in range(3):
+        wMbus.process_radio_message(MOCK_MESSAGE)
+
+    assert len(batches) == 1
+    assert [device.id for device, _ in batches[0]] == ["ffff12aaaabb1213"] * 2
+
+    # the rest is delivered on stop
+    wMbus.stop()
+    assert len(batches) == 2
+    assert len(batches[1]) == 1
@@ -0,0 +1,65 @@
+import time
+
+import pytest
+
+from pywirelessmbus import WMbus
+from pywirelessmbus.sticks.im871a import MessageProtocol
+from pywirelessmbus.utils.capture import CaptureWriter, read_capture
+
+PING_RESPONSE = b"\xa5\x01\x02\x00"
+RADIO_MESSAGE = (
+    b"\xa5\x02\x03\x0f\x44\xff\xff\x12\xaa\xaa\xbb\x12\x13\x14\x15\x12\x13\x14\x15"
+)
+
+
+@pytest.mark.asyncio
+async def test_capture_received_frames(tmp_path):
+    capture = CaptureWriter(tmp_path / "stick.cap")
+    protocol = MessageProtocol(capture=capture)
+    protocol.data_received(PING_RESPONSE + RADIO_MESSAGE[:5])
+    protocol.data_received(RADIO_MESSAGE[5:])
+    capture.close()
+
+    # appending continues the capture
+    capture = CaptureWriter(tmp_path / "stick.cap")
+    capture.write(PING_RESPONSE, timestamp=0)
+    capture.close()
+
+    records = list(read_capture(tmp_path / "stick.cap"))
+    assert [frame for _, frame in records] == [
+        PING_RESPONSE,
+        RADIO_MESSAGE,
+        PING_RESPONSE,
+    ]
+    assert records[0][0] <= records[1][0]
+
+
+def test_invalid_capture(tmp_path):
+    (tmp_path / "stick.cap").write_bytes(b"\x00" * 16)
+    with pytest.raises(ValueError):
+        list(read_capture(tmp_path / "stick.cap"))
+
+
+@pytest.mark.asyncio
+async def test_replay(tmp_path):
+    capture = CaptureWriter(tmp_path / "stick.cap")
+    for index in range(100):
+        capture.write(RADIO_MESSAGE, timestamp=index * 2_000_000)
+    capture.close()
+
+    messages = []
+    wMbus = WMbus(
+        "IM871A_USB",
+        on_radio_message=lambda device, message: messages.append(message),
+    )
+    started_at = time.monotonic()
+    await wMbus.replay(str(tmp_path / "stick.cap"), speed=2)
+
+    # 198 ms of traffic at double speed
+    assert time.monotonic() - started_at >= 0.099
+    assert len(messages) == 100
+    assert len(wMbus.devices) == 1
+
+    messages.clear()
+    await wMbus.replay(str(tmp_path / "stick.cap"), speed=0)
+    assert len(messages) == 100
@@ -0,0 +1,160 @@
+import asyncio
+
+import pytest
+
+from pywirelessmbus import WMbus
+from pywirelessmbus.sticks.command_queue import Command, CommandQueue
+from pywirelessmbus.sticks.emulator import StickEmulator
+from pywirelessmbus.sticks.im871a import IM871A_USB
+from pywirelessmbus.utils import IMSTFrame
+
+
+class FakeTransport:
+    def __init__(self):
+        self.written = []
+
+    def write(self, data: bytes):
+        self.written.append(data)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.mark.asyncio
+async def test_write_immediately():
+    written = []
+    queue = CommandQueue(written.append)
+    queue.put(Command(b"\x01"))
+    queue.put(Command(b"\x02"))
+
+    assert written == [b"\x01", b"\x02"]
+    assert queue.stats() == {"depth": 0, "max_depth": 1, "written": 2, "coalesced": 0}
+
+
+@pytest.mark.asyncio
+async def test_pause_and_resume():
+    written = []
+    queue = CommandQueue(written.append)
+    queue.pause()
+    queue.put(Command(b"\x01"))
+    queue.put(Command(b"\x02", key="config"))
+
+    assert written == []
+    assert queue.depth == 2
+    assert queue.queued("config").frame == b"\x02"
+    assert queue.queued("other") is None
+
+    queue.resume()
+    assert written == [b"\x01", b"\x02"]
+    assert queue.depth == 0
+
+
+@pytest.mark.asyncio
+async def test_rate_limit():
+    written = []
+    clock = FakeClock()
+    queue = CommandQueue(written.append, rate=10, clock=clock)
+    for number in range(3):
+        queue.put(Command(bytes([number])))
+
+    assert written == [b"\x00"]
+    assert queue.depth == 2
+
+    clock.now = 0.1
+    await asyncio.sleep(0.15)
+    assert written == [b"\x00", b"\x01"]
+
+    clock.now = 0.2
+    await asyncio.sleep(0.15)
+    assert written == [b"\x00", b"\x01", b"\x02"]
+
+    queue.put(Command(b"\x03"))
+    queue.clear()
+    assert queue.depth == 0
+
+
+@pytest.fixture
+def stick():
+    stick = IM871A_USB(path="/dev/null", request_timeout=1)
+    stick.transport = FakeTransport()
+    return stick
+
+
+@pytest.mark.asyncio
+async def test_timeout_starts_when_written(stick):
+    stick.command_queue.pause()
+    ping = stick.ping(timeout=0.01)
+    await asyncio.sleep(0.05)
+    assert not ping.done()
+
+    stick.command_queue.resume()
+    with pytest.raises(asyncio.TimeoutError):
+        await ping
+
+
+@pytest.mark.asyncio
+async def test_request_fails_after_queue_timeout(stick):
+    stick.queue_timeout = 0.05
+    stick.command_queue.pause()
+    ping = stick.ping()
+    infos = stick.get_device_infos()
+
+    with pytest.raises(asyncio.TimeoutError, match="command queue"):
+        await ping
+    with pytest.raises(asyncio.TimeoutError, match="command queue"):
+        await infos
+
+    # the expired requests are not sent, the next one gets the response
+    stick.command_queue.resume()
+    assert stick.transport.written == []
+    ping = stick.ping()
+    assert stick.transport.written == [b"\xa5\x01\x01\x00"]
+    stick.process_message(IMSTFrame(b"\xa5\x01\x02\x00"))
+    assert await ping is True
+
+
+@pytest.mark.asyncio
+async def test_command_rate_of_wmbus():
+    emulator = StickEmulator()
+    wMbus = WMbus("IM871A_USB", path=emulator.start(), command_rate=20)
+    try:
+        await wMbus.start()
+        assert wMbus.stick.command_queue.rate == 20
+        assert await wMbus.stick.ping() is True
+    finally:
+        wMbus.stick.pause_reading()
+        wMbus.stop()
+        emulator.stop()
+
+
+@pytest.mark.asyncio
+async def test_coalesce_waiting_config(stick):
+    stick.command_queue.pause()
+    first = stick.configure(link_mode=3)
+    second = stick.configure(auto_rssi_attachment=True)
+    persistent = stick.configure(persistant=True, led_control=False)
+
+    assert stick.stats()["command_queue_depth"] == 2
+    assert stick.stats()["commands_coalesced"] == 1
+
+    stick.command_queue.resume()
+    assert stick.transport.written == [
+        b"\xa5\x01\x03\x05\x00\x02\x03\x10\x01",
+        b"\xa5\x01\x03\x04\x01\x00\x40\x00",
+    ]
+
+    stick.process_message(IMSTFrame(b"\xa5\x01\x04\x01\x00"))
+    stick.process_message(IMSTFrame(b"\xa5\x01\x04\x01\x00"))
+    assert await first is True
+    assert await second is True
+    assert await persistent is True
+    assert stick.config.as_dict() == {
+        "link_mode": 3,
+        "auto_rssi_attachment": True,
+        "led_control": False,
+    }
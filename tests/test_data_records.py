@@ -0,0 +1,76 @@
+import calendar
+
+from pywirelessmbus.devices import GenericOMS
+from pywirelessmbus.utils import IMSTMessage, WMbusMessage
+from pywirelessmbus.utils.data_records import (
+    application_data_offset,
+    decode_data_records,
+)
+from pywirelessmbus.utils.message import ValueType
+
+WEPTECH_V2_PAYLOAD = (
+    b"\x2e\x44\xb0\x5c\x74\x72\x00\x00\x02\x1b\x7a\xbf\x00\x00\x00\x2f\x2f\x0a\x66"
+    + b"\x39\x02\x0a\xfb\x1a\x00\x05\x02\xfd\x97\x1d\x00\x00\x2f\x2f\x2f\x2f\x2f\x2f"
+    + b"\x2f\x2f\x2f\x2f\x2f\x2f\x2f\x2f\x2f"
+)
+
+
+def test_application_data_offset():
+    assert application_data_offset(WEPTECH_V2_PAYLOAD) == 15
+
+
+def test_decode_weptech_records():
+    values = decode_data_records(WEPTECH_V2_PAYLOAD, timestamp=1.0, offset=15)
+
+    assert [(value.value, value.unit, value.type) for value in values] == [
+        (23.9, "°C", ValueType.TEMPERATURE),
+        (50.0, "%", ValueType.HUMIDITY),
+        (0, "", ValueType.ERROR_FLAGS),
+    ]
+    assert all(value.timestamp == 1.0 for value in values)
+
+
+def test_decode_codings():
+    records = (
+        # 32 bit integer energy in Wh
+        b"\x04\x03\x39\x30\x00\x00"
+        # storage number 1 in a DIFE, 8 digit BCD volume in 10^-3 m3
+        + b"\x8c\x01\x13\x78\x56\x34\x12"
+        # negative BCD flow temperature in 10^-1 °C
+        + b"\x0a\x5a\x50\xf1"
+        # real power in W
+        + b"\x05\x2b\x00\x00\x48\x42"
+        # date and time
+        + b"\x04\x6d\x1e\x0c\xb1\x2a"
+        # variable length text is skipped
+        + b"\x0d\xfd\x0c\x03abc"
+        # manufacturer specific data ends the records
+        + b"\x0f\x01\x02"
+    )
+    values = decode_data_records(records)
+
+    assert [(value.value, value.unit) for value in values] == [
+        (12345, "Wh"),
+        (12345.678, "m3"),
+        (-15.0, "°C"),
+        (50.0, "W"),
+        (calendar.timegm((2021, 10, 17, 12, 30, 0)), "timestamp"),
+    ]
+
+
+def test_generic_device():
+    device = GenericOMS(device_id="device_id", index=0)
+    raw_message = IMSTMessage(
+        endpoint_id=2,
+        message_id=b"\x03",
+        payload_length=46,
+        with_timestamp_field=False,
+        with_crc_field=False,
+        with_rssi_field=False,
+        payload=WEPTECH_V2_PAYLOAD,
+    )
+    message = device.process_new_message(WMbusMessage(raw_message))
+
+    assert message.values[0].value == 23.9
+    assert message.values[1].value == 50
+    assert device.updated_at is not None
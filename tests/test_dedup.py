@@ -0,0 +1,45 @@
+from pywirelessmbus.utils.dedup import DedupCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_repeated_key_is_hit():
+    cache = DedupCache(ttl=10, clock=Clock())
+
+    assert not cache.seen(("device", 1))
+    assert cache.seen(("device", 1))
+    assert not cache.seen(("device", 2))
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_entries_expire():
+    clock = Clock()
+    cache = DedupCache(ttl=10, clock=clock)
+
+    cache.seen("a")
+    clock.now = 5
+    cache.seen("b")
+    clock.now = 12
+
+    assert not cache.seen("a")
+    assert cache.seen("b")
+    assert len(cache) == 2
+
+
+def test_max_entries():
+    cache = DedupCache(ttl=10, max_entries=2, clock=Clock())
+
+    for key in "abc":
+        cache.seen(key)
+
+    assert len(cache) == 2
+    assert cache.evictions == 1
+    assert "a" not in cache
+    assert not cache.seen("a")
@@ -0,0 +1,59 @@
+from pywirelessmbus import DeviceStore, WMbus
+from pywirelessmbus.devices import EnergyCam, WeptechOMSv2
+from pywirelessmbus.sticks import MockStick
+from pywirelessmbus.utils import IMSTMessage
+from pywirelessmbus.utils.message import ValueType
+
+WEPTECH_V2_MESSAGE = IMSTMessage(
+    endpoint_id=2,
+    message_id=b"\x03",
+    payload_length=46,
+    with_timestamp_field=False,
+    with_crc_field=False,
+    with_rssi_field=False,
+    payload=b"\x2e\x44\xb0\x5c\x74\x72\x00\x00\x02\x1b\x7a\xbf\x00\x00\x00\x2f\x2f\x0a\x66\x39\x02\x0a\xfb\x1a\x00\x05\x02\xfd\x97\x1d\x00\x00\x2f\x2f\x2f\x2f\x2f\x2f\x2f\x2f\x2f\x2f\x2f\x2f\x2f\x2f\x2f",
+)
+
+
+def test_store_driver_arguments(tmp_path):
+    store = DeviceStore(str(tmp_path / "devices.db"))
+    store.update(EnergyCam(meter_type=7, device_id="c41801020304011b", index=4))
+    store.close()
+
+    devices = DeviceStore(str(tmp_path / "devices.db")).load()
+    assert len(devices) == 1
+    assert isinstance(devices[0], EnergyCam)
+    assert devices[0].meter_type == 7
+    assert devices[0].index == 0
+
+
+def test_warm_start(tmp_path):
+    store = DeviceStore(str(tmp_path / "devices.db"))
+    wMbus = WMbus("IM871A_USB", stick=MockStick(), device_store=store)
+    wMbus.process_radio_message(WEPTECH_V2_MESSAGE)
+    assert len(store) == 0
+    wMbus.stop()
+    assert len(store) == 1
+
+    registered = []
+    wMbus = WMbus(
+        "IM871A_USB",
+        stick=MockStick(),
+        device_store=DeviceStore(str(tmp_path / "devices.db")),
+        on_device_registration=registered.append,
+    )
+    wMbus.load_devices()
+
+    device = wMbus.devices[bytes.fromhex("b05c74720000021b")]
+    assert registered == [device]
+    assert isinstance(device, WeptechOMSv2)
+    assert device.index == 0
+    assert [(value.value, value.type) for value in device.last_values] == [
+        (23.9, ValueType.TEMPERATURE),
+        (50.0, ValueType.HUMIDITY),
+    ]
+
+    # new devices are numbered after the stored ones
+    wMbus.devices.clear()
+    wMbus.load_devices()
+    assert wMbus._next_index == 1
@@ -0,0 +1,165 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from pywirelessmbus import DispatchMode, WMbus
+from pywirelessmbus.sticks import MockStick
+from pywirelessmbus.sticks.im871a import MessageProtocol
+from pywirelessmbus.utils import IMSTMessage
+from pywirelessmbus.utils.dispatch import CallbackDispatcher
+from pywirelessmbus.utils.stream import OverflowPolicy
+
+RADIO_MESSAGE = (
+    b"\xa5\x02\x03\x0f\x44\xff\xff\x12\xaa\xaa\xbb\x12\x13\x14\x15\x12\x13\x14\x15"
+)
+
+
+def mock_message(device: int) -> IMSTMessage:
+    return IMSTMessage(
+        endpoint_id=2,
+        message_id=b"\x03",
+        payload_length=15,
+        with_timestamp_field=False,
+        with_crc_field=False,
+        with_rssi_field=False,
+        payload=b"\x0f\x44\xff\xff"
+        + bytes([device])
+        + b"\xaa\xaa\xbb\x12\x13\x14\x15\x12\x13\x14\x15",
+    )
+
+
+def test_dispatcher_keeps_order_per_key():
+    calls = []
+    dispatcher = CallbackDispatcher(max_workers=4)
+
+    def callback(key, number):
+        # later callbacks of other keys overtake the slow first ones
+        time.sleep(0.01 if number == 0 else 0)
+        calls.append((key, number))
+
+    for number in range(5):
+        for key in ("a", "b", "c"):
+            dispatcher.submit(key, callback, key, number)
+    dispatcher.shutdown(wait=True)
+
+    for key in ("a", "b", "c"):
+        assert [number for k, number in calls if k == key] == list(range(5))
+    assert dispatcher.pending == 0
+
+
+def test_dispatcher_counts_errors():
+    dispatcher = CallbackDispatcher(max_workers=1)
+    dispatcher.submit("a", lambda: 1 / 0)
+    dispatcher.shutdown(wait=True)
+
+    assert dispatcher.errors == 1
+
+
+def test_dispatcher_limits():
+    release = threading.Event()
+    calls = []
+
+    def callback(number):
+        release.wait(1)
+        calls.append(number)
+
+    dispatcher = CallbackDispatcher(
+        max_workers=1, maxsize=2, policy=OverflowPolicy.DROP_NEWEST
+    )
+    assert [dispatcher.submit("a", callback, number) for number in range(4)] == [
+        True,
+        True,
+        False,
+        False,
+    ]
+    release.set()
+    dispatcher.shutdown(wait=True)
+    assert calls == [0, 1]
+    assert dispatcher.dropped == 2
+
+
+def test_dispatcher_keeps_latest_per_key():
+    release = threading.Event()
+    calls = []
+
+    def callback(number):
+        release.wait(1)
+        calls.append(number)
+
+    dispatcher = CallbackDispatcher(
+        max_workers=1, policy=OverflowPolicy.LATEST_PER_DEVICE
+    )
+    for number in range(4):
+        dispatcher.submit("a", callback, number)
+    release.set()
+    dispatcher.shutdown(wait=True)
+
+    # the first callback was running, the others replaced each other
+    assert calls == [0, 3]
+    assert dispatcher.dropped == 2
+
+
+def test_dispatcher_blocks():
+    release = threading.Event()
+    events = []
+    dispatcher = CallbackDispatcher(
+        max_workers=1,
+        maxsize=2,
+        on_full=lambda _: events.append("full"),
+        on_drain=lambda _: events.append("drain"),
+    )
+    for _ in range(3):
+        assert dispatcher.submit("a", release.wait, 1) is True
+    assert events == ["full"]
+    assert dispatcher.pending == 3
+
+    release.set()
+    dispatcher.shutdown(wait=True)
+    assert events == ["full", "drain"]
+    assert dispatcher.dropped == 0
+
+
+def test_inline_dispatch_without_event_loop():
+    messages = []
+    protocol = MessageProtocol(on_message=messages.append, dispatch=DispatchMode.INLINE)
+    protocol.data_received(RADIO_MESSAGE * 2)
+
+    assert len(messages) == 2
+
+
+@pytest.mark.asyncio
+async def test_batch_dispatch():
+    messages = []
+    protocol = MessageProtocol(on_message=messages.append)
+    protocol.data_received(RADIO_MESSAGE + RADIO_MESSAGE[:5])
+    protocol.data_received(RADIO_MESSAGE[5:])
+    assert messages == []
+
+    await asyncio.sleep(0)
+    assert len(messages) == 2
+
+
+def test_executor_dispatch():
+    threads = []
+    calls = []
+    wMbus = WMbus(
+        "IM871A_USB",
+        stick=MockStick(),
+        dispatch=DispatchMode.EXECUTOR,
+        on_radio_message=lambda device, message: (
+            threads.append(threading.get_ident()),
+            calls.append((device.id, message.access_number)),
+        ),
+    )
+    for device in range(3):
+        wMbus.process_radio_message(mock_message(device))
+        wMbus.process_radio_message(mock_message(device))
+    wMbus._dispatcher.shutdown(wait=True)
+
+    assert len(calls) == 6
+    assert threading.get_ident() not in threads
+    assert wMbus.callback_latency.count == 6
+    assert wMbus.stats()["callbacks_pending"] == 0
+    assert wMbus.stats()["callbacks_dropped"] == 0
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from pywirelessmbus import WMbus
+from pywirelessmbus.devices import EnergyCam, GenericOMS, WeptechOMSv1, WeptechOMSv2
+from pywirelessmbus.sticks.emulator import StickEmulator, create_meters
+from pywirelessmbus.utils.message import ValueType
+
+
+@pytest.fixture
+def emulator():
+    emulator = StickEmulator(create_meters(4), rate=200, crc=True)
+    yield emulator
+    emulator.stop()
+
+
+async def wait_for(condition, timeout: float = 2.0):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("Condition not reached.")
+
+
+@pytest.mark.asyncio
+async def test_receive_simulated_meters(emulator):
+    messages = []
+    wMbus = WMbus(
+        "IM871A_USB",
+        path=emulator.start(),
+        on_radio_message=lambda device, message: messages.append(message),
+    )
+    await wMbus.start()
+    await wait_for(lambda: len(wMbus.devices) == 4)
+
+    assert sorted(type(device).__name__ for device in wMbus.devices.values()) == [
+        EnergyCam.__name__,
+        GenericOMS.__name__,
+        WeptechOMSv1.__name__,
+        WeptechOMSv2.__name__,
+    ]
+    assert all(message.values for message in messages)
+    assert {value.type for message in messages for value in message.values} >= {
+        ValueType.TEMPERATURE,
+        ValueType.HUMIDITY,
+        ValueType.ELECTRICAL_ENERGY,
+        ValueType.ENERGY,
+    }
+    assert wMbus.stick.rejected_frames == 0
+
+    wMbus.stick.pause_reading()
+    wMbus.stop()
+
+
+@pytest.mark.asyncio
+async def test_device_management(emulator):
+    emulator.meters = []
+    wMbus = WMbus("IM871A_USB", path=emulator.start())
+    await wMbus.start()
+    stick = wMbus.stick
+
+    assert await stick.ping() is True
+    config = await stick.get_device_configuration()
+    assert config.link_mode == 3
+    assert config.auto_rssi_attachment is True
+
+    assert await stick.set_device_configuration(b"\x02\x06\x00") is True
+    config = await stick.get_device_configuration()
+    assert config.link_mode == 6
+    assert stick.link_mode == 6
+
+    info = await stick.get_device_infos()
+    assert info.module_type == 0x33
+    assert info.device_id == "12345678"
+
+    assert await stick.store_aes_key("b05c74720000021b", bytes(16)) is True
+    assert emulator.keys[0] == (bytes.fromhex("b05c74720000021b"), bytes(16))
+
+    stick.pause_reading()
+    wMbus.stop()
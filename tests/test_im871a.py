@@ -0,0 +1,345 @@
+import asyncio
+
+import pytest
+
+from pywirelessmbus.exceptions import StickNotConnectedError
+from pywirelessmbus.sticks.config import decode_config, encode_config
+from pywirelessmbus.sticks.im871a import IM871A_USB, FrameAssembler, MessageProtocol
+from pywirelessmbus.sticks.key_slots import KeySlotManager
+from pywirelessmbus.utils import IMSTFrame
+from pywirelessmbus.utils.dispatch import DispatchMode
+from pywirelessmbus.utils.crc import crc16
+
+PING_RESPONSE = b"\xa5\x01\x02\x00"
+RADIO_MESSAGE = (
+    b"\xa5\x62\x03\x0f\x44\xff\xff\x12\xaa\xaa\xbb\x12\x13\x14\x15\x12\x13\x14\x15"
+    + b"\x01\x02\x03\x04\xc8"
+)
+
+
+def test_assemble_single_frame():
+    assembler = FrameAssembler()
+    assert assembler.feed(PING_RESPONSE) == [PING_RESPONSE]
+    assert assembler.pending == 0
+
+
+def test_assemble_coalesced_frames():
+    assembler = FrameAssembler()
+    frames = assembler.feed(PING_RESPONSE + RADIO_MESSAGE + PING_RESPONSE)
+    assert frames == [PING_RESPONSE, RADIO_MESSAGE, PING_RESPONSE]
+
+
+def test_assemble_split_frame():
+    assembler = FrameAssembler()
+    assert assembler.feed(RADIO_MESSAGE[:3]) == []
+    assert assembler.feed(RADIO_MESSAGE[3:10]) == []
+    assert assembler.pending == 10
+    assert assembler.feed(RADIO_MESSAGE[10:] + PING_RESPONSE[:2]) == [RADIO_MESSAGE]
+    assert assembler.feed(PING_RESPONSE[2:]) == [PING_RESPONSE]
+
+
+def test_resync_on_garbage():
+    assembler = FrameAssembler()
+    frames = assembler.feed(b"\x00\x13\xa5\x00" + PING_RESPONSE + b"\xff")
+    assert frames == [PING_RESPONSE]
+    assert assembler.dropped_bytes == 5
+    assert assembler.pending == 0
+
+
+def test_buffer_wraps_around():
+    assembler = FrameAssembler(capacity=16)
+    for _ in range(100):
+        assert assembler.feed(RADIO_MESSAGE[:7]) == []
+        assert assembler.feed(RADIO_MESSAGE[7:] + RADIO_MESSAGE) == [
+            RADIO_MESSAGE,
+            RADIO_MESSAGE,
+        ]
+
+
+def with_crc(frame: bytes) -> bytes:
+    frame = frame[:1] + bytes([frame[1] | 0x80]) + frame[2:]
+    return frame + crc16(frame[1:]).to_bytes(2, "little")
+
+
+def test_resync_inside_frame_with_invalid_crc():
+    assembler = FrameAssembler(verify_crc=True)
+    ping = with_crc(PING_RESPONSE)
+    # a false start, that claims the next two frames
+    frames = assembler.feed(b"\xa5\x82\x03\x0a" + ping + ping + RADIO_MESSAGE)
+
+    assert frames == [ping, ping, RADIO_MESSAGE]
+    assert assembler.crc_errors == 1
+    assert assembler.dropped_bytes == 4
+    assert assembler.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_drop_incomplete_frame_after_timeout():
+    messages = []
+    protocol = MessageProtocol(
+        on_message=messages.append, dispatch=DispatchMode.INLINE, frame_timeout=0.05
+    )
+    protocol.data_received(b"\xa5\x02\x03\xff" + PING_RESPONSE * 10)
+    assert messages == []
+
+    await asyncio.sleep(0.1)
+    assert len(messages) == 10
+    assert protocol.assembler.pending == 0
+    assert protocol.assembler.dropped_bytes == 4
+
+    # a frame, that is split over reads, is kept
+    protocol.data_received(RADIO_MESSAGE[:5])
+    await asyncio.sleep(0.01)
+    protocol.data_received(RADIO_MESSAGE[5:10])
+    await asyncio.sleep(0.01)
+    protocol.data_received(RADIO_MESSAGE[10:])
+    assert len(messages) == 11
+    await asyncio.sleep(0.1)
+    assert protocol.assembler.dropped_bytes == 4
+
+
+def test_crc16_check_value():
+    assert crc16(b"123456789") == 0x906E
+
+
+def test_decode_message_with_valid_crc():
+    messages = []
+    protocol = MessageProtocol(on_message=messages.append)
+    protocol.decode_message(with_crc(RADIO_MESSAGE))
+
+    assert len(messages) == 1
+    assert messages[0].rssi == 0xC8
+    assert protocol.crc_errors == 0
+
+
+def test_decode_message_with_invalid_crc():
+    messages = []
+    protocol = MessageProtocol(on_message=messages.append)
+    frame = bytearray(with_crc(RADIO_MESSAGE))
+    frame[8] ^= 0x01
+    protocol.decode_message(bytes(frame))
+
+    assert messages == []
+    assert protocol.crc_errors == 1
+
+    protocol.verify_crc = False
+    protocol.decode_message(bytes(frame))
+    assert len(messages) == 1
+
+
+def test_frame_fields():
+    message = IMSTFrame(with_crc(RADIO_MESSAGE))
+
+    assert message.endpoint_id == 2
+    assert message.message_id == b"\x03"
+    assert message.payload_length == 15
+    assert message.with_timestamp_field
+    assert message.with_rssi_field
+    assert message.with_crc_field
+    assert message.payload == RADIO_MESSAGE[3:19]
+    assert message.timestamp == b"\x01\x02\x03\x04"
+    assert message.rssi == 0xC8
+    assert message.crc == with_crc(RADIO_MESSAGE)[-2:]
+    assert message.check_message_length()
+
+
+def test_frame_without_optional_fields():
+    message = IMSTFrame(PING_RESPONSE)
+
+    assert message.endpoint_id == 1
+    assert message.message_id == b"\x02"
+    assert message.payload == b"\x00"
+    assert message.timestamp is None
+    assert message.rssi is None
+    assert message.crc is None
+
+
+def test_frames_stay_valid_after_buffer_switch():
+    messages = []
+    protocol = MessageProtocol(
+        on_message=messages.append, assembler=FrameAssembler(capacity=64)
+    )
+    for _ in range(20):
+        for frame in protocol.assembler.feed(RADIO_MESSAGE):
+            protocol.decode_message(frame)
+
+    assert len(messages) == 20
+    assert all(message.frame == RADIO_MESSAGE for message in messages)
+
+
+class FakeTransport:
+    def __init__(self):
+        self.written = []
+
+    def write(self, data: bytes):
+        self.written.append(data)
+
+
+@pytest.fixture
+def stick():
+    stick = IM871A_USB(path="/dev/null", request_timeout=1)
+    stick.transport = FakeTransport()
+    return stick
+
+
+@pytest.mark.asyncio
+async def test_request_resolves_with_response(stick):
+    ping = stick.ping()
+    assert stick.transport.written == [b"\xa5\x01\x01\x00"]
+
+    stick.process_message(IMSTFrame(PING_RESPONSE))
+    assert await ping is True
+
+
+@pytest.mark.asyncio
+async def test_pipelined_requests(stick):
+    infos = stick.get_device_infos()
+    first_key = stick.set_aes_decryption_key(0, "b05c74720000021b", bytes(16))
+    second_key = stick.set_aes_decryption_key(1, "b05c74720000021c", bytes(16))
+    assert len(stick.transport.written) == 3
+
+    stick.process_message(IMSTFrame(b"\xa5\x01\x26\x01\x00"))
+    stick.process_message(IMSTFrame(b"\xa5\x01\x26\x01\x01"))
+    stick.process_message(
+        IMSTFrame(b"\xa5\x01\x10\x08\x33\x00\x01\x02\x12\x34\x56\x78")
+    )
+
+    assert await first_key is True
+    assert await second_key is False
+    info = await infos
+    assert info.module_type == 0x33
+    assert info.firmware_version == 0x01
+    assert info.device_id == "12345678"
+
+
+@pytest.mark.asyncio
+async def test_request_timeout(stick):
+    with pytest.raises(asyncio.TimeoutError):
+        await stick.ping(timeout=0.01)
+
+    # a late response must not fail
+    stick.process_message(IMSTFrame(PING_RESPONSE))
+
+
+@pytest.mark.asyncio
+async def test_late_response_of_expired_request(stick):
+    with pytest.raises(asyncio.TimeoutError):
+        await stick.get_device_infos(timeout=0.01)
+    infos = stick.get_device_infos(timeout=0.5)
+
+    # the response of the expired request doesn't resolve the next one
+    stick.process_message(
+        IMSTFrame(b"\xa5\x01\x10\x08\x33\x00\x01\x02\x00\x00\x00\x01")
+    )
+    await asyncio.sleep(0)
+    assert not infos.done()
+
+    stick.process_message(
+        IMSTFrame(b"\xa5\x01\x10\x08\x33\x00\x01\x02\x12\x34\x56\x78")
+    )
+    assert (await infos).device_id == "12345678"
+
+    # a response, that never comes, blocks the next requests only for the timeout
+    with pytest.raises(asyncio.TimeoutError):
+        await stick.ping(timeout=0.01)
+    await asyncio.sleep(0.02)
+    ping = stick.ping()
+    stick.process_message(IMSTFrame(PING_RESPONSE))
+    assert await ping is True
+
+
+@pytest.mark.asyncio
+async def test_request_without_transport(stick):
+    stick.transport = None
+    with pytest.raises(StickNotConnectedError):
+        await stick.ping()
+
+
+@pytest.mark.asyncio
+async def test_key_table_evicts_least_recently_heard(stick):
+    stick.key_slots = KeySlotManager(size=1)
+    stick.store_aes_key("b05c74720000021b", bytes(16))
+    stick.store_aes_key("b05c74720000021c", bytes(16))
+
+    assert stick.transport.written[-1][4] == 0
+    assert stick.key_slots.slot(bytes.fromhex("b05c74720000021c")) == 0
+    assert bytes.fromhex("b05c74720000021b") not in stick.key_slots
+
+    # the stick can't decrypt the telegram of the evicted device
+    stick.process_message(
+        IMSTFrame(b"\xa5\x01\x27\x0a\x44\xb0\x5c\x74\x72\x00\x00\x02\x1b\x7a")
+    )
+    assert stick.key_reloads == 1
+    assert stick.transport.written[-1][5:13] == bytes.fromhex("b05c74720000021b")
+    assert stick.key_slots.slot(bytes.fromhex("b05c74720000021b")) == 0
+
+    # no second reload while the first one is pending
+    stick.process_message(
+        IMSTFrame(b"\xa5\x01\x27\x0a\x44\xb0\x5c\x74\x72\x00\x00\x02\x1b\x7a")
+    )
+    assert stick.key_reloads == 1
+    stick.cancel_requests()
+
+
+def test_encode_config():
+    data = encode_config({"link_mode": 3, "auto_rssi_attachment": True})
+    assert data == b"\x02\x03\x10\x01"
+    assert decode_config(data) == {"link_mode": 3, "auto_rssi_attachment": True}
+    assert decode_config(b"\x18\xb3\x25\x78\x56\x34\x12") == {
+        "manufacturer_id": "25b3",
+        "device_id": "12345678",
+    }
+
+    with pytest.raises(ValueError):
+        encode_config({"baudrate": 1})
+
+
+@pytest.mark.asyncio
+async def test_configure_with_one_request(stick):
+    configured = stick.configure(
+        link_mode=3, auto_rssi_attachment=True, auto_timestamp_attachment=False
+    )
+    assert stick.transport.written == [b"\xa5\x01\x03\x06\x00\x02\x03\x30\x01\x00"]
+
+    stick.process_message(IMSTFrame(b"\xa5\x01\x04\x01\x00"))
+    assert await configured is True
+
+    # the cache is updated from the request, without loading the config
+    assert len(stick.transport.written) == 1
+    assert stick.link_mode == 3
+    assert stick.auto_rssi_attachment is True
+    assert stick.config.as_dict() == {
+        "link_mode": 3,
+        "auto_rssi_attachment": True,
+        "auto_timestamp_attachment": False,
+    }
+
+    # nothing to change
+    assert await stick.configure(link_mode=3) is True
+    assert len(stick.transport.written) == 1
+
+    stick.link_mode = "T2"
+    assert stick.transport.written[-1] == b"\xa5\x01\x03\x04\x00\x02\x04\x00"
+    stick.process_message(IMSTFrame(b"\xa5\x01\x04\x01\x01"))
+    await asyncio.sleep(0)
+    assert stick.link_mode == 3
+
+
+@pytest.mark.asyncio
+async def test_setters_before_the_response(stick):
+    stick.config.link_mode = 0
+    stick.link_mode = "T1"
+    stick.link_mode = "S1"
+    assert stick.transport.written == [
+        b"\xa5\x01\x03\x04\x00\x02\x03\x00",
+        b"\xa5\x01\x03\x04\x00\x02\x00\x00",
+    ]
+
+    # a third setter compares with the requests, that are not confirmed yet
+    stick.link_mode = "S1"
+    assert len(stick.transport.written) == 2
+
+    stick.process_message(IMSTFrame(b"\xa5\x01\x04\x01\x00"))
+    stick.process_message(IMSTFrame(b"\xa5\x01\x04\x01\x00"))
+    await asyncio.sleep(0)
+    assert stick.link_mode == 0
@@ -0,0 +1,41 @@
+from pywirelessmbus.sticks.key_slots import KeySlotManager
+
+KEY = bytes(16)
+
+
+def test_assign_free_slots():
+    slots = KeySlotManager(size=2)
+    assert slots.assign(b"a", KEY) == (0, None)
+    assert slots.assign(b"b", KEY) == (1, None)
+    assert slots.assign(b"a", KEY) == (0, None)
+    assert len(slots) == 2
+
+
+def test_evict_least_recently_heard():
+    slots = KeySlotManager(size=2)
+    slots.assign(b"a", KEY)
+    slots.assign(b"b", KEY)
+    assert slots.touch(b"a")
+
+    assert slots.assign(b"c", KEY) == (1, b"b")
+    assert b"b" not in slots
+    assert slots.key(b"b") == KEY
+    assert not slots.touch(b"b")
+    assert slots.evictions == 1
+
+
+def test_claim_and_release():
+    slots = KeySlotManager(size=3)
+    slots.assign(b"a", KEY)
+    slots.claim(0, b"b", KEY)
+    assert slots.owner(0) == b"b"
+    assert b"a" not in slots
+
+    slots.claim(1, b"c", KEY)
+    slots.release(b"b")
+    assert slots.assign(b"d", KEY) == (0, None)
+    assert slots.assign(b"e", KEY) == (2, None)
+
+    slots.clear()
+    assert len(slots) == 0
+    assert slots.key(b"c") == KEY
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from pywirelessmbus import WMbus
+from pywirelessmbus.sticks import IM871A_USB, MockStick
+from pywirelessmbus.sticks.im871a import MessageProtocol
+from pywirelessmbus.utils import IMSTMessage
+from pywirelessmbus.utils.metrics import Histogram, MetricsExporter, render_prometheus
+
+MOCK_MESSAGE = IMSTMessage(
+    endpoint_id=2,
+    message_id=b"\x03",
+    payload_length=15,
+    with_timestamp_field=False,
+    with_crc_field=False,
+    with_rssi_field=False,
+    payload=b"\x0f\x44\xff\xff\x12\xaa\xaa\xbb\x12\x13\x14\x15\x12\x13\x14\x15",
+)
+
+
+# same telegram from a manufacturer without a driver, decoded by GenericOMS
+UNKNOWN_MESSAGE = IMSTMessage(
+    endpoint_id=2,
+    message_id=b"\x03",
+    payload_length=15,
+    with_timestamp_field=False,
+    with_crc_field=False,
+    with_rssi_field=False,
+    payload=b"\x0f\x44\x2d\x2c\x12\xaa\xaa\xbb\x12\x13\x14\x15\x12\x13\x14\x15",
+)
+
+
+def test_histogram():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+
+    snapshot = histogram.snapshot()
+    assert snapshot["buckets"] == [(0.1, 2), (1.0, 3), (float("inf"), 4)]
+    assert snapshot["count"] == 4
+    assert snapshot["sum"] == pytest.approx(2.65)
+
+
+@pytest.mark.asyncio
+async def test_stick_stats():
+    stick = IM871A_USB(path="/dev/null")
+    stick.message_protocol = MessageProtocol(on_message=stick.process_message)
+    stick.message_protocol.data_received(b"\x00\xa5\x01\x02\x00\xa5\x01\x27\x00")
+    await asyncio.sleep(0)
+
+    stats = stick.stats()
+    assert stats["frames_received"] == 2
+    assert stats["bytes_received"] == 9
+    assert stats["dropped_bytes"] == 1
+    assert stats["aes_errors"] == 1
+    assert stats["decode_latency"]["count"] == 2
+
+
+def test_render_wmbus_stats():
+    wMbus = WMbus("IM871A_USB", stick=MockStick())
+    wMbus.process_radio_message(MOCK_MESSAGE)
+    wMbus.process_radio_message(MOCK_MESSAGE)
+    wMbus.process_radio_message(UNKNOWN_MESSAGE)
+    wMbus.process_radio_message(UNKNOWN_MESSAGE)
+
+    stats = wMbus.stats()
+    assert stats["telegrams"] == 4
+    assert stats["unknown_manufacturers"] == 2
+    assert stats["devices"] == {"ffff12aaaabb1213": 2, "2d2c12aaaabb1213": 2}
+    assert stats["callback_latency"]["count"] == 4
+
+    text = render_prometheus(stats)
+    assert "# TYPE pywirelessmbus_telegrams_total counter" in text
+    assert "pywirelessmbus_telegrams_total 4\n" in text
+    assert "pywirelessmbus_unknown_manufacturers_total 2\n" in text
+    assert 'pywirelessmbus_device_telegrams_total{device="ffff12aaaabb1213"} 2' in text
+    assert 'pywirelessmbus_callback_latency_seconds_bucket{le="+Inf"} 4' in text
+
+
+@pytest.mark.asyncio
+async def test_exporter():
+    wMbus = WMbus("IM871A_USB", stick=MockStick())
+    exporter = MetricsExporter(wMbus, port=0)
+    await exporter.start()
+
+    reader, writer = await asyncio.open_connection(exporter.host, exporter.port)
+    writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    response = await reader.read()
+    writer.close()
+    exporter.stop()
+
+    assert response.startswith(b"HTTP/1.1 200 OK")
+    assert b"pywirelessmbus_telegrams_total 0" in response
@@ -0,0 +1,177 @@
+import asyncio
+
+import pytest
+
+from pywirelessmbus import WMbus
+from pywirelessmbus.devices import Device, DriverRegistry
+from pywirelessmbus.sticks import MockStick
+from pywirelessmbus.sticks.emulator import GenericMeter, WeptechMeter
+from pywirelessmbus.utils import IMSTFrame, WMbusMessage
+from pywirelessmbus.utils.message import Value, ValueType
+from pywirelessmbus.utils.pipeline import DecodePipeline, SharedRing
+from pywirelessmbus.wmbus import MOCK
+
+
+class CountingMeter(Device):
+    """
+    Counts its telegrams from an offset, that is set in the main process. Fails on
+    telegrams with the access number 0.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.offset = 0
+        self.count = 0
+        super().__init__(*args, **kwargs)
+
+    def process_new_message(self, message: WMbusMessage):
+        if message.access_number == 0:
+            raise ValueError("broken telegram")
+
+        self.count += 1
+        message.values = [Value(self.offset + self.count, "", 0, ValueType.WATER)]
+        return message
+
+
+def radio_message(telegram: bytes) -> IMSTFrame:
+    return IMSTFrame(bytes([0xA5, 0x02, 0x03]) + telegram)
+
+
+def counting_telegram(access_number: int) -> bytes:
+    return bytes.fromhex("0f44ffff12aaaabb12137a") + bytes([access_number, 0, 0, 0])
+
+
+async def wait_for(received, count: int):
+    for _ in range(500):
+        if len(received) == count:
+            break
+        await asyncio.sleep(0.01)
+
+
+def test_ring_wraps_around():
+    ring = SharedRing(capacity=32)
+    try:
+        for number in range(10):
+            assert ring.write(bytes([number]) * 10, tag=b"x" * (number % 2))
+            assert ring.read(ring.write_position) == [
+                (b"x" * (number % 2), bytes([number]) * 10)
+            ]
+
+        assert ring.write(b"1" * 20)
+        assert not ring.write(b"2" * 10)
+        assert len(ring.read(ring.write_position)) == 1
+        assert ring.write(b"2" * 10)
+    finally:
+        ring.close(unlink=True)
+
+
+def test_ring_rejects_records_larger_than_the_ring():
+    ring = SharedRing(capacity=32)
+    try:
+        assert ring.fits(b"1" * 26)
+        assert not ring.fits(b"1" * 20, tag=b"x" * 7)
+        with pytest.raises(ValueError):
+            ring.write(b"1" * 27)
+    finally:
+        ring.close(unlink=True)
+
+
+@pytest.mark.asyncio
+async def test_drop_telegrams_larger_than_the_ring():
+    results = []
+    pipeline = DecodePipeline(results.extend, workers=1, capacity=256)
+    pipeline.start()
+    device = CountingMeter("ffff12aaaabb1213", index=0)
+    device.offset = 100
+    device.label = "x" * 300
+
+    pipeline.submit(device, counting_telegram(1), "large")
+    assert pipeline.dropped == 1
+    assert pipeline.pending == 0
+
+    device.label = ""
+    pipeline.submit(device, counting_telegram(2), "small")
+    pipeline.close()
+
+    assert [(context, values[0].value) for context, (values, _, _) in results] == [
+        ("small", 101)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_decode_in_worker_processes():
+    meters = [WeptechMeter(10000000 + number) for number in range(4)] + [
+        GenericMeter(20000000)
+    ]
+    telegrams = [meter.telegram() for _ in range(5) for meter in meters]
+
+    inline = []
+    wMbus = WMbus(
+        "IM871A_USB",
+        stick=MockStick(),
+        on_radio_message=lambda device, message: inline.append((device.id, message)),
+    )
+    for telegram in telegrams:
+        wMbus.process_radio_message(radio_message(telegram))
+
+    received = []
+    wMbus = WMbus(
+        "IM871A_USB",
+        stick=MockStick(),
+        decode_workers=2,
+        on_radio_message=lambda device, message: received.append((device, message)),
+    )
+    for telegram in telegrams[:10]:
+        wMbus.process_radio_message(radio_message(telegram))
+
+    await wait_for(received, 10)
+    assert len(received) == 10
+
+    # the rest is delivered on stop
+    for telegram in telegrams[10:]:
+        wMbus.process_radio_message(radio_message(telegram))
+    wMbus.stop()
+
+    # the order is kept per device, the shards run in parallel
+    def by_device(messages):
+        values = {}
+        for device_id, message in messages:
+            values.setdefault(device_id, []).append(
+                [(value.value, value.type) for value in message.values]
+            )
+        return values
+
+    assert by_device((device.id, message) for device, message in received) == by_device(
+        inline
+    )
+    assert received[-1][0].updated_at is not None
+    assert received[-1][0].last_values == received[-1][1].values
+    assert wMbus.telegrams == len(telegrams)
+
+
+@pytest.mark.asyncio
+async def test_worker_continues_with_the_device_of_the_main_process():
+    def register(device):
+        device.offset = 100
+
+    received = []
+    wMbus = WMbus(
+        "IM871A_USB",
+        stick=MockStick(),
+        decode_workers=1,
+        drivers=DriverRegistry(
+            drivers={(MOCK, None, None): CountingMeter}, entry_point_group=None
+        ),
+        on_device_registration=register,
+        on_radio_message=lambda device, message: received.append(message),
+    )
+    try:
+        # the first telegram of the device fails in the worker
+        wMbus.process_radio_message(radio_message(counting_telegram(0)))
+        for access_number in (1, 2):
+            wMbus.process_radio_message(radio_message(counting_telegram(access_number)))
+        await wait_for(received, 2)
+    finally:
+        wMbus.stop()
+
+    assert [message.values[0].value for message in received] == [101, 102]
+    assert next(iter(wMbus.devices.values())).count == 2
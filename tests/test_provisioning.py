@@ -0,0 +1,171 @@
+import argparse
+import asyncio
+import json
+
+import pytest
+
+from pywirelessmbus.sticks import IM871A_USB, provisioning
+from pywirelessmbus.sticks.emulator import StickEmulator
+from pywirelessmbus.sticks.im871a import DEVMGMT_MSG_SET_AES_DECKEY_REQ
+from pywirelessmbus.sticks.provisioning import load_key_file, main, provision_keys
+from pywirelessmbus.utils import IMSTFrame
+
+KEYS = {f"b05c7472000002{index:02x}": bytes([index] * 16) for index in range(10)}
+DEVICE_ID = "b05c74720000021b"
+KEY_RESPONSE_OK = b"\xa5\x01\x26\x01\x00"
+
+
+class FlakyEmulator(StickEmulator):
+    """
+    Rejects the first key of the given devices.
+    """
+
+    def __init__(self, flaky=(), **kwargs):
+        super().__init__(**kwargs)
+        self.flaky = {bytes.fromhex(device_id) for device_id in flaky}
+
+    def handle_request(self, endpoint_id: int, message_id: bytes, data: bytes):
+        if message_id == DEVMGMT_MSG_SET_AES_DECKEY_REQ and data[1:9] in self.flaky:
+            self.flaky.discard(data[1:9])
+            data = data[:9]
+        super().handle_request(endpoint_id, message_id, data)
+
+
+class FakeTransport:
+    def __init__(self):
+        self.written = []
+
+    def write(self, data: bytes):
+        self.written.append(data)
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_load_key_file(tmp_path):
+    csv_path = tmp_path / "keys.csv"
+    csv_path.write_text(
+        "device_id,key\n"
+        "# commissioned 2026-10\n"
+        "B05C74720000021B, 000102030405060708090a0b0c0d0e0f\n"
+        "\n"
+        "b05c74720000021c,ffffffffffffffffffffffffffffffff\n"
+    )
+    assert load_key_file(str(csv_path)) == {
+        "b05c74720000021b": bytes(range(16)),
+        "b05c74720000021c": b"\xff" * 16,
+    }
+
+    json_path = tmp_path / "keys.json"
+    json_path.write_text(json.dumps({"b05c74720000021b": "00" * 16}))
+    assert load_key_file(str(json_path)) == {"b05c74720000021b": bytes(16)}
+
+    json_path.write_text(
+        json.dumps([{"device_id": "b05c74720000021b", "key": "01" * 16}])
+    )
+    assert load_key_file(str(json_path)) == {"b05c74720000021b": b"\x01" * 16}
+
+    csv_path.write_text("b05c74720000021b,0001\n")
+    with pytest.raises(ValueError):
+        load_key_file(str(csv_path))
+
+    json_path.write_text(json.dumps([{"device_id": "b05c74720000021b"}]))
+    with pytest.raises(ValueError):
+        load_key_file(str(json_path))
+
+
+@pytest.mark.asyncio
+async def test_window_of_outstanding_requests():
+    stick = IM871A_USB(path="/dev/null", request_timeout=1)
+    stick.transport = FakeTransport()
+
+    provisioning = asyncio.ensure_future(provision_keys(stick, KEYS, window=3))
+    await settle()
+    assert len(stick.transport.written) == 3
+
+    # every response lets the next key go out
+    for sent in range(4, 11):
+        stick.process_message(IMSTFrame(KEY_RESPONSE_OK))
+        await settle()
+        assert len(stick.transport.written) == sent
+
+    for _ in range(3):
+        stick.process_message(IMSTFrame(KEY_RESPONSE_OK))
+    statuses = await provisioning
+    assert [status.device_id for status in statuses] == list(KEYS)
+    assert all(status.success and status.attempts == 1 for status in statuses)
+
+
+@pytest.mark.asyncio
+async def test_provision_with_retries():
+    flaky = ["b05c747200000203", "b05c747200000207"]
+    emulator = FlakyEmulator(flaky)
+    stick = IM871A_USB(path=emulator.start())
+    await stick.watch()
+
+    try:
+        statuses = await provision_keys(stick, KEYS, window=4)
+        assert all(status.success for status in statuses)
+        retried = {status.device_id for status in statuses if status.attempts == 2}
+        assert retried == set(flaky)
+        assert sorted(emulator.keys.values()) == sorted(
+            (bytes.fromhex(device_id), key) for device_id, key in KEYS.items()
+        )
+
+        # a device, that is rejected every time
+        emulator.flaky = {bytes.fromhex("b05c7472000002ff")}
+        [status] = await provision_keys(
+            stick, {"b05c7472000002ff": bytes(16)}, retries=0
+        )
+        assert status.success is False
+        assert status.attempts == 1
+        assert status.error == "rejected by the stick"
+    finally:
+        stick.pause_reading()
+        stick.stop_watch()
+        emulator.stop()
+
+
+def test_cli_reports_invalid_key_file(tmp_path, capsys):
+    key_path = tmp_path / "keys.csv"
+    key_path.write_text("b05c74720000021b\n")
+
+    with pytest.raises(SystemExit):
+        main(["/dev/null", str(key_path)])
+    assert "needs a device id and a key" in capsys.readouterr().err
+
+
+@pytest.mark.asyncio
+async def test_cli_closes_the_serial_port(monkeypatch):
+    sticks = []
+
+    def create_stick(*args, **kwargs):
+        sticks.append(IM871A_USB(*args, **kwargs))
+        return sticks[-1]
+
+    async def fail(*args, **kwargs):
+        raise RuntimeError("provisioning failed")
+
+    monkeypatch.setattr(provisioning, "IM871A_USB", create_stick)
+    emulator = StickEmulator()
+    arguments = argparse.Namespace(
+        path=emulator.start(),
+        baudrate=57600,
+        timeout=1.0,
+        snapshots=None,
+        window=4,
+        retries=0,
+    )
+    try:
+        [status] = await provisioning._provision(arguments, {DEVICE_ID: bytes(16)})
+        assert status.success
+        assert sticks[0].transport.is_closing()
+
+        monkeypatch.setattr(provisioning, "provision_keys", fail)
+        with pytest.raises(RuntimeError):
+            await provisioning._provision(arguments, {DEVICE_ID: bytes(16)})
+        assert sticks[1].transport.is_closing()
+    finally:
+        emulator.stop()
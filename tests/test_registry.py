@@ -0,0 +1,85 @@
+import subprocess
+import sys
+
+from pywirelessmbus.devices import (
+    DriverRegistry,
+    EnergyCam,
+    GenericOMS,
+    MockDevice,
+    WeptechOMSv2,
+)
+from pywirelessmbus.devices.registry import DRIVERS, manufacturer_id
+from pywirelessmbus.utils import IMSTMessage, WMbusMessage
+from pywirelessmbus.wmbus import FASTFORWARD, MOCK, WEPTECH
+
+
+def test_manufacturer_id():
+    assert manufacturer_id("WEP") == WEPTECH
+    assert manufacturer_id("ffd") == FASTFORWARD
+    assert manufacturer_id(MOCK) == MOCK
+
+
+def test_default_drivers():
+    assert DRIVERS.lookup(WEPTECH, 2, 0x1B) is WeptechOMSv2
+    assert DRIVERS.lookup(FASTFORWARD, 1, 0x02) is EnergyCam
+    assert DRIVERS.lookup(MOCK, 0x12, 0x13) is MockDevice
+    assert DRIVERS.lookup(manufacturer_id("KAM"), 1, 0x04) is GenericOMS
+
+
+def test_register_with_decorator():
+    registry = DriverRegistry(fallback=GenericOMS, entry_point_group=None)
+
+    @registry.register("KAM", 0x1B)
+    class Multical(MockDevice):
+        pass
+
+    @registry.register("KAM", 0x1B, 0x16)
+    class MulticalWater(MockDevice):
+        pass
+
+    assert registry.lookup(manufacturer_id("KAM"), 0x1B, 0x04) is Multical
+    assert registry.lookup(manufacturer_id("KAM"), 0x1B, 0x16) is MulticalWater
+    assert registry.lookup(manufacturer_id("KAM"), 0x1C, 0x04) is GenericOMS
+
+
+def test_lazy_import():
+    registry = DriverRegistry(
+        drivers={(b"\x01\x02", 1, None): "json.decoder:JSONDecoder"},
+        entry_point_group=None,
+    )
+    sys.modules.pop("xml.dom.minidom", None)
+    registry.register(b"\x03\x04", 1, driver="xml.dom.minidom:Node")
+
+    assert "xml.dom.minidom" not in sys.modules
+    assert registry.lookup(b"\x01\x02", 1, 0).__name__ == "JSONDecoder"
+    assert "xml.dom.minidom" not in sys.modules
+    assert registry.lookup(b"\x05\x06", 1, 0) is None
+
+
+def test_package_does_not_import_drivers():
+    code = (
+        "import sys, pywirelessmbus; "
+        "print(any(name.startswith('pywirelessmbus.devices.') and "
+        "name.split('.')[-1] in ('energy_cam', 'weptech_oms', 'generic') "
+        "for name in sys.modules))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert output.stdout.strip() == "False"
+
+
+def test_create_device_from_message():
+    raw_message = IMSTMessage(
+        endpoint_id=2,
+        message_id=b"\x03",
+        payload_length=15,
+        with_timestamp_field=False,
+        with_crc_field=False,
+        with_rssi_field=False,
+        payload=b"\x0f\x44\xc4\x18\x01\x02\x03\x04\x01\x07\x7a\x00\x00\x00\x00\x00",
+    )
+    device = EnergyCam.from_message("device_id", WMbusMessage(raw_message), index=3)
+
+    assert device.meter_type == 7
+    assert device.index == 3
@@ -0,0 +1,143 @@
+import asyncio
+
+import pytest
+
+from pywirelessmbus.sticks import IM871A_USB, StickSnapshots
+from pywirelessmbus.sticks.emulator import StickEmulator
+
+DEVICE_ID = "b05c74720000021b"
+
+
+class SilentEmulator(StickEmulator):
+    """
+    Doesn't answer requests while silent is set.
+    """
+
+    silent = True
+
+    def handle_request(self, endpoint_id: int, message_id: bytes, data: bytes):
+        if not self.silent:
+            super().handle_request(endpoint_id, message_id, data)
+
+
+@pytest.fixture
+def emulator():
+    emulator = StickEmulator()
+    yield emulator
+    emulator.stop()
+
+
+async def start_stick(path: str, snapshot_path, desired_config) -> IM871A_USB:
+    stick = IM871A_USB(
+        path=path,
+        snapshots=StickSnapshots(snapshot_path),
+        desired_config=desired_config,
+    )
+    await stick.watch()
+    return stick
+
+
+def stop_stick(stick: IM871A_USB):
+    stick.pause_reading()
+    stick.stop_watch()
+
+
+@pytest.mark.asyncio
+async def test_snapshot_skips_setup(emulator, tmp_path):
+    path = emulator.start()
+    snapshot_path = tmp_path / "sticks.json"
+
+    # first start: device info, config and one write for the drift
+    stick = await start_stick(path, snapshot_path, {"link_mode": 5})
+    assert emulator.requests == 3
+    assert emulator.config["link_mode"] == b"\x05"
+    assert await stick.store_aes_key(DEVICE_ID, bytes(16)) is True
+    stop_stick(stick)
+    assert b"\x00" * 16 not in snapshot_path.read_bytes()
+
+    # second start: only the device info
+    stick = await start_stick(path, snapshot_path, {"link_mode": 5})
+    assert emulator.requests == 5
+    assert stick.link_mode == 5
+    assert stick.config.radio_channel == 11
+    assert stick.key_slots.slot(bytes.fromhex(DEVICE_ID)) == 0
+
+    # the key is loaded already, a new key is written
+    assert await stick.store_aes_key(DEVICE_ID, bytes(16)) is True
+    assert emulator.requests == 5
+    assert await stick.store_aes_key(DEVICE_ID, b"\x01" * 16) is True
+    assert emulator.requests == 6
+    assert emulator.keys[0][1] == b"\x01" * 16
+    stop_stick(stick)
+
+    # drift is fixed with one write
+    stick = await start_stick(
+        path, snapshot_path, {"link_mode": 6, "auto_timestamp_attachment": True}
+    )
+    assert emulator.requests == 8
+    assert emulator.config["link_mode"] == b"\x06"
+    assert emulator.config["auto_timestamp_attachment"] == b"\x01"
+    stop_stick(stick)
+
+    snapshots = StickSnapshots(snapshot_path)
+    snapshot = snapshots.get("12345678")
+    assert snapshot.config.link_mode == 6
+    assert snapshot.key_table == {0: (DEVICE_ID, snapshot.key_table[0][1])}
+
+
+def test_invalid_snapshot_file(tmp_path):
+    snapshot_path = tmp_path / "sticks.json"
+    snapshot_path.write_text("{")
+    assert len(StickSnapshots(snapshot_path)) == 0
+
+
+@pytest.mark.asyncio
+async def test_snapshot_keeps_only_stored_configuration(emulator, tmp_path):
+    path = emulator.start()
+    snapshot_path = tmp_path / "sticks.json"
+
+    stick = await start_stick(path, snapshot_path, {"link_mode": 5})
+    assert await stick.configure(link_mode=3, auto_rssi_attachment=True) is True
+    assert stick.link_mode == 3
+    stop_stick(stick)
+    assert StickSnapshots(snapshot_path).get("12345678").config.link_mode == 5
+
+    # the stick loses the fields, that weren't stored
+    emulator.power_cycle()
+    stick = await start_stick(path, snapshot_path, {"link_mode": 3})
+    assert emulator.config["link_mode"] == b"\x03"
+
+    # a reset loads the stored configuration
+    assert await stick.configure(link_mode=5) is True
+    assert await stick.reset() is True
+    assert stick.link_mode == 3
+    assert emulator.config["link_mode"] == b"\x03"
+    stop_stick(stick)
+
+
+@pytest.mark.asyncio
+async def test_synchronize_after_missing_answer(tmp_path):
+    emulator = SilentEmulator()
+    stick = IM871A_USB(
+        path=emulator.start(),
+        request_timeout=0.05,
+        snapshots=StickSnapshots(tmp_path / "sticks.json"),
+        desired_config={"link_mode": 5},
+    )
+    try:
+        await stick.watch()
+        assert stick.info is None
+
+        # the unanswered request gets no late response
+        emulator.silent = False
+        await asyncio.sleep(0.1)
+        assert await stick.ping() is True
+        for _ in range(100):
+            if emulator.config["link_mode"] == b"\x05":
+                break
+            await asyncio.sleep(0.01)
+        assert emulator.config["link_mode"] == b"\x05"
+        assert stick.info.device_id == "12345678"
+    finally:
+        stop_stick(stick)
+        emulator.stop()
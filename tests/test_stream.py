@@ -0,0 +1,88 @@
+import asyncio
+from dataclasses import dataclass
+
+import pytest
+
+from pywirelessmbus.utils.stream import MessageStream, OverflowPolicy
+
+
+@dataclass
+class Device:
+    id: str
+
+
+A = Device("a")
+B = Device("b")
+
+
+def test_drop_oldest():
+    stream = MessageStream(maxsize=2, policy=OverflowPolicy.DROP_OLDEST)
+    for number in range(4):
+        stream.put(A, number)
+
+    assert stream.depth == 2
+    assert stream.dropped == 2
+    assert stream.get_nowait() == (A, 2)
+    assert stream.get_nowait() == (A, 3)
+
+
+def test_drop_newest():
+    stream = MessageStream(maxsize=2, policy=OverflowPolicy.DROP_NEWEST)
+    for number in range(4):
+        stream.put(A, number)
+
+    assert stream.dropped == 2
+    assert stream.get_nowait() == (A, 0)
+    assert stream.get_nowait() == (A, 1)
+
+
+def test_latest_per_device():
+    stream = MessageStream(maxsize=2, policy=OverflowPolicy.LATEST_PER_DEVICE)
+    stream.put(A, 1)
+    stream.put(B, 1)
+    stream.put(A, 2)
+
+    assert stream.depth == 2
+    assert stream.dropped == 1
+    assert stream.get_nowait() == (A, 2)
+    assert stream.get_nowait() == (B, 1)
+
+
+def test_block_signals_full_and_drain():
+    events = []
+    stream = MessageStream(
+        maxsize=4,
+        on_full=lambda _: events.append("full"),
+        on_drain=lambda _: events.append("drain"),
+    )
+    for number in range(5):
+        stream.put(A, number)
+
+    assert events == ["full"]
+    assert stream.depth == 5
+    assert stream.dropped == 0
+
+    for _ in range(3):
+        stream.get_nowait()
+    assert events == ["full", "drain"]
+    assert stream.max_depth == 5
+
+
+@pytest.mark.asyncio
+async def test_async_iteration_ends_on_close():
+    stream = MessageStream()
+    received = []
+
+    async def consume():
+        async for device, message in stream:
+            received.append(message)
+
+    consumer = asyncio.ensure_future(consume())
+    stream.put(A, 1)
+    await asyncio.sleep(0)
+    stream.put(A, 2)
+    stream.close()
+    await asyncio.wait_for(consumer, 1)
+
+    assert received == [1, 2]
+    assert stream.delivered == 2
@@ -1,4 +1,5 @@
-from pywirelessmbus import WMbus
+from pywirelessmbus import DedupCache, WMbus
+import asyncio
 import pty
 import pytest
 import os
@@ -95,3 +96,125 @@ def test_process_radio_message(virtual_serial):
     assert context.message.serial_number == b"\xff\x12\xaa\xaa\xbb"
     assert context.message.status == 18
     assert context.message.version == b"\x12"
+
+
+def test_message_stream(virtual_serial):
+    master, slave = virtual_serial
+    wMbus = WMbus("IM871A_USB", path=os.ttyname(slave), stick=MockStick())
+    stream = wMbus.messages(maxsize=1)
+
+    message = IMSTMessage(
+        endpoint_id=0,
+        message_id=0,
+        payload_length=4,
+        with_timestamp_field=False,
+        with_crc_field=False,
+        with_rssi_field=False,
+        payload=b"\x12\x44\xff\xff\x12\xaa\xaa\xbb\x12\x13\x14\x15\x12\x13\x14\x15",
+    )
+    wMbus.process_radio_message(message)
+    wMbus.process_radio_message(message)
+
+    assert stream.depth == 2
+    assert stream.full
+    device, received = stream.get_nowait()
+    assert device.id == "ffff12aaaabb1213"
+    assert received.access_number == 21
+
+    wMbus.stop()
+    assert stream.closed
+
+
+@pytest.mark.asyncio
+async def test_deduplicate_between_sticks(virtual_serial):
+    master, slave = virtual_serial
+    context = Context()
+    first_stick, second_stick = MockStick(), MockStick()
+    wMbus = WMbus(
+        "IM871A_USB",
+        path=os.ttyname(slave),
+        on_radio_message=context.handle_message,
+        sticks=[first_stick, second_stick],
+        stick=first_stick,
+        dedup_window=0.01,
+    )
+
+    payload = b"\x12\x44\xff\xff\x12\xaa\xaa\xbb\x12\x13\x14\x15\x12\x13\x14\x15"
+    for stick, rssi in ((first_stick, 80), (second_stick, 120), (first_stick, 90)):
+        message = IMSTMessage(
+            endpoint_id=2,
+            message_id=b"\x03",
+            payload_length=16,
+            with_timestamp_field=False,
+            with_crc_field=False,
+            with_rssi_field=True,
+            payload=payload,
+            rssi=rssi,
+        )
+        wMbus._handle_stick_message(stick, message)
+
+    assert context.message is None
+    assert [copy.rssi for copy in wMbus._pending_copies.values()] == [120]
+    await asyncio.sleep(0.05)
+
+    assert context.message is not None
+    assert wMbus.duplicates == 2
+    assert len(wMbus.devices) == 1
+
+
+def test_drop_repeated_telegrams(virtual_serial):
+    master, slave = virtual_serial
+    received = []
+    wMbus = WMbus(
+        "IM871A_USB",
+        path=os.ttyname(slave),
+        on_radio_message=lambda device, message: received.append(message.access_number),
+        stick=MockStick(),
+        dedup_cache=DedupCache(ttl=60),
+    )
+
+    payload = b"\x12\x44\xff\xff\x12\xaa\xaa\xbb\x12\x13\x14\x15\x12\x13\x14\x15"
+    for access_number in (21, 21, 22):
+        message = IMSTMessage(
+            endpoint_id=2,
+            message_id=b"\x03",
+            payload_length=16,
+            with_timestamp_field=False,
+            with_crc_field=False,
+            with_rssi_field=False,
+            payload=payload[:11] + bytes([access_number]) + payload[12:],
+        )
+        wMbus.process_radio_message(message)
+
+    assert received == [21, 22]
+    assert wMbus.dedup_cache.hits == 1
+    assert wMbus.dedup_cache.misses == 2
+
+
+def test_drop_short_telegrams(virtual_serial):
+    master, slave = virtual_serial
+    received = []
+    wMbus = WMbus(
+        "IM871A_USB",
+        path=os.ttyname(slave),
+        on_radio_message=lambda device, message: received.append(message),
+        stick=MockStick(),
+        dedup_cache=DedupCache(ttl=60),
+    )
+
+    payload = b"\x12\x44\xff\xff\x12\xaa\xaa\xbb\x12\x13\x14\x15\x12\x13\x14\x15"
+    for length in (3, 9, 11, 16):
+        message = IMSTMessage(
+            endpoint_id=2,
+            message_id=b"\x03",
+            payload_length=length,
+            with_timestamp_field=False,
+            with_crc_field=False,
+            with_rssi_field=False,
+            payload=payload[:length],
+        )
+        wMbus.process_radio_message(message)
+
+    assert len(received) == 1
+    assert wMbus.short_telegrams == 3
+    assert wMbus.stats()["short_telegrams"] == 3